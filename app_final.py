@@ -6,14 +6,33 @@ Final version with tooltips, LLM-generated insights, and professional UX
 
 import streamlit as st
 import json
+import time
 import joblib
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import shap
 import plotly.express as px
+import plotly.graph_objects as go
 from pathlib import Path
 
+from shap_views import prepare_beeswarm, BEESWARM_COLORSCALE
+from figures import render_time_ms
+from case_index import (
+    CaseIndex, load_case_index, build_case_index, SORTABLE_COLUMNS,
+    CONFIDENCE_LEVELS, ACTIONS, PRIORITIES, OUTCOMES
+)
+from segments import SegmentEngine
+from neighbors import build_neighbor_indexes, load_neighbor_indexes
+from archetypes import load_archetypes, assign as assign_archetype
+from importance import load_global_importance
+from model_registry import HotSwapLoader
+from app_metrics import MetricsStore, RerunTimer, metrics_enabled, new_session_id, TOTAL
+from ensemble import load_ensemble_scores
+from distill import WHAT_IF_RANGES, PREVIEW_MAX_DELTA_ERROR, preview_by_default
+from waterfall_cache import WaterfallCache, waterfall_key, render_waterfall_png, waterfall_figure
+from threshold_curve import (
+    load_threshold_curve, metrics_at, bucket_counts, profit_curve, BUCKET_LABELS
+)
+
 # ============================================================
 # FEATURE TRANSLATIONS TO BUSINESS LANGUAGE
 # ============================================================
@@ -644,48 +663,56 @@ def clamp_value(value, min_value, max_value):
 # LOAD DATA
 # ============================================================
 @st.cache_resource
-def load_model():
-    """Load trained XGBoost model"""
-    return joblib.load("output/model.pkl")
+def get_model_loader():
+    """Process-wide loader over output/registry (output/ when there is no registry)"""
+    return HotSwapLoader()
 
 @st.cache_resource
-def load_explainer():
-    """Load SHAP explainer"""
-    return joblib.load("output/explainer.pkl")
+def get_metrics_store():
+    """Process-wide rolling latency windows, shared by every session (APP_METRICS=1)"""
+    return MetricsStore()
 
-@st.cache_data
-def load_test_data():
+# Data loaders take the served model version as a cache argument and read the
+# files published with that version, so a hot swap never mixes two models' data
+
+@st.cache_data(max_entries=2)
+def load_test_data(version):
     """Load test data"""
-    X_test = joblib.load("output/X_test.pkl")
-    y_test = joblib.load("output/y_test.pkl")
+    X_test = joblib.load(bundle.artifact("X_test.pkl"))
+    y_test = joblib.load(bundle.artifact("y_test.pkl"))
     return X_test, y_test
 
-@st.cache_data
-def load_shap_values():
+@st.cache_data(max_entries=2)
+def load_shap_values(version):
     """Load pre-computed SHAP values"""
-    return joblib.load("output/shap_values.pkl")
+    return joblib.load(bundle.artifact("shap_values.pkl"))
 
-@st.cache_data
-def load_global_insights():
+@st.cache_data(max_entries=2)
+def load_global_insights(version):
     """Load global insights JSON"""
-    with open("output/json/global_insights.json") as f:
+    with open(bundle.artifact("global_insights.json")) as f:
         return json.load(f)
 
-@st.cache_data
-def load_feature_names():
-    """Load feature names"""
-    return joblib.load("output/feature_names.pkl")
-
-@st.cache_data
-def load_threshold():
-    """Load optimal threshold"""
-    with open("output/threshold.txt") as f:
-        return float(f.read().strip())
+@st.cache_data(max_entries=2)
+def load_ensemble_view(version):
+    """Per-case ensemble mean / spread / agreement, or None if the ensemble was not trained"""
+    path = bundle.artifact("ensemble_scores.parquet")
+    if path is None:
+        return None
+    return load_ensemble_scores(path)
+
+@st.cache_data(max_entries=2)
+def load_threshold_explorer_data(version):
+    """Load sorted probabilities with cumulative TP/FP counts"""
+    path = bundle.artifact("threshold_curve.npz")
+    if path is None:
+        return None
+    return load_threshold_curve(path)
 
 def load_case_json(case_id):
-    """Load individual case analysis"""
-    json_path = Path(f"output/json/{case_id}.json")
-    if json_path.exists():
+    """Load individual case analysis of the served model version"""
+    json_path = bundle.case_json_path(case_id)
+    if json_path is not None:
         with open(json_path) as f:
             return json.load(f)
     return None
@@ -698,15 +725,22 @@ def summarize_shap(values, names, top_k=3):
     negatives = [(translate_feature(f), v) for f, v in sorted_pairs if v < 0][:top_k]
     return positives, negatives
 
+# Per-rerun section timings; a no-op unless APP_METRICS=1
+if "metrics_session" not in st.session_state:
+    st.session_state["metrics_session"] = new_session_id()
+rerun = RerunTimer(get_metrics_store() if metrics_enabled() else None, st.session_state["metrics_session"])
+rerun.mark("load model & data")
+
 # Load all data
 try:
-    model = load_model()
-    explainer = load_explainer()
-    X_test, y_test = load_test_data()
-    shap_values = load_shap_values()
-    global_insights = load_global_insights()
-    feature_names = load_feature_names()
-    threshold = load_threshold()
+    # One bundle per run: a version published mid-run is picked up on the next rerun
+    model_loader = get_model_loader()
+    bundle = model_loader.current()
+    model, explainer, scorer = bundle.model, bundle.explainer, bundle.scorer
+    feature_names, threshold, model_version = bundle.feature_names, bundle.threshold, bundle.version
+    X_test, y_test = load_test_data(model_version)
+    shap_values = load_shap_values(model_version)
+    global_insights = load_global_insights(model_version)
 except Exception as e:
     st.error(f"❌ Error loading data: {e}")
     st.info("ℹ️ Make sure the `output/` folder is in the same directory as this script.")
@@ -717,33 +751,231 @@ except Exception as e:
 # ============================================================
 def get_prediction(row):
     """Get model prediction for a single row"""
-    prob = model.predict_proba([row])[0][1]
+    prob = scorer.predict_proba(np.asarray([row], dtype=np.float32))[0][1]
     pred = int(prob >= threshold)
     return prob, pred
 
-def plot_shap_waterfall(shap_row, row, base_value):
-    """Create SHAP waterfall plot with translated names"""
-    fig, ax = plt.subplots(figsize=(10, 6))
-    shap.plots.waterfall(
-        shap.Explanation(
-            values=shap_row,
-            base_values=base_value,
-            data=row.values,
-            feature_names=[translate_feature(f) for f in feature_names]
+def load_surrogate():
+    """Compact distilled model of the served version as (booster, NumPy trees, report), or None"""
+    return bundle.surrogate
+
+def preview_prediction(row, original_row, original_prob):
+    """Full-model probability of the original row shifted by the surrogate's log-odds change"""
+    _, trees, _ = load_surrogate()
+    margins = trees.predict_margin(np.asarray([original_row, row], dtype=np.float32))
+    p = min(max(original_prob, 1e-6), 1 - 1e-6)
+    prob = float(1 / (1 + np.exp(-(np.log(p / (1 - p)) + margins[1] - margins[0]))))
+    return prob, int(prob >= threshold)
+
+def surrogate_shap(row):
+    """Exact TreeSHAP of the surrogate for one row: (values, base value)"""
+    import xgboost as xgb
+    booster = load_surrogate()[0].get_booster()
+    data = xgb.DMatrix(np.asarray([row], dtype=np.float32), feature_names=booster.feature_names)
+    contribs = booster.predict(data, pred_contribs=True)[0]
+    return contribs[:-1], float(contribs[-1])
+
+@st.cache_resource
+def get_waterfall_cache():
+    """Process-wide LRU cache of rendered waterfall charts"""
+    return WaterfallCache(max_entries=256, max_bytes=64 * 1024 * 1024)
+
+def plot_shap_waterfall(shap_row, row, base_value, cache_key, interactive=False):
+    """SHAP waterfall with translated names; static PNGs are served from the LRU cache"""
+    display_names = [translate_feature(f) for f in feature_names]
+    if interactive:
+        fig = waterfall_figure(shap_row, base_value, row.values, display_names)
+        st.plotly_chart(fig, width="stretch")
+        return
+    png = get_waterfall_cache().get_or_render(
+        cache_key,
+        lambda: render_waterfall_png(shap_row, base_value, row.values, display_names, dpi=120)
+    )
+    st.image(png, width="stretch")
+
+@st.cache_data(max_entries=2)
+def load_test_probabilities(version):
+    """Win probabilities of the whole test set (scored once per model version)"""
+    return model.predict_proba(X_test)[:, 1]
+
+@st.cache_resource(max_entries=2)
+def load_case_index_view(version):
+    """Case index for Portfolio and Case Explorer (rebuilt in memory for older outputs)"""
+    path = bundle.artifact("case_index.parquet")
+    if path is not None:
+        return CaseIndex(load_case_index(path))
+    return CaseIndex(build_case_index(
+        X_test.index, load_test_probabilities(version), y_test, shap_values, feature_names, threshold
+    ))
+
+@st.cache_data(max_entries=2)
+def load_sorted_case_ids(version):
+    """Opportunity IDs for the Case Explorer selector"""
+    return np.sort(load_case_index_view(version).ids()).tolist()
+
+@st.cache_resource(max_entries=2)
+def load_segment_engine(version):
+    """Segment query engine over the test SHAP matrix (results memoized inside)"""
+    return SegmentEngine(X_test, shap_values, y_test, load_test_probabilities(version), threshold)
+
+def segment_filters(prefix):
+    """Filter widgets for one segment; returns its predicate list"""
+    predicates = []
+    col1, col2 = st.columns(2)
+    with col1:
+        region = st.selectbox("Region", ["Any", "Iberia", "Outside Iberia"], key=f"{prefix}_region")
+        if region != "Any":
+            predicates.append(("cust_in_iberia", "==", 1 if region == "Iberia" else 0))
+        competition = st.selectbox("Competition", ["Any", "With competitors", "No competitors"], key=f"{prefix}_competition")
+        if competition != "Any":
+            predicates.append(("has_competition", "==", 1 if competition == "With competitors" else 0))
+    with col2:
+        buckets = st.multiselect("Probability Bucket", BUCKET_LABELS, key=f"{prefix}_buckets")
+        if buckets:
+            predicates.append(("probability_bucket", "in", buckets))
+        # opp_month is scaled in the dataset; its sorted distinct values are the months in order
+        months = np.unique(X_test["opp_month"].to_numpy())
+        selected_months = st.multiselect(
+            "Opportunity Month",
+            list(range(len(months))),
+            format_func=lambda i: f"Month {i + 1}",
+            key=f"{prefix}_months"
+        )
+        if selected_months:
+            predicates.append(("opp_month", "in", months[selected_months].tolist()))
+
+    custom_feature = st.selectbox(
+        "Additional feature filter",
+        [None] + feature_names,
+        format_func=lambda f: "None" if f is None else translate_feature(f),
+        key=f"{prefix}_feature"
+    )
+    if custom_feature is not None:
+        low, high = float(X_test[custom_feature].min()), float(X_test[custom_feature].max())
+        if high > low:
+            value_range = st.slider(
+                f"{translate_feature(custom_feature)} range", low, high, (low, high), key=f"{prefix}_range_{custom_feature}"
+            )
+            predicates.append((custom_feature, "between", value_range))
+    return predicates
+
+@st.cache_resource(max_entries=2)
+def load_similarity_indexes(version):
+    """Feature- and SHAP-space neighbour indexes (built in memory for older outputs)"""
+    path = bundle.artifact("neighbors.pkl")
+    if path is not None:
+        return load_neighbor_indexes(path)
+    return build_neighbor_indexes(X_test, shap_values)
+
+@st.cache_data(max_entries=2)
+def load_importance_data(version):
+    """Gain / mean |SHAP| / permutation importance table, or (None, None) if not generated"""
+    path = bundle.artifact("importance.json")
+    if path is None:
+        return None, None
+    return load_global_importance(path)
+
+@st.cache_data(max_entries=2)
+def load_archetype_data(version):
+    """Explanation archetypes from the pipeline, or None if not generated"""
+    path = bundle.artifact("archetypes.json")
+    if path is None:
+        return None
+    return load_archetypes(path)
+
+# Segments offered in the interactive beeswarm
+BEESWARM_SEGMENTS = {
+    "All opportunities": lambda X, prob: np.ones(len(X), dtype=bool),
+    "Customers in Iberia": lambda X, prob: X["cust_in_iberia"].values > 0,
+    "Customers outside Iberia": lambda X, prob: X["cust_in_iberia"].values <= 0,
+    "With competition": lambda X, prob: X["total_competitors"].values > 0,
+    "No competition": lambda X, prob: X["total_competitors"].values <= 0,
+    "Predicted wins": lambda X, prob: prob >= threshold,
+    "Predicted losses": lambda X, prob: prob < threshold,
+}
+
+@st.cache_data(show_spinner=False)
+def prepare_segment_beeswarm(segment, max_points_per_feature, version):
+    """Downsampled beeswarm point set for one segment (cached per segment and model version)"""
+    mask = BEESWARM_SEGMENTS[segment](X_test, load_test_probabilities(version))
+    return prepare_beeswarm(
+        shap_values, X_test[feature_names].values, feature_names,
+        mask=mask, max_points_per_feature=max_points_per_feature
+    )
+
+def build_beeswarm_figure(swarm):
+    """Interactive (WebGL) beeswarm from a prepared point set, one trace per feature"""
+    X_values = X_test[feature_names].values
+    fig = go.Figure()
+    for position, feat in enumerate(swarm["feature_order"]):
+        sel = swarm["feature"] == feature_names.index(feat)
+        rows = swarm["row"][sel]
+        fig.add_trace(go.Scattergl(
+            x=swarm["x"][sel],
+            y=swarm["y"][sel],
+            mode="markers",
+            name=translate_feature(feat),
+            marker=dict(
+                size=4,
+                color=swarm["color"][sel],
+                colorscale=BEESWARM_COLORSCALE,
+                cmin=0,
+                cmax=1,
+                showscale=position == 0,
+                colorbar=dict(title="Feature value", tickvals=[0, 1], ticktext=["Low", "High"], thickness=12)
+            ),
+            customdata=np.column_stack([
+                X_test.index.values[rows], X_values[rows, feature_names.index(feat)]
+            ]).astype(np.float32),
+            hovertemplate=(
+                f"<b>{translate_feature(feat)}</b><br>SHAP: %{{x:.3f}}<br>"
+                "Value: %{customdata[1]:.3f}<br>Opportunity %{customdata[0]:.0f}<extra></extra>"
+            )
+        ))
+    fig.add_vline(x=0, line_color="#888888", line_width=1)
+    fig.update_layout(
+        height=max(420, 28 * len(swarm["feature_order"])),
+        showlegend=False,
+        xaxis_title="SHAP value (impact on model output)",
+        yaxis=dict(
+            tickvals=list(range(len(swarm["feature_order"]))),
+            ticktext=[translate_feature(f) for f in swarm["feature_order"]],
+            showgrid=False
         ),
-        show=False
+        margin=dict(l=10, r=10, t=10, b=10)
     )
-    st.pyplot(fig)
-    plt.close()
+    return fig
+
+@st.cache_resource(max_entries=8, show_spinner=False)
+def load_segment_beeswarm_figure(segment, max_points_per_feature, version):
+    """Beeswarm figure and its JSON payload in KB, built once per segment, point budget and model version"""
+    fig = build_beeswarm_figure(prepare_segment_beeswarm(segment, max_points_per_feature, version))
+    return fig, len(fig.to_json()) / 1024
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def png_timings(path, mtime_ns):
+    """Render time recorded by figures.py (None if unknown) and decode time of a static PNG, in ms"""
+    from PIL import Image
+    start = time.perf_counter()
+    with Image.open(path) as image:
+        image.load()
+    return render_time_ms(path), (time.perf_counter() - start) * 1000
 
 # ============================================================
 # SIDEBAR
 # ============================================================
+rerun.mark("sidebar")
+pages = ["Global Insights", "Portfolio", "Segment Analytics", "Archetypes", "Case Explorer", "What-If Simulator", "Threshold Explorer"]
+# Hidden page: only listed when the URL has ?diagnostics=1
+if st.query_params.get("diagnostics") == "1":
+    pages.append("Diagnostics")
 st.sidebar.markdown("## Navigation")
 page = st.sidebar.radio(
     "Select Page",
-    ["Global Insights", "Case Explorer", "What-If Simulator"]
+    pages,
+    key="page"
 )
+rerun.set_page(page)
 
 st.sidebar.markdown("---")
 st.sidebar.markdown("### Model Performance")
@@ -764,11 +996,17 @@ st.sidebar.metric(
     f"{perf['threshold']:.3f}",
     help=get_metric_help("threshold")
 )
+st.sidebar.caption(f"Serving model `{model_version}`")
+if model_loader.warming:
+    st.sidebar.caption(f"⏳ Loading `{model_loader.warming}`; it takes over on the next interaction")
+for failed_version, error in model_loader.failed.items():
+    st.sidebar.caption(f"⚠️ Could not load `{failed_version}`: {error}")
 
 # ============================================================
 # PAGE 1: GLOBAL INSIGHTS
 # ============================================================
 if page == "Global Insights":
+    rerun.mark("performance metrics")
     st.markdown('<div class="main-header">Global Model Insights</div>', unsafe_allow_html=True)
     st.markdown("**Comprehensive overview of model performance and key patterns across all opportunities**")
 
@@ -798,7 +1036,40 @@ if page == "Global Insights":
         help=get_metric_help("recall")
     )
 
+    # Bootstrap confidence intervals (if the pipeline computed them)
+    perf_ci = global_insights.get("model_performance_ci")
+    if perf_ci:
+        ci = perf_ci["metrics"]
+        level = f"{perf_ci['confidence']:.0%}"
+        for col, key in zip((col1, col2, col3, col4), ("f1_score", "auc", "precision", "recall")):
+            col.caption(f"{level} CI: {ci[key]['low']:.3f} – {ci[key]['high']:.3f}")
+
+        with st.expander("How certain are these numbers?"):
+            st.markdown(f"""
+                <div class="chart-description">
+                The metrics above come from a single test set. To measure how much they could vary,
+                the test set was resampled <strong>{perf_ci['n_bootstrap']:,} times</strong> (bootstrap) and every
+                metric was recomputed at the same threshold ({perf_ci['threshold']:.3f}).
+                The range covers {level} of those replicates.
+                </div>
+                """, unsafe_allow_html=True)
+            ci_df = pd.DataFrame([
+                {
+                    "Metric": label,
+                    "Estimate": perf[key],
+                    f"{level} CI low": ci[key]["low"],
+                    f"{level} CI high": ci[key]["high"],
+                    "Std. error": ci[key]["std"]
+                }
+                for key, label in [
+                    ("f1_score", "F1 Score"), ("auc", "AUC"), ("precision", "Precision"),
+                    ("recall", "Recall"), ("accuracy", "Accuracy")
+                ]
+            ])
+            st.dataframe(ci_df.style.format(precision=3), hide_index=True, width="stretch")
+
     # Prediction distribution
+    rerun.mark("prediction distribution")
     st.markdown('<div class="sub-header">Prediction Distribution</div>', unsafe_allow_html=True)
 
     st.markdown("""
@@ -868,6 +1139,7 @@ if page == "Global Insights":
         st.plotly_chart(fig_buckets, width="stretch")
 
     # Feature importance
+    rerun.mark("top features")
     st.markdown('<div class="sub-header">Top Influential Features</div>', unsafe_allow_html=True)
 
     st.markdown("""
@@ -906,19 +1178,138 @@ if page == "Global Insights":
     )
     st.plotly_chart(fig_feat, width="stretch")
 
-    # SHAP summary (static image)
+    rerun.mark("importance comparison")
+    importance_table, permutation_info = load_importance_data(model_version)
+    if importance_table is not None:
+        st.markdown('<div class="sub-header">Three Ways to Measure Importance</div>', unsafe_allow_html=True)
+        st.markdown("""
+        <div class="chart-description">
+        <strong>Why three?</strong> XGBoost gain counts how useful a feature is for building the trees and tends to
+        favour features with many distinct values. <strong>SHAP</strong> measures how much a feature moves
+        individual predictions on average. <strong>Permutation</strong> measures how much the model's accuracy (AUC)
+        drops when the feature is scrambled. Each bar shows the feature's share of the total for that method.
+        </div>
+        """, unsafe_allow_html=True)
+
+        methods = {"gain": "XGBoost gain", "mean_abs_shap": "Mean |SHAP|", "permutation_mean": "Permutation (AUC drop)"}
+        methods = {k: v for k, v in methods.items() if k in importance_table}
+        top_features = importance_table["mean_abs_shap"].sort_values(ascending=False).head(15).index
+        compare_df = pd.DataFrame([
+            {
+                "Feature": translate_feature(f),
+                "Method": label,
+                "Share of Total": importance_table.loc[f, column] / importance_table[column].clip(lower=0).sum(),
+            }
+            for f in top_features
+            for column, label in methods.items()
+        ])
+        fig_compare = px.bar(
+            compare_df,
+            x="Share of Total",
+            y="Feature",
+            color="Method",
+            barmode="group",
+            orientation="h",
+            color_discrete_sequence=["#90be6d", "#277da1", "#f3722c"]
+        )
+        fig_compare.update_layout(
+            height=620,
+            yaxis={"categoryorder": "array", "categoryarray": [translate_feature(f) for f in top_features][::-1]},
+            xaxis_tickformat=".0%",
+            margin=dict(l=10, r=10, t=10, b=10)
+        )
+        st.plotly_chart(fig_compare, width="stretch")
+
+        with st.expander("Feature ranks by method"):
+            rank_columns = {f"{k}_rank": v for k, v in methods.items() if f"{k}_rank" in importance_table}
+            ranks_df = importance_table[list(rank_columns)].rename(columns=rank_columns).astype(int)
+            ranks_df.index = [translate_feature(f) for f in ranks_df.index]
+            st.dataframe(ranks_df.sort_values(list(rank_columns.values())[1]), width="stretch")
+            if permutation_info:
+                st.caption(
+                    f"Permutation importance: {permutation_info['n_samples']:,} test opportunities, "
+                    f"{permutation_info['n_repeats']} shuffles per feature, baseline AUC {permutation_info['baseline']:.3f}."
+                )
+
+    rerun.mark("interaction pairs")
+    top_interactions = global_insights.get("top_interactions")
+    if top_interactions:
+        st.markdown('<div class="sub-header">Features That Work Together</div>', unsafe_allow_html=True)
+        st.markdown("""
+        <div class="chart-description">
+        <strong>What does this mean?</strong> Some features matter mostly <em>in combination</em>: their joint effect
+        is different from the sum of their separate effects. Each bar is the average size of that extra, combined
+        effect (SHAP interaction value) on the model's output.
+        </div>
+        """, unsafe_allow_html=True)
+        pairs_df = pd.DataFrame([
+            {
+                "Pair": f"{translate_feature(p['features'][0])} × {translate_feature(p['features'][1])}",
+                "Interaction Strength": p["mean_abs_interaction"],
+                "vs. Separate Effects": p["relative_to_main_effects"],
+            }
+            for p in top_interactions["pairs"]
+        ])
+        fig_pairs = px.bar(
+            pairs_df,
+            x="Interaction Strength",
+            y="Pair",
+            orientation="h",
+            hover_data={"vs. Separate Effects": ":.1%"},
+            color_discrete_sequence=["#577590"]
+        )
+        fig_pairs.update_layout(
+            height=max(320, 36 * len(pairs_df)),
+            yaxis={"categoryorder": "total ascending"},
+            xaxis_title="Mean |SHAP interaction value|",
+            margin=dict(l=10, r=10, t=10, b=10)
+        )
+        st.plotly_chart(fig_pairs, width="stretch")
+        st.caption(f"Estimated on a sample of {top_interactions['n_rows']:,} test opportunities.")
+
+    # SHAP beeswarm (interactive, built from the SHAP matrix)
+    rerun.mark("beeswarm")
     st.markdown('<div class="sub-header">Feature Impact on Win Probability</div>', unsafe_allow_html=True)
-    if Path("output/images/shap_summary.png").exists():
-        with st.expander("See SHAP summary plot"):
-            st.markdown("""
-                <div class="chart-description">
-                Each dot represents an opportunity. Red = high feature value, Blue = low feature value. Right side increases win chance, left side decreases it. 
-                </div>
-                """, unsafe_allow_html=True)
-            st.image("output/images/shap_summary.png", width="stretch")
-            #st.caption("Each dot represents an opportunity. Red = high feature value, Blue = low feature value. Right side increases win chance, left side decreases it.")
+    st.markdown("""
+        <div class="chart-description">
+        Each dot represents an opportunity. Red = high feature value, Blue = low feature value. Right side increases win chance, left side decreases it.
+        Hover a dot to see the opportunity; pick a segment to compare groups. Dense areas are thinned so the chart stays fast — outliers are always kept.
+        </div>
+        """, unsafe_allow_html=True)
+
+    col_segment, col_points = st.columns([2, 1])
+    swarm_segment = col_segment.selectbox("Segment", list(BEESWARM_SEGMENTS))
+    swarm_points = col_points.select_slider("Points per feature", options=[200, 400, 800, 1600, 3200], value=800)
+
+    swarm_start = time.perf_counter()
+    swarm = prepare_segment_beeswarm(swarm_segment, swarm_points, model_version)
+    if swarm["n_segment_rows"] == 0:
+        st.info("No opportunities in this segment.")
     else:
-        st.info("SHAP summary image not found. Please regenerate it from the Colab notebook.")
+        fig_swarm, payload_kb = load_segment_beeswarm_figure(swarm_segment, swarm_points, model_version)
+        swarm_ms = (time.perf_counter() - swarm_start) * 1000
+        st.plotly_chart(fig_swarm, width="stretch")
+
+        # Prefer the light web-resolution render of the served version; unregistered
+        # output/ folders fall back to the 300-dpi print version
+        summary_candidates = [bundle.artifact("shap_summary.png")]
+        if model_version.startswith("output@"):
+            summary_candidates.append(Path("output/images/shap_summary.png"))
+        shap_summary_path = next((p for p in summary_candidates if p is not None and p.exists()), None)
+        caption = (
+            f"{len(swarm['x']):,} of {swarm['n_points_total']:,} points shown "
+            f"({swarm['n_segment_rows']:,} opportunities) · built in {swarm_ms:.0f} ms · {payload_kb:,.0f} KB chart payload"
+        )
+        if shap_summary_path is not None:
+            png_stat = shap_summary_path.stat()
+            render_ms, decode_ms = png_timings(str(shap_summary_path), png_stat.st_mtime_ns)
+            rendered = f"rendered in {render_ms:,.0f} ms, " if render_ms is not None else ""
+            caption += f" vs {png_stat.st_size / 1024:,.0f} KB static PNG ({rendered}decoded in {decode_ms:.0f} ms)"
+        st.caption(caption)
+
+        if shap_summary_path is not None:
+            with st.expander("See static SHAP summary plot"):
+                st.image(str(shap_summary_path), width="stretch")
 
     # SHAP drivers textual summary
     if "shap_drivers" in global_insights:
@@ -962,17 +1353,20 @@ if page == "Global Insights":
 # PAGE 2: CASE EXPLORER
 # ============================================================
 elif page == "Case Explorer":
+    rerun.mark("case selection")
     st.markdown('<div class="main-header">Individual Opportunity Analysis</div>', unsafe_allow_html=True)
     st.markdown("**Explore detailed predictions and explanations for specific opportunities**")
 
     # Case ID input
-    available_ids = sorted(X_test.index.tolist())
+    available_ids = load_sorted_case_ids(model_version)
+    if load_case_index_view(model_version).row_of(st.session_state.get("case_explorer_id")) is None:
+        st.session_state["case_explorer_id"] = 102 if 102 in available_ids else available_ids[0]
 
     case_id = st.selectbox(
         "Select Opportunity ID",
         available_ids,
-        index=available_ids.index(102) if 102 in available_ids else 0,
-        help=f"Choose from {len(available_ids):,} opportunities in the test set"
+        key="case_explorer_id",
+        help=f"Choose from {len(available_ids):,} opportunities in the test set, or pick one in the Portfolio page"
     )
 
     if case_id is not None:
@@ -982,6 +1376,7 @@ elif page == "Case Explorer":
         actual = int(y_test.loc[case_id])
         shap_row = shap_values[row_pos]
 
+        rerun.mark("prediction")
         # Get prediction
         prob, pred = get_prediction(row)
 
@@ -1008,6 +1403,7 @@ elif page == "Case Explorer":
             help="Real outcome of this opportunity"
         )
 
+        rerun.mark("SHAP (full model)")
         new_shap = explainer.shap_values(row.values.reshape(1, -1))
         if isinstance(new_shap, list):
             new_shap = new_shap[1][0]
@@ -1057,6 +1453,16 @@ elif page == "Case Explorer":
             unsafe_allow_html=True
         )
 
+        ensemble_view = load_ensemble_view(model_version)
+        if ensemble_view is not None and str(case_id) in ensemble_view.index:
+            member = ensemble_view.loc[str(case_id)]
+            st.caption(
+                f"Model agreement: an ensemble of independently trained variants averages "
+                f"{member['mean_probability']:.1%} (spread ±{member['std'] * 100:.1f} pp), "
+                f"{member['agreement']:.0%} of them on the same side of the threshold → "
+                f"{member['confidence']} confidence."
+            )
+
         # Key features
         #st.markdown('<div class="sub-header">Key Features for This Opportunity</div>', unsafe_allow_html=True)
         if True:
@@ -1140,13 +1546,19 @@ elif page == "Case Explorer":
             </div>
             """, unsafe_allow_html=True)
 
+        rerun.mark("waterfall")
         # SHAP Waterfall
         st.markdown('<div class="sub-header">Seeing it graphically</div>', unsafe_allow_html=True)
 
         base_val = explainer.expected_value
         if isinstance(base_val, (list, np.ndarray)):
             base_val = float(base_val[1] if len(np.atleast_1d(base_val)) > 1 else base_val[0])
-        plot_shap_waterfall(shap_row, row, base_val)
+        interactive_waterfall = st.toggle("Interactive chart", key="case_waterfall_interactive")
+        plot_shap_waterfall(
+            shap_row, row, base_val,
+            cache_key=waterfall_key(case_id, feature_names, version=model_version),
+            interactive=interactive_waterfall
+        )
         st.caption("Red bars push probability UP (toward win), blue bars push it DOWN (toward loss). Starting from average, each feature adjusts the final prediction.")
 
         # SHAP waterfall summary
@@ -1190,6 +1602,7 @@ elif page == "Case Explorer":
             - All bars sum up to explain the difference between base value and final prediction
             """)
 
+        rerun.mark("recommendation")
         # Business recommendation
         if case_json and "business_recommendation" in case_json:
             st.markdown('<div class="sub-header">🎯 Recommended Action</div>', unsafe_allow_html=True)
@@ -1209,10 +1622,66 @@ elif page == "Case Explorer":
             </div>
             """, unsafe_allow_html=True)
 
+        rerun.mark("similar opportunities")
+        # Similar opportunities
+        st.markdown('<div class="sub-header">Similar Opportunities</div>', unsafe_allow_html=True)
+        similarity_modes = {
+            "Similar profile": ("features", "Opportunities with the closest feature values"),
+            "Similar reasoning": ("shap", "Opportunities the model explains in the most similar way (closest SHAP values)"),
+        }
+        col1, col2 = st.columns([2, 1])
+        with col1:
+            similarity_mode = st.radio(
+                "Similarity", list(similarity_modes), horizontal=True, key="similarity_mode",
+                help=" | ".join(f"{k}: {v[1]}" for k, v in similarity_modes.items())
+            )
+        with col2:
+            n_similar = st.selectbox("Cases to show", [5, 10, 20], key="similarity_k")
+
+        index_name = similarity_modes[similarity_mode][0]
+        query_vector = row.values if index_name == "features" else shap_row
+        start_time = time.perf_counter()
+        similar_ids, similar_dist, _ = load_similarity_indexes(model_version)[index_name].query(query_vector, k=n_similar, exclude_id=case_id)
+        elapsed_ms = (time.perf_counter() - start_time) * 1000
+
+        case_index = load_case_index_view(model_version)
+        similar_rows = case_index.frame.iloc[[case_index.row_of(i) for i in similar_ids]]
+        n_won = int((similar_rows["actual_outcome"] == "Win").sum())
+        st.markdown(f"**{n_won} of {len(similar_rows)}** similar opportunities were won "
+                    f"(this case: {prob:.1%} predicted win probability).")
+
+        st.session_state["similar_case_ids"] = similar_ids.tolist()
+
+        def _open_similar_case():
+            rows = st.session_state["similar_table"].selection.rows
+            if rows:
+                st.session_state["case_explorer_id"] = st.session_state["similar_case_ids"][rows[0]]
+
+        st.dataframe(
+            pd.DataFrame({
+                "Opportunity ID": similar_ids,
+                "Distance": similar_dist,
+                "Win Probability": similar_rows["win_probability"].to_numpy(),
+                "Actual Outcome": similar_rows["actual_outcome"].astype(str).to_numpy(),
+                "Top Factor": [translate_feature(f) for f in similar_rows["top_factor"]],
+            }),
+            hide_index=True,
+            width="stretch",
+            on_select=_open_similar_case,
+            selection_mode="single-row",
+            key="similar_table",
+            column_config={
+                "Distance": st.column_config.NumberColumn(format="%.2f", help="Lower = more similar"),
+                "Win Probability": st.column_config.ProgressColumn(format="percent", min_value=0.0, max_value=1.0),
+            }
+        )
+        st.caption(f"{similarity_modes[similarity_mode][1]}. Lookup took {elapsed_ms:.1f} ms. Click a row to open that case.")
+
 # ============================================================
 # PAGE 3: WHAT-IF SIMULATOR
 # ============================================================
 elif page == "What-If Simulator":
+    rerun.mark("base case & controls")
     st.markdown('<div class="main-header">What-If Scenario Simulator</div>', unsafe_allow_html=True)
     st.markdown("**Simulate changes to key variables and observe real-time impact on win probability**")
 
@@ -1229,13 +1698,13 @@ elif page == "What-If Simulator":
         if st.session_state.get("last_base_id") != base_id:
             st.session_state["last_base_id"] = base_id
             if 'cust_interactions' in feature_names:
-                st.session_state["slider_interactions"] = clamp_value(float(original_row.get('cust_interactions', 0.5)), 0.0, 2.0)
+                st.session_state["slider_interactions"] = clamp_value(float(original_row.get('cust_interactions', 0.5)), *WHAT_IF_RANGES['cust_interactions'])
             if 'cust_hitrate' in feature_names:
-                st.session_state["slider_hitrate"] = clamp_value(float(original_row.get('cust_hitrate', 0.5)), 0.0, 1.0)
+                st.session_state["slider_hitrate"] = clamp_value(float(original_row.get('cust_hitrate', 0.5)), *WHAT_IF_RANGES['cust_hitrate'])
             if 'opp_old' in feature_names:
-                st.session_state["slider_opp_old"] = clamp_value(float(original_row.get('opp_old', 0.0)), -2.0, 2.0)
+                st.session_state["slider_opp_old"] = clamp_value(float(original_row.get('opp_old', 0.0)), *WHAT_IF_RANGES['opp_old'])
             if 'total_competitors' in feature_names:
-                st.session_state["slider_competitors"] = clamp_value(float(original_row.get('total_competitors', 0)), 0.0, 5.0)
+                st.session_state["slider_competitors"] = float(clamp_value(float(original_row.get('total_competitors', 0)), *WHAT_IF_RANGES['total_competitors']))
 
         # Get original prediction
         original_prob, original_pred = get_prediction(original_row)
@@ -1306,33 +1775,33 @@ elif page == "What-If Simulator":
         # Apply preset if selected
         if preset_action == "interactions_up" and 'cust_interactions' in feature_names:
             base_val = st.session_state.get("slider_interactions", float(original_row.get('cust_interactions', 0.5)))
-            new_val = clamp_value(base_val * 1.2, 0.0, 2.0)
+            new_val = clamp_value(base_val * 1.2, *WHAT_IF_RANGES['cust_interactions'])
             st.session_state["slider_interactions"] = new_val
             modified_row['cust_interactions'] = new_val
         elif preset_action == "reduce_comp" and 'total_competitors' in feature_names:
             base_val = st.session_state.get("slider_competitors", float(original_row.get('total_competitors', 0)))
-            new_val = clamp_value(int(base_val) - 1, 0, 5)
+            new_val = clamp_value(int(base_val) - 1, *WHAT_IF_RANGES['total_competitors'])
             st.session_state["slider_competitors"] = float(new_val)
             modified_row['total_competitors'] = float(new_val)
         elif preset_action == "fast_track" and 'opp_old' in feature_names:
-            new_val = clamp_value(-1.0, -2.0, 2.0)
+            new_val = clamp_value(-1.0, *WHAT_IF_RANGES['opp_old'])
             st.session_state["slider_opp_old"] = new_val
             modified_row['opp_old'] = new_val  # Make it new
         elif preset_action == "reset":
             if 'cust_interactions' in feature_names:
-                base_val = clamp_value(float(original_row.get('cust_interactions', 0.5)), 0.0, 2.0)
+                base_val = clamp_value(float(original_row.get('cust_interactions', 0.5)), *WHAT_IF_RANGES['cust_interactions'])
                 st.session_state["slider_interactions"] = base_val
                 modified_row['cust_interactions'] = base_val
             if 'cust_hitrate' in feature_names:
-                base_val = clamp_value(float(original_row.get('cust_hitrate', 0.5)), 0.0, 1.0)
+                base_val = clamp_value(float(original_row.get('cust_hitrate', 0.5)), *WHAT_IF_RANGES['cust_hitrate'])
                 st.session_state["slider_hitrate"] = base_val
                 modified_row['cust_hitrate'] = base_val
             if 'opp_old' in feature_names:
-                base_val = clamp_value(float(original_row.get('opp_old', 0.0)), -2.0, 2.0)
+                base_val = clamp_value(float(original_row.get('opp_old', 0.0)), *WHAT_IF_RANGES['opp_old'])
                 st.session_state["slider_opp_old"] = base_val
                 modified_row['opp_old'] = base_val
             if 'total_competitors' in feature_names:
-                base_val = clamp_value(float(original_row.get('total_competitors', 0)), 0.0, 5.0)
+                base_val = float(clamp_value(float(original_row.get('total_competitors', 0)), *WHAT_IF_RANGES['total_competitors']))
                 st.session_state["slider_competitors"] = base_val
                 modified_row['total_competitors'] = base_val
 
@@ -1349,8 +1818,8 @@ elif page == "What-If Simulator":
 
                 new_interactions = st.slider(
                     translate_feature("cust_interactions"),
-                    min_value=0.0,
-                    max_value=2.0,
+                    min_value=WHAT_IF_RANGES["cust_interactions"][0],
+                    max_value=WHAT_IF_RANGES["cust_interactions"][1],
                     step=0.1,
                     help=help_text,
                     key="slider_interactions"
@@ -1366,8 +1835,8 @@ elif page == "What-If Simulator":
 
                 new_hitrate = st.slider(
                     translate_feature("cust_hitrate"),
-                    min_value=0.0,
-                    max_value=1.0,
+                    min_value=WHAT_IF_RANGES["cust_hitrate"][0],
+                    max_value=WHAT_IF_RANGES["cust_hitrate"][1],
                     step=0.05,
                     help=help_text,
                     key="slider_hitrate"
@@ -1379,8 +1848,8 @@ elif page == "What-If Simulator":
             if 'opp_old' in feature_names:
                 new_opp_age = st.slider(
                     translate_feature("opp_old"),
-                    min_value=-2.0,
-                    max_value=2.0,
+                    min_value=WHAT_IF_RANGES["opp_old"][0],
+                    max_value=WHAT_IF_RANGES["opp_old"][1],
                     step=0.1,
                     help="Opportunity age (standardized)\n• -2 = Very new\n• 0 = Average age\n• +2 = Very old",
                     key="slider_opp_old"
@@ -1390,8 +1859,8 @@ elif page == "What-If Simulator":
             if 'total_competitors' in feature_names:
                 new_competitors = st.slider(
                     translate_feature("total_competitors"),
-                    min_value=0,
-                    max_value=5,
+                    min_value=WHAT_IF_RANGES["total_competitors"][0],
+                    max_value=WHAT_IF_RANGES["total_competitors"][1],
                     step=1,
                     help="Number of active competitors\n• 0 = No competition (best)\n• 1-2 = Moderate competition\n• 3+ = High competition (challenging)",
                     key="slider_competitors"
@@ -1409,8 +1878,27 @@ elif page == "What-If Simulator":
         if 'customer_engagement' in feature_names:
             modified_row['customer_engagement'] = modified_row['cust_hitrate'] * modified_row['cust_interactions']
 
+        # Surrogate for instant slider feedback, full model on demand
+        surrogate = load_surrogate()
+        preview = False
+        if surrogate is not None:
+            # On by default only when the distilled model tracks the full model's changes closely enough
+            delta_error = surrogate[2]["what_if_delta_error"]["mean_abs_error"]
+            fast_preview = st.toggle(
+                "Fast preview", value=preview_by_default(surrogate[2]), key="whatif_fast_preview",
+                help=(f"Slider feedback from a compact distilled model; press the button for the full model's numbers. "
+                      f"Its probability changes differ from the full model's by {delta_error * 100:.1f} points "
+                      f"on average (on by default below {PREVIEW_MAX_DELTA_ERROR * 100:.0f}).")
+            )
+            final_numbers = fast_preview and st.button("Compute final numbers (full model)", key="whatif_final")
+            preview = fast_preview and not final_numbers
+
+        rerun.mark("prediction")
         # Get new prediction
-        new_prob, new_pred = get_prediction(modified_row)
+        if preview:
+            new_prob, new_pred = preview_prediction(modified_row, original_row, original_prob)
+        else:
+            new_prob, new_pred = get_prediction(modified_row)
         delta_prob = new_prob - original_prob
 
         st.markdown("---")
@@ -1419,9 +1907,18 @@ elif page == "What-If Simulator":
         st.markdown('<div class="sub-header">Simulation Results</div>', unsafe_allow_html=True)
 
         col1, col2, col3 = st.columns(3)
-        col1.metric("New Probability", f"{new_prob:.1%}", delta=f"{delta_prob:+.1%}")
+        col1.metric("New Probability (preview)" if preview else "New Probability",
+                    f"{new_prob:.1%}", delta=f"{delta_prob:+.1%}")
         col2.metric("New Prediction", "Win" if new_pred == 1 else "Loss")
         col3.metric("Change", f"{delta_prob:+.1%}")
+        if preview:
+            report = surrogate[2]
+            st.caption(
+                f"Preview from a {report['student']['n_trees']}-tree distilled model "
+                f"(mean gap to the full model {report['mean_abs_prob_diff']:.1%}, "
+                f"same decision on {report['decision_agreement']:.0%} of test cases). "
+                "Use the button above for the full model's numbers."
+            )
 
         # Build change summary first
         changes = []
@@ -1499,17 +1996,21 @@ elif page == "What-If Simulator":
 
         #st.markdown("---")
 
+        rerun.mark("SHAP")
         # SHAP for modified
         try:
-            new_shap = explainer.shap_values(modified_row.values.reshape(1, -1))
-            if isinstance(new_shap, list):
-                new_shap = new_shap[1][0]
+            if preview:
+                new_shap, base_val = surrogate_shap(modified_row)
             else:
-                new_shap = new_shap[0]
+                new_shap = explainer.shap_values(modified_row.values.reshape(1, -1))
+                if isinstance(new_shap, list):
+                    new_shap = new_shap[1][0]
+                else:
+                    new_shap = new_shap[0]
 
-            base_val = explainer.expected_value
-            if isinstance(base_val, (list, np.ndarray)):
-                base_val = float(base_val[1] if len(np.atleast_1d(base_val)) > 1 else base_val[0])
+                base_val = explainer.expected_value
+                if isinstance(base_val, (list, np.ndarray)):
+                    base_val = float(base_val[1] if len(np.atleast_1d(base_val)) > 1 else base_val[0])
 
             pos_drivers, neg_drivers = summarize_shap(new_shap, feature_names)
             if pos_drivers or neg_drivers:
@@ -1529,8 +2030,15 @@ elif page == "What-If Simulator":
                 st.markdown(driver_html, unsafe_allow_html=True)
                 st.markdown('<br>', unsafe_allow_html=True)
 
+            rerun.mark("waterfall")
             st.markdown('<div class="sub-header">Updated Graphical Representation</div>', unsafe_allow_html=True)
-            plot_shap_waterfall(new_shap, modified_row, base_val)
+            interactive_waterfall = st.toggle("Interactive chart", key="whatif_waterfall_interactive")
+            plot_shap_waterfall(
+                new_shap, modified_row, base_val,
+                cache_key=waterfall_key(f"{'what-if-preview' if preview else 'what-if'}:{base_id}",
+                                        feature_names, new_shap, modified_row.values),
+                interactive=interactive_waterfall
+            )
             st.caption("Starting from the average prediction, red bars increase the probability and blue bars decrease it for this simulated scenario.")
 
 
@@ -1545,6 +2053,7 @@ elif page == "What-If Simulator":
         except Exception as e:
             st.warning(f"Could not generate SHAP plot: {e}")
 
+        rerun.mark("recommendation")
         # Action recommendation
         st.markdown('<div class="sub-header">Action Recommendation</div>', unsafe_allow_html=True)
         if delta_prob > 0.1:
@@ -1569,3 +2078,534 @@ elif page == "What-If Simulator":
             </ul>
             </div>
             """, unsafe_allow_html=True)
+
+# ============================================================
+# PAGE 4: THRESHOLD EXPLORER
+# ============================================================
+elif page == "Threshold Explorer":
+    rerun.mark("curve & metrics")
+    st.markdown('<div class="main-header">Threshold Explorer</div>', unsafe_allow_html=True)
+    st.markdown("**See what happens to precision, recall and the pipeline when the decision threshold moves**")
+
+    curve = load_threshold_explorer_data(model_version)
+    if curve is None:
+        st.info("Threshold curve not found. Re-run `local_pipeline.py` to generate `output/threshold_curve.npz`.")
+        rerun.finish()
+        st.stop()
+
+    st.markdown("""
+    <div class="chart-description">
+    <strong>What does this mean?</strong> The model gives each opportunity a win probability; the threshold decides
+    from which probability we call it a "Win". A <strong>lower threshold</strong> flags more deals (higher recall, more
+    false alarms); a <strong>higher threshold</strong> flags fewer, surer deals (higher precision).
+    All numbers are recomputed instantly on the test set — nothing is re-scored.
+    </div>
+    """, unsafe_allow_html=True)
+
+    if "explorer_threshold" not in st.session_state:
+        st.session_state["explorer_threshold"] = round(float(threshold), 2)
+
+    selected_th = st.slider(
+        "Decision Threshold",
+        min_value=0.0,
+        max_value=1.0,
+        step=0.01,
+        key="explorer_threshold",
+        help=get_metric_help("threshold")
+    )
+
+    current = metrics_at(curve, threshold)
+    selected = metrics_at(curve, selected_th)
+
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric(
+        "Precision",
+        f"{selected['precision']:.3f}",
+        delta=f"{selected['precision'] - current['precision']:+.3f}",
+        help=get_metric_help("precision")
+    )
+    col2.metric(
+        "Recall",
+        f"{selected['recall']:.3f}",
+        delta=f"{selected['recall'] - current['recall']:+.3f}",
+        help=get_metric_help("recall")
+    )
+    col3.metric(
+        "F1 Score",
+        f"{selected['f1_score']:.3f}",
+        delta=f"{selected['f1_score'] - current['f1_score']:+.3f}",
+        help=get_metric_help("f1_score")
+    )
+    col4.metric(
+        "Predicted Wins",
+        f"{selected['predicted_wins']:,}",
+        delta=f"{selected['predicted_wins'] - current['predicted_wins']:+,}",
+        help=get_metric_help("predicted_wins")
+    )
+    st.caption(f"Deltas are relative to the model's F1-optimal threshold ({threshold:.3f}).")
+
+    # Probability buckets split by the selected threshold
+    rerun.mark("probability buckets")
+    st.markdown('<div class="sub-header">Probability Buckets</div>', unsafe_allow_html=True)
+    buckets = bucket_counts(curve, selected_th)
+    bucket_labels_display = ["🔴 Low (0-30%)", "🟠 Medium (30-50%)", "🟢 High (50-70%)", "🔵 Very High (70-100%)"]
+    buckets_df = pd.DataFrame([
+        {"Confidence Level": display, "Prediction": outcome, "Number of Opportunities": buckets[label][key]}
+        for label, display in zip(BUCKET_LABELS, bucket_labels_display)
+        for outcome, key in [("Win", "predicted_wins"), ("Loss", "predicted_losses")]
+    ])
+    fig_buckets = px.bar(
+        buckets_df,
+        x="Confidence Level",
+        y="Number of Opportunities",
+        color="Prediction",
+        color_discrete_map={"Win": "#14ab9b", "Loss": "#fb736b"}
+    )
+    fig_buckets.update_layout(margin=dict(l=10, r=10, t=10, b=10), legend_title_text="")
+    st.plotly_chart(fig_buckets, width="stretch")
+
+    # Cost matrix
+    rerun.mark("profit curve")
+    st.markdown('<div class="sub-header">Profit-Optimal Threshold</div>', unsafe_allow_html=True)
+    st.markdown("""
+    <div class="chart-description">
+    Enter what each outcome is worth to the business (any unit, e.g. k€). The explorer evaluates every possible
+    threshold and finds the one with the highest total value on the test set.
+    </div>
+    """, unsafe_allow_html=True)
+
+    col1, col2, col3, col4 = st.columns(4)
+    gain_tp = col1.number_input("Win pursued (TP)", value=10.0, step=1.0, help="Value of pursuing a deal that is won")
+    cost_fp = col2.number_input("Loss pursued (FP)", value=2.0, step=1.0, min_value=0.0, help="Cost of pursuing a deal that is lost")
+    cost_fn = col3.number_input("Win missed (FN)", value=0.0, step=1.0, min_value=0.0, help="Cost of not prioritizing a deal that would have been won")
+    gain_tn = col4.number_input("Loss skipped (TN)", value=0.0, step=1.0, help="Value of correctly skipping a losing deal")
+
+    profit_th, profits = profit_curve(curve, gain_tp=gain_tp, cost_fp=cost_fp, cost_fn=cost_fn, gain_tn=gain_tn)
+    best_pos = int(np.argmax(profits))
+    best_profit_th = float(min(profit_th[best_pos], 1.0))
+    selected_counts = metrics_at(curve, selected_th)
+    selected_profit = (
+        gain_tp * selected_counts["tp"] - cost_fp * selected_counts["fp"]
+        - cost_fn * selected_counts["fn"] + gain_tn * selected_counts["tn"]
+    )
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Profit-Optimal Threshold", f"{best_profit_th:.3f}")
+    col2.metric("Value at Optimum", f"{profits[best_pos]:,.0f}")
+    col3.metric(
+        "Value at Selected Threshold",
+        f"{selected_profit:,.0f}",
+        delta=f"{selected_profit - profits[best_pos]:+,.0f}"
+    )
+
+    def _use_profit_threshold():
+        st.session_state["explorer_threshold"] = round(best_profit_th, 2)
+
+    st.button("Use profit-optimal threshold", on_click=_use_profit_threshold)
+
+    fig_profit = go.Figure()
+    fig_profit.add_trace(go.Scatter(
+        x=np.minimum(profit_th, 1.0), y=profits, mode="lines",
+        line=dict(color="#277da1", width=3), name="Total value"
+    ))
+    fig_profit.add_vline(x=selected_th, line_dash="dash", line_color="#f3722c", annotation_text="Selected")
+    fig_profit.add_vline(x=best_profit_th, line_dash="dot", line_color="#14ab9b", annotation_text="Optimum")
+    fig_profit.update_layout(
+        xaxis_title="Decision Threshold",
+        yaxis_title="Total value on test set",
+        showlegend=False,
+        margin=dict(l=10, r=10, t=30, b=10)
+    )
+    st.plotly_chart(fig_profit, width="stretch")
+
+
+# ============================================================
+# PAGE 5: PORTFOLIO
+# ============================================================
+elif page == "Portfolio":
+    rerun.mark("filters & table")
+    st.markdown('<div class="main-header">Opportunity Portfolio</div>', unsafe_allow_html=True)
+    st.markdown("**Sort and filter every opportunity in the test set, then click a row to open it in the Case Explorer**")
+
+    case_index = load_case_index_view(model_version)
+
+    st.markdown('<div class="sub-header">Filters</div>', unsafe_allow_html=True)
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        prob_range = st.slider("Win Probability", 0.0, 1.0, (0.0, 1.0), step=0.01, key="portfolio_prob")
+        id_query = st.text_input("Opportunity ID starts with", key="portfolio_id")
+    with col2:
+        actions = st.multiselect("Recommended Action", ACTIONS, key="portfolio_actions")
+        priorities = st.multiselect("Priority", PRIORITIES, key="portfolio_priorities")
+        confidence = st.multiselect("Confidence", CONFIDENCE_LEVELS, key="portfolio_confidence")
+    with col3:
+        predicted = st.multiselect("Predicted Outcome", OUTCOMES, key="portfolio_predicted")
+        actual = st.multiselect("Actual Outcome", OUTCOMES, key="portfolio_actual")
+        top_factors = st.multiselect(
+            "Top Factor",
+            list(case_index.frame["top_factor"].cat.categories),
+            format_func=translate_feature,
+            key="portfolio_factors"
+        )
+
+    sort_labels = {
+        "win_probability": "Win Probability",
+        "opportunity_id": "Opportunity ID",
+        "confidence": "Confidence",
+        "priority": "Priority",
+        "top_factor_shap": "Top Factor Impact",
+    }
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        sort_by = st.selectbox("Sort by", SORTABLE_COLUMNS, index=1, format_func=sort_labels.get, key="portfolio_sort")
+    with col2:
+        ascending = st.radio("Order", ["Descending", "Ascending"], horizontal=True, key="portfolio_order") == "Ascending"
+    with col3:
+        page_size = st.selectbox("Rows per page", [25, 50, 100, 250], index=1, key="portfolio_page_size")
+
+    start_time = time.perf_counter()
+    mask = case_index.mask(
+        prob_range=prob_range, predicted=predicted, actual=actual, confidence=confidence,
+        actions=actions, priorities=priorities, top_factors=top_factors, id_query=id_query
+    )
+    n_pages = max(1, int(np.ceil(mask.sum() / page_size)))
+    if st.session_state.get("portfolio_page_number", 1) > n_pages:
+        st.session_state["portfolio_page_number"] = 1
+    page_number = st.number_input(f"Page (of {n_pages:,})", min_value=1, max_value=n_pages, step=1, key="portfolio_page_number")
+    page_df, n_matches = case_index.query(mask, sort_by, ascending, int(page_number), page_size)
+    elapsed_ms = (time.perf_counter() - start_time) * 1000
+
+    matched_prob = case_index.frame["win_probability"].to_numpy()[mask]
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Matching Opportunities", f"{n_matches:,}", delta=f"of {len(case_index):,}", delta_color="off")
+    col2.metric("Average Win Probability", f"{matched_prob.mean():.1%}" if n_matches else "-")
+    col3.metric("Predicted Wins", f"{int((matched_prob >= threshold).sum()):,}")
+
+    st.session_state["portfolio_page_ids"] = page_df["opportunity_id"].tolist()
+
+    def _open_selected_case():
+        rows = st.session_state["portfolio_table"].selection.rows
+        if rows:
+            st.session_state["case_explorer_id"] = st.session_state["portfolio_page_ids"][rows[0]]
+            st.session_state["page"] = "Case Explorer"
+
+    table = pd.DataFrame({
+        "Opportunity ID": page_df["opportunity_id"].to_numpy(),
+        "Win Probability": page_df["win_probability"].to_numpy(),
+        "Predicted": page_df["predicted_outcome"].astype(str).to_numpy(),
+        "Actual": page_df["actual_outcome"].astype(str).to_numpy(),
+        "Confidence": page_df["confidence"].astype(str).to_numpy(),
+        "Action": page_df["action"].astype(str).to_numpy(),
+        "Priority": page_df["priority"].astype(str).to_numpy(),
+        "Top Factor": [translate_feature(f) for f in page_df["top_factor"]],
+        "Factor Impact": page_df["top_factor_shap"].to_numpy(),
+    })
+    st.dataframe(
+        table,
+        hide_index=True,
+        width="stretch",
+        on_select=_open_selected_case,
+        selection_mode="single-row",
+        key="portfolio_table",
+        column_config={
+            "Win Probability": st.column_config.ProgressColumn(format="percent", min_value=0.0, max_value=1.0),
+            "Factor Impact": st.column_config.NumberColumn(format="%+.2f", help="SHAP value of the strongest factor"),
+        }
+    )
+    st.caption(f"Filtered and sorted {len(case_index):,} opportunities in {elapsed_ms:.1f} ms. Click a row to open the case.")
+
+
+# ============================================================
+# PAGE 6: SEGMENT ANALYTICS
+# ============================================================
+elif page == "Segment Analytics":
+    rerun.mark("filters")
+    st.markdown('<div class="main-header">Segment Analytics</div>', unsafe_allow_html=True)
+    st.markdown("**Compare what drives predictions in two groups of opportunities**")
+
+    st.markdown("""
+    <div class="chart-description">
+    <strong>How to use it:</strong> define <strong>Segment A</strong> and <strong>Segment B</strong> with the filters
+    below (leave B empty to compare against all opportunities). For each segment you get its size, real win rate and
+    the features that move its predictions the most, measured with SHAP values.
+    </div>
+    """, unsafe_allow_html=True)
+
+    engine = load_segment_engine(model_version)
+    col_a, col_b = st.columns(2)
+    with col_a:
+        st.markdown('<div class="sub-header">Segment A</div>', unsafe_allow_html=True)
+        predicates_a = segment_filters("segment_a")
+    with col_b:
+        st.markdown('<div class="sub-header">Segment B</div>', unsafe_allow_html=True)
+        predicates_b = segment_filters("segment_b")
+
+    rerun.mark("segment comparison")
+    start_time = time.perf_counter()
+    summary_a, summary_b, differences = engine.compare(predicates_a, predicates_b, top_k=10)
+    elapsed_ms = (time.perf_counter() - start_time) * 1000
+
+    for column, name, summary in [(col_a, "A", summary_a), (col_b, "B", summary_b)]:
+        with column:
+            m1, m2, m3 = st.columns(3)
+            m1.metric(f"Opportunities in {name}", f"{summary['size']:,}", delta=f"{summary['share']:.1%} of test set", delta_color="off")
+            m2.metric("Actual Win Rate", f"{summary['win_rate']:.1%}" if summary["size"] else "-")
+            m3.metric("Avg. Win Probability", f"{summary['mean_probability']:.1%}" if summary["size"] else "-")
+
+    if not summary_a["size"] or not summary_b["size"]:
+        st.warning("One of the segments is empty. Relax its filters to compare drivers.")
+        rerun.finish()
+        st.stop()
+
+    rerun.mark("drivers chart")
+    st.markdown('<div class="sub-header">Top Drivers by Segment</div>', unsafe_allow_html=True)
+    driver_features = list(dict.fromkeys(
+        [d["feature"] for d in summary_a["top_drivers"]] + [d["feature"] for d in summary_b["top_drivers"]]
+    ))
+    drivers_df = pd.DataFrame([
+        {"Feature": translate_feature(f), "Segment": name, "Average Impact": summary["mean_abs_shap"][f]}
+        for f in driver_features
+        for name, summary in [("A", summary_a), ("B", summary_b)]
+    ])
+    fig_drivers = px.bar(
+        drivers_df,
+        x="Average Impact",
+        y="Feature",
+        color="Segment",
+        barmode="group",
+        orientation="h",
+        color_discrete_map={"A": "#277da1", "B": "#f9c74f"}
+    )
+    fig_drivers.update_layout(
+        height=max(400, 28 * len(driver_features)),
+        yaxis={"categoryorder": "total ascending"},
+        xaxis_title="Mean |SHAP value|",
+        margin=dict(l=10, r=10, t=10, b=10)
+    )
+    st.plotly_chart(fig_drivers, width="stretch")
+
+    rerun.mark("differences chart")
+    st.markdown('<div class="sub-header">Where the Segments Differ</div>', unsafe_allow_html=True)
+    diff_df = pd.DataFrame([
+        {
+            "Feature": translate_feature(d["feature"]),
+            "Difference": d["mean_shap_difference"],
+            "Effect in A": "Pushes more toward Win" if d["mean_shap_difference"] > 0 else "Pushes more toward Loss",
+        }
+        for d in differences
+    ])
+    fig_diff = px.bar(
+        diff_df,
+        x="Difference",
+        y="Feature",
+        orientation="h",
+        color="Effect in A",
+        color_discrete_map={"Pushes more toward Win": "#ff0052", "Pushes more toward Loss": "#008bfb"}
+    )
+    fig_diff.update_layout(
+        height=420,
+        yaxis={"categoryorder": "array", "categoryarray": diff_df["Feature"].tolist()[::-1]},
+        xaxis_title="Mean SHAP value, A minus B",
+        margin=dict(l=10, r=10, t=10, b=10)
+    )
+    st.plotly_chart(fig_diff, width="stretch")
+    st.caption(f"Computed over {len(engine):,} opportunities in {elapsed_ms:.1f} ms (repeated queries are served from memory).")
+
+
+# ============================================================
+# PAGE 7: ARCHETYPES
+# ============================================================
+elif page == "Archetypes":
+    rerun.mark("overview")
+    st.markdown('<div class="main-header">Explanation Archetypes</div>', unsafe_allow_html=True)
+    st.markdown("**The typical stories the model tells, grouped from thousands of individual explanations**")
+
+    archetype_data = load_archetype_data(model_version)
+    if archetype_data is None:
+        st.info("Archetypes not found. Re-run `local_pipeline.py` (with `N_ARCHETYPES` > 0) to generate `output/archetypes.json`.")
+        rerun.finish()
+        st.stop()
+
+    st.markdown("""
+    <div class="chart-description">
+    <strong>What does this mean?</strong> Each opportunity has its own SHAP explanation. Opportunities whose
+    explanations look alike are grouped into an <strong>archetype</strong>: a recurring reason why the model
+    predicts a win or a loss. Bigger bubbles are more common; the colour shows how often those deals were actually won.
+    </div>
+    """, unsafe_allow_html=True)
+
+    archetype_list = sorted(archetype_data["archetypes"], key=lambda a: -a["size"])
+
+    def _archetype_label(arch):
+        return " / ".join(
+            f"{'+' if d['mean_shap'] > 0 else '-'} {translate_feature(d['feature'])}" for d in arch["top_drivers"][:2]
+        )
+
+    overview_df = pd.DataFrame([
+        {
+            "Archetype": f"#{a['id']} {_archetype_label(a)}",
+            "Opportunities": a["size"],
+            "Share": a["share"],
+            "Actual Win Rate": a["win_rate"],
+            "Avg. Win Probability": a["mean_probability"],
+        }
+        for a in archetype_list
+    ])
+    fig_overview = px.scatter(
+        overview_df,
+        x="Avg. Win Probability",
+        y="Actual Win Rate",
+        size="Opportunities",
+        color="Actual Win Rate",
+        hover_name="Archetype",
+        color_continuous_scale="RdYlGn",
+        range_color=[0, 1],
+        size_max=60
+    )
+    fig_overview.update_layout(
+        height=420,
+        xaxis=dict(range=[-0.05, 1.05], tickformat=".0%"),
+        yaxis=dict(range=[-0.05, 1.05], tickformat=".0%"),
+        margin=dict(l=10, r=10, t=10, b=10)
+    )
+    st.plotly_chart(fig_overview, width="stretch")
+    st.dataframe(
+        overview_df,
+        hide_index=True,
+        width="stretch",
+        column_config={
+            "Share": st.column_config.NumberColumn(format="percent"),
+            "Actual Win Rate": st.column_config.ProgressColumn(format="percent", min_value=0.0, max_value=1.0),
+            "Avg. Win Probability": st.column_config.ProgressColumn(format="percent", min_value=0.0, max_value=1.0),
+        }
+    )
+
+    rerun.mark("inside an archetype")
+    st.markdown('<div class="sub-header">Inside an Archetype</div>', unsafe_allow_html=True)
+    selected_arch = st.selectbox(
+        "Archetype",
+        archetype_list,
+        format_func=lambda a: f"#{a['id']} {_archetype_label(a)} ({a['size']:,} opportunities)",
+        key="archetype_selected"
+    )
+    centroid = np.asarray(archetype_data["centroids"][selected_arch["id"]])
+    order = np.argsort(np.abs(centroid))[::-1][:10]
+    centroid_df = pd.DataFrame({
+        "Feature": [translate_feature(archetype_data["feature_names"][j]) for j in order],
+        "Average SHAP": centroid[order],
+    })
+    fig_centroid = px.bar(
+        centroid_df,
+        x="Average SHAP",
+        y="Feature",
+        orientation="h",
+        color=np.where(centroid_df["Average SHAP"] > 0, "Pushes toward Win", "Pushes toward Loss"),
+        color_discrete_map={"Pushes toward Win": "#ff0052", "Pushes toward Loss": "#008bfb"}
+    )
+    fig_centroid.update_layout(
+        height=400,
+        yaxis={"categoryorder": "array", "categoryarray": centroid_df["Feature"].tolist()[::-1]},
+        legend_title_text="",
+        margin=dict(l=10, r=10, t=10, b=10)
+    )
+    st.plotly_chart(fig_centroid, width="stretch")
+
+    representative = selected_arch["representative_case"]
+
+    def _open_representative():
+        st.session_state["case_explorer_id"] = int(representative)
+        st.session_state["page"] = "Case Explorer"
+
+    col1, col2 = st.columns([3, 1])
+    col1.markdown(f"**Representative case:** opportunity **{representative}** — the member closest to the archetype's average explanation.")
+    col2.button("Open in Case Explorer", on_click=_open_representative, key="archetype_open_case")
+
+    rerun.mark("assignment")
+    st.markdown('<div class="sub-header">Assign an Opportunity</div>', unsafe_allow_html=True)
+    assign_ids = load_sorted_case_ids(model_version)
+    assign_id = st.selectbox("Opportunity ID", assign_ids, key="archetype_assign_id")
+    start_time = time.perf_counter()
+    fast_label = int(assign_archetype(archetype_data, model, X_test.loc[[assign_id]])[0])
+    elapsed_ms = (time.perf_counter() - start_time) * 1000
+    exact_label = archetype_data["labels"].get(str(assign_id))
+    fast_arch = next(a for a in archetype_data["archetypes"] if a["id"] == fast_label)
+
+    st.markdown(f"Opportunity **{assign_id}** belongs to archetype **#{fast_label} {_archetype_label(fast_arch)}** "
+                f"(actual win rate in this archetype: {fast_arch['win_rate']:.0%}).")
+    st.caption(
+        f"Assigned in {elapsed_ms:.1f} ms from the model's tree paths, without computing SHAP values. "
+        f"This fast assignment matches the full SHAP-based grouping for "
+        f"{archetype_data['fast_assignment_agreement']:.0%} of test opportunities"
+        + ("" if exact_label is None or exact_label == fast_label else f"; with full SHAP this case falls in #{exact_label}")
+        + "."
+    )
+
+
+# ============================================================
+# PAGE 8: DIAGNOSTICS (hidden, ?diagnostics=1)
+# ============================================================
+elif page == "Diagnostics":
+    rerun.mark("latency report")
+    st.markdown('<div class="main-header">Diagnostics</div>', unsafe_allow_html=True)
+    st.markdown("**Where the time goes when the dashboard reruns after each interaction**")
+
+    if not rerun.enabled:
+        st.info("Latency metrics are off. Start the app with `APP_METRICS=1 streamlit run app_final.py`.")
+    else:
+        store = get_metrics_store()
+        rows = store.summary()
+        st.caption(
+            f"{store.reruns:,} reruns since {store.started_at} across every session of this server, "
+            f"last {store.window:,} per section. Each rerun is also logged to `{store.log_path}` "
+            f"(`python app_metrics.py` summarizes it)."
+        )
+        if not rows:
+            st.info("No reruns recorded yet. Use the other pages, then come back.")
+        else:
+            page_totals = pd.DataFrame([
+                {"Page": r["page"], "Reruns": r["count"], "p50 (ms)": r["p50_ms"], "p90 (ms)": r["p90_ms"],
+                 "p99 (ms)": r["p99_ms"], "Max (ms)": r["max_ms"]}
+                for r in rows if r["section"] == TOTAL
+            ]).sort_values("p90 (ms)", ascending=False)
+            st.markdown('<div class="sub-header">Rerun Latency by Page</div>', unsafe_allow_html=True)
+            st.dataframe(page_totals.style.format(precision=1), hide_index=True, width="stretch")
+
+            st.markdown('<div class="sub-header">Sections of a Page</div>', unsafe_allow_html=True)
+            diag_page = st.selectbox("Page", page_totals["Page"].tolist(), key="diagnostics_page")
+            sections_df = pd.DataFrame([
+                {"Section": r["section"], "Runs": r["count"], "p50 (ms)": r["p50_ms"], "p90 (ms)": r["p90_ms"],
+                 "p99 (ms)": r["p99_ms"], "Max (ms)": r["max_ms"], "Share of median rerun": r["share_of_p50"]}
+                for r in rows if r["page"] == diag_page and r["section"] != TOTAL
+            ])
+            if not sections_df.empty:
+                slowest = sections_df.sort_values("p50 (ms)", ascending=False).iloc[0]
+                st.markdown(f"**{slowest['Section']}** dominates this page: median {slowest['p50 (ms)']:.0f} ms, "
+                            f"{slowest['Share of median rerun']:.0%} of a median rerun.")
+                fig_sections = go.Figure()
+                for column, color in [("p50 (ms)", "#277da1"), ("p90 (ms)", "#f9c74f"), ("p99 (ms)", "#ff0052")]:
+                    fig_sections.add_trace(go.Bar(
+                        x=sections_df[column], y=sections_df["Section"], name=column.split()[0],
+                        orientation="h", marker_color=color
+                    ))
+                fig_sections.update_layout(
+                    barmode="group",
+                    height=max(300, 60 * len(sections_df)),
+                    yaxis={"categoryorder": "array",
+                           "categoryarray": sections_df.sort_values("p50 (ms)")["Section"].tolist()},
+                    xaxis_title="Milliseconds per rerun",
+                    margin=dict(l=10, r=10, t=10, b=10)
+                )
+                st.plotly_chart(fig_sections, width="stretch")
+                st.dataframe(
+                    sections_df.style.format({"p50 (ms)": "{:.1f}", "p90 (ms)": "{:.1f}", "p99 (ms)": "{:.1f}",
+                                              "Max (ms)": "{:.1f}", "Share of median rerun": "{:.0%}"}),
+                    hide_index=True, width="stretch"
+                )
+            st.caption("Times are measured on the server while the page script runs: model calls, SHAP, charts and "
+                       "their serialization are included, drawing in the browser is not. The first rerun after a "
+                       "start also pays for loading cached data.")
+        if st.button("Reset rolling windows", key="diagnostics_reset"):
+            store.reset()
+            st.rerun()
+
+rerun.finish()
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+Schneider Electric Datathon - App Latency Metrics
+Opt-in timing of app_final.py reruns, enabled with APP_METRICS=1.
+
+Streamlit reruns the whole script on every widget interaction. A
+RerunTimer marks consecutive sections of one rerun (data loading, sidebar,
+then the sections of the selected page); like the pipeline profiler,
+sections are marked, not nested: timer.mark(name) closes the previous one.
+When the rerun finishes, its section times and total go to:
+
+    MetricsStore                        rolling window per (page, section), shared by
+                                        every session of the server process
+    output/app_metrics/reruns.jsonl     one JSON line per rerun
+
+The hidden Diagnostics page of the app (open it with ?diagnostics=1 in
+the URL) shows p50 / p90 / p99 per section from the store; this module's
+CLI computes the same table from the log, e.g. after a day of real use.
+
+Times are measured in the script thread: model calls, SHAP, figure
+building and serialization are included, browser rendering is not. A
+rerun ended by st.stop() or an exception is only recorded if finish() was
+called before it; a widget interaction that interrupts a running rerun
+drops that rerun.
+
+Usage:
+    APP_METRICS=1 streamlit run app_final.py
+    python app_metrics.py                     # percentiles from output/app_metrics/reruns.jsonl
+    python app_metrics.py --page "What-If Simulator" --since 2026-10-01
+"""
+
+import os
+import json
+import time
+import uuid
+import argparse
+import threading
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+METRICS_DIR = Path("output/app_metrics")
+LOG_PATH = METRICS_DIR / "reruns.jsonl"
+WINDOW = 1000
+MAX_LOG_MB = 50
+TOTAL = "total"
+
+
+def metrics_enabled():
+    return os.environ.get("APP_METRICS", "0") == "1"
+
+
+def percentile_row(times_ms):
+    """count / mean / p50 / p90 / p99 / max of a list of milliseconds"""
+    times = np.asarray(times_ms, dtype=float)
+    p50, p90, p99 = np.percentile(times, [50, 90, 99])
+    return {"count": int(len(times)), "mean_ms": float(times.mean()), "p50_ms": float(p50),
+            "p90_ms": float(p90), "p99_ms": float(p99), "max_ms": float(times.max())}
+
+
+def summarize(samples):
+    """
+    Percentile rows of {(page, section): [ms, ...]}, sorted by page and by
+    p90 within the page, with each section's share of the page's median rerun
+    """
+    totals = {page: np.median(times) for (page, section), times in samples.items() if section == TOTAL}
+    rows = []
+    for (page, section), times in samples.items():
+        if not times:
+            continue
+        row = {"page": page, "section": section, **percentile_row(times)}
+        total = totals.get(page)
+        row["share_of_p50"] = row["p50_ms"] / total if total and section != TOTAL else None
+        rows.append(row)
+    return sorted(rows, key=lambda r: (r["page"], r["section"] != TOTAL, -r["p90_ms"]))
+
+
+class MetricsStore:
+    """Thread-safe rolling windows of section times plus the rerun log"""
+
+    def __init__(self, log_path=LOG_PATH, window=WINDOW, max_log_mb=MAX_LOG_MB):
+        self.log_path = Path(log_path) if log_path else None
+        self.window = window
+        self.max_log_bytes = max_log_mb * 1e6
+        self.started_at = datetime.now().isoformat(timespec="seconds")
+        self.reruns = 0
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, rerun):
+        """Add one finished rerun (dict with page, total_ms and sections) to the windows and the log"""
+        with self._lock:
+            self.reruns += 1
+            items = list(rerun["sections"].items()) + [(TOTAL, rerun["total_ms"])]
+            for section, ms in items:
+                key = (rerun["page"], section)
+                if key not in self._samples:
+                    self._samples[key] = deque(maxlen=self.window)
+                self._samples[key].append(ms)
+            if self.log_path is not None:
+                self._append(rerun)
+
+    def _append(self, rerun):
+        self.log_path.parent.mkdir(parents=True, exist_ok=True)
+        if self.log_path.exists() and self.log_path.stat().st_size > self.max_log_bytes:
+            # Keep one previous file, so the log stays bounded on a long-running server
+            os.replace(self.log_path, self.log_path.with_suffix(".jsonl.1"))
+        with open(self.log_path, "a") as f:
+            f.write(json.dumps(rerun) + "\n")
+
+    def samples(self):
+        with self._lock:
+            return {key: list(values) for key, values in self._samples.items()}
+
+    def summary(self):
+        return summarize(self.samples())
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self.reruns = 0
+
+
+class RerunTimer:
+    """Marks the sections of one script rerun; a timer without a store does nothing"""
+
+    def __init__(self, store=None, session=None):
+        self.store = store
+        self.session = session
+        self.page = None
+        self.sections = {}
+        self._start = time.perf_counter()
+        self._current = None
+        self._current_start = self._start
+        self._finished = False
+
+    @property
+    def enabled(self):
+        return self.store is not None
+
+    def set_page(self, page):
+        self.page = page
+
+    def mark(self, name):
+        """Close the running section (if any) and start timing `name`"""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self._close(now)
+        self._current, self._current_start = name, now
+
+    def _close(self, now):
+        if self._current is not None:
+            # A section marked twice in one rerun (e.g. inside a loop) accumulates
+            self.sections[self._current] = self.sections.get(self._current, 0.0) + (now - self._current_start) * 1000
+            self._current = None
+
+    def finish(self):
+        """Close the last section and record the rerun once; returns the record (None if disabled)"""
+        if not self.enabled or self._finished:
+            return None
+        now = time.perf_counter()
+        self._close(now)
+        self._finished = True
+        rerun = {
+            "timestamp": datetime.now().isoformat(timespec="milliseconds"),
+            "session": self.session,
+            "page": self.page or "(none)",
+            "total_ms": (now - self._start) * 1000,
+            "sections": self.sections,
+        }
+        self.store.record(rerun)
+        return rerun
+
+
+def new_session_id():
+    return uuid.uuid4().hex[:8]
+
+
+def load_log(path=LOG_PATH, since=None, page=None):
+    """Reruns of the log (and its rotated predecessor), optionally filtered"""
+    path = Path(path)
+    reruns = []
+    for candidate in (path.with_suffix(".jsonl.1"), path):
+        if not candidate.exists():
+            continue
+        with open(candidate) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                rerun = json.loads(line)
+                if since and rerun["timestamp"] < since:
+                    continue
+                if page and rerun["page"] != page:
+                    continue
+                reruns.append(rerun)
+    return reruns
+
+
+def samples_from_log(reruns):
+    samples = {}
+    for rerun in reruns:
+        items = list(rerun["sections"].items()) + [(TOTAL, rerun["total_ms"])]
+        for section, ms in items:
+            samples.setdefault((rerun["page"], section), []).append(ms)
+    return samples
+
+
+def print_summary(rows):
+    print(f"{'page / section':<48} {'n':>6} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9} {'share':>6}")
+    for row in rows:
+        if row["section"] == TOTAL:
+            print(f"\n{row['page'][:48]:<48} {row['count']:>6} {row['p50_ms']:9.1f} {row['p90_ms']:9.1f} "
+                  f"{row['p99_ms']:9.1f} {row['max_ms']:9.1f}")
+            continue
+        share = f"{row['share_of_p50']:6.0%}" if row["share_of_p50"] is not None else f"{'-':>6}"
+        print(f"  {row['section'][:46]:<46} {row['count']:>6} {row['p50_ms']:9.1f} {row['p90_ms']:9.1f} "
+              f"{row['p99_ms']:9.1f} {row['max_ms']:9.1f} {share}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Percentiles of the app rerun log")
+    parser.add_argument("--log", default=str(LOG_PATH))
+    parser.add_argument("--page", default=None, help="Only this page")
+    parser.add_argument("--since", default=None, help="ISO date/time, e.g. 2026-10-01")
+    args = parser.parse_args()
+
+    reruns = load_log(args.log, args.since, args.page)
+    if not reruns:
+        print(f"ℹ️ No hay reruns en {args.log} (arranca la app con APP_METRICS=1)")
+        return
+    sessions = len({r["session"] for r in reruns})
+    print(f"⏱️ {len(reruns):,} reruns de {sessions} sesiones ({reruns[0]['timestamp']} → {reruns[-1]['timestamp']})")
+    print_summary(summarize(samples_from_log(reruns)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Schneider Electric Datathon - Explanation Archetypes
+Groups the test-set SHAP vectors into a handful of explanation archetypes with
+MiniBatchKMeans and stores, per archetype, its centroid, member count, outcome
+rates, defining drivers and a representative case (output/archetypes.json).
+
+New opportunities are assigned without recomputing SHAP: XGBoost's
+approximate path contributions (one pass over the trees, about the cost of a
+prediction) are compared against k per-archetype centroids of those same
+contributions, so the assignment itself is O(k).
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+
+ARCHETYPES_PATH = Path("output/archetypes.json")
+
+
+def approx_contributions(model, X):
+    """Per-feature path contributions (Saabas) from the booster, bias column dropped"""
+    import xgboost as xgb
+    booster = model.get_booster()
+    data = xgb.DMatrix(np.asarray(X, dtype=np.float32), feature_names=booster.feature_names)
+    return booster.predict(data, pred_contribs=True, approx_contribs=True)[:, :-1]
+
+
+def _nearest(vectors, centroids):
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float64))
+    d = (centroids ** 2).sum(axis=1) - 2 * vectors @ centroids.T
+    return np.argmin(d, axis=1)
+
+
+def _archetype_name(centroid, feature_names):
+    """Short label from the two strongest mean contributions"""
+    parts = []
+    for j in np.argsort(np.abs(centroid))[::-1][:2]:
+        parts.append(f"{'+' if centroid[j] > 0 else '-'} {feature_names[j]}")
+    return " / ".join(parts)
+
+
+def fit_archetypes(shap_values, X, y_true, y_prob, model, n_archetypes=8, threshold=0.5,
+                   batch_size=2048, seed=42):
+    """Cluster SHAP vectors and summarize each archetype"""
+    from sklearn.cluster import MiniBatchKMeans
+
+    shap_values = np.asarray(shap_values, dtype=np.float64)
+    y_true = np.asarray(y_true)
+    y_prob = np.asarray(y_prob, dtype=np.float64)
+    feature_names = list(X.columns)
+    case_ids = X.index.to_numpy()
+
+    kmeans = MiniBatchKMeans(n_clusters=n_archetypes, batch_size=batch_size, n_init=3,
+                             random_state=seed).fit(shap_values)
+    labels = kmeans.labels_
+    centroids = kmeans.cluster_centers_.astype(np.float64)
+
+    # Centroids in the cheap contribution space, used to assign new cases
+    contributions = approx_contributions(model, X).astype(np.float64)
+    fast_centroids = np.zeros_like(centroids)
+    for c in range(n_archetypes):
+        if (labels == c).any():
+            fast_centroids[c] = contributions[labels == c].mean(axis=0)
+    agreement = float((_nearest(contributions, fast_centroids) == labels).mean())
+
+    archetypes = []
+    for c in range(n_archetypes):
+        members = np.flatnonzero(labels == c)
+        if not len(members):
+            continue
+        distances = ((shap_values[members] - centroids[c]) ** 2).sum(axis=1)
+        top = np.argsort(np.abs(centroids[c]))[::-1][:5]
+        archetypes.append({
+            "id": int(c),
+            "name": _archetype_name(centroids[c], feature_names),
+            "size": int(len(members)),
+            "share": float(len(members) / len(labels)),
+            "win_rate": float(y_true[members].mean()),
+            "mean_probability": float(y_prob[members].mean()),
+            "predicted_win_rate": float((y_prob[members] >= threshold).mean()),
+            "representative_case": str(case_ids[members[np.argmin(distances)]]),
+            "top_drivers": [
+                {"feature": feature_names[j], "mean_shap": float(centroids[c, j])} for j in top
+            ],
+        })
+
+    return {
+        "n_archetypes": int(n_archetypes),
+        "feature_names": feature_names,
+        "centroids": centroids.tolist(),
+        "fast_centroids": fast_centroids.tolist(),
+        "fast_assignment_agreement": agreement,
+        "archetypes": archetypes,
+        "labels": {str(i): int(l) for i, l in zip(case_ids, labels)},
+    }
+
+
+def assign_from_shap(archetypes, shap_rows):
+    """Archetype of cases whose SHAP vectors are already known"""
+    return _nearest(shap_rows, np.asarray(archetypes["centroids"]))
+
+
+def assign(archetypes, model, X_rows):
+    """Archetype of new cases from path contributions, without SHAP"""
+    return _nearest(approx_contributions(model, X_rows), np.asarray(archetypes["fast_centroids"]))
+
+
+def save_archetypes(archetypes, path=ARCHETYPES_PATH):
+    with open(path, "w") as f:
+        json.dump(archetypes, f, indent=2)
+
+
+def load_archetypes(path=ARCHETYPES_PATH):
+    with open(path) as f:
+        return json.load(f)
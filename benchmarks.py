@@ -0,0 +1,464 @@
+# -*- coding: utf-8 -*-
+"""
+Schneider Electric Datathon - Benchmark Suite
+Repeatable timings of the pipeline and app hot paths, each at several data
+sizes with a fixed seed:
+
+    features        engineer_features + build_xy on raw rows
+    rebalance       SMOTETomek on an engineered training set
+    training        XGBClassifier with the pipeline parameters
+    shap_full       TreeExplainer.shap_values over a block of rows (section 7)
+    get_prediction  single-row scoring through the app's scorer, one call per row
+    whatif_shap     single-row SHAP of the What-If Simulator (full model / surrogate)
+    case_export     build_case_analysis + incremental export (section 9), cold and warm
+    load_case_json  reading output/json/<id>.json one case at a time (Case Explorer)
+
+Rows are drawn with replacement from dataset.csv (or --data, e.g. a file
+from synthetic_data.py) with the given seed, so a size can exceed the
+dataset. Model-dependent cases use the saved
+output/ artifacts (the same bundle the app loads) and are skipped when
+they are missing.
+
+Each result is appended as one JSON line to output/benchmarks/history.jsonl
+with the run id, git commit and environment. `compare` matches two runs
+case by case and flags those slower than --threshold (10% by default)
+whose repeats do not overlap the baseline's (overlapping ones are marked
+"noisy"); it exits with status 1 when there is a regression.
+
+Usage:
+    python benchmarks.py run                          # every case at its default sizes
+    python benchmarks.py run --cases training,shap_full --scale 0.5 --repeats 5
+    python benchmarks.py run --cases features,rebalance --scale 100 --data synthetic_100x.parquet
+    python benchmarks.py list
+    python benchmarks.py compare                      # latest run vs the one before
+    python benchmarks.py compare --baseline 20260101-120000 --threshold 0.05
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import warnings
+import subprocess
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+BENCHMARK_DIR = Path("output/benchmarks")
+HISTORY_PATH = BENCHMARK_DIR / "history.jsonl"
+DATA_PATH = "dataset.csv"
+
+
+# ------------------------------------------------------------
+# Data
+# ------------------------------------------------------------
+_raw_cache = {}
+
+
+def load_raw(path=None):
+    from features import load_dataset
+
+    path = path or DATA_PATH
+    if path not in _raw_cache:
+        _raw_cache[path] = load_dataset(path)
+    return _raw_cache[path]
+
+
+def sample_raw(n_rows, seed, path=None):
+    """n_rows raw opportunities drawn with replacement (fresh ids)"""
+    df = load_raw(path)
+    rows = df.iloc[np.random.default_rng(seed).integers(0, len(df), n_rows)].reset_index(drop=True)
+    rows["id"] = np.arange(len(rows))
+    return rows
+
+
+def sample_features(n_rows, seed, feature_names=None, path=None):
+    """Engineered (X, y) for n_rows sampled rows, restricted to feature_names"""
+    from features import engineer_features, build_xy
+    from feature_selection import load_selected_features
+
+    # Full-dataset median, as when scoring a batch, so rows do not depend on the sample size
+    median = load_raw(path)["cust_interactions"].median()
+    X, y = build_xy(engineer_features(sample_raw(n_rows, seed, path), interactions_median=median),
+                    feature_names or load_selected_features())
+    return X, y
+
+
+_bundle = None
+
+
+def load_bundle():
+    """The model bundle the app serves (registry ACTIVE version, else output/)"""
+    global _bundle
+    if _bundle is None:
+        from model_registry import HotSwapLoader
+        _bundle = HotSwapLoader().current()
+    return _bundle
+
+
+def _model_rows(n_rows, seed):
+    bundle = load_bundle()
+    X, _ = sample_features(n_rows, seed, bundle.feature_names)
+    return bundle, X
+
+
+# ------------------------------------------------------------
+# Cases: setup(n_rows, seed) -> state (untimed), run(state) (timed), optional teardown(state)
+# ------------------------------------------------------------
+def _setup_features(n_rows, seed):
+    return sample_raw(n_rows, seed)
+
+
+def _run_features(raw):
+    from features import engineer_features, build_xy
+    build_xy(engineer_features(raw))
+
+
+def _setup_rebalance(n_rows, seed):
+    return sample_features(n_rows, seed)
+
+
+def _run_rebalance(state):
+    from imblearn.combine import SMOTETomek
+    X, y = state
+    SMOTETomek(random_state=42).fit_resample(X, y)
+
+
+def _setup_training(n_rows, seed):
+    from tuning import load_best_params
+    X, y = sample_features(n_rows, seed)
+    return X, y, load_best_params()
+
+
+def _run_training(state):
+    from xgboost import XGBClassifier
+    X, y, params = state
+    XGBClassifier(**params).fit(X, y)
+
+
+def _setup_shap_full(n_rows, seed):
+    bundle, X = _model_rows(n_rows, seed)
+    return bundle.explainer, X
+
+
+def _run_shap_full(state):
+    explainer, X = state
+    explainer.shap_values(X)
+
+
+def _setup_get_prediction(n_rows, seed):
+    bundle, X = _model_rows(n_rows, seed)
+    return bundle.scorer, X.to_numpy(dtype=np.float32)
+
+
+def _run_get_prediction(state):
+    # Same call as get_prediction() in app_final.py
+    scorer, rows = state
+    for row in rows:
+        scorer.predict_proba(np.asarray([row], dtype=np.float32))
+
+
+def _setup_whatif_shap(n_rows, seed):
+    from distill import redraw_sliders
+    bundle, X = _model_rows(n_rows, seed)
+    moved = redraw_sliders(X, np.random.default_rng(seed))[bundle.feature_names]
+    return bundle, moved
+
+
+def _run_whatif_shap(state):
+    # Full-model path of the What-If Simulator: one explainer call per slider move
+    bundle, moved = state
+    for _, row in moved.iterrows():
+        bundle.explainer.shap_values(row.values.reshape(1, -1))
+
+
+def _run_whatif_shap_surrogate(state):
+    # Fast-preview path: exact TreeSHAP of the distilled surrogate
+    import xgboost as xgb
+    bundle, moved = state
+    booster = bundle.surrogate[0].get_booster()
+    for row in moved.to_numpy(dtype=np.float32):
+        booster.predict(xgb.DMatrix(row[None, :], feature_names=booster.feature_names), pred_contribs=True)
+
+
+_contribs_cache = {}
+
+
+def _contribs(bundle, X, seed):
+    """Exact SHAP (+ bias column) for X; rows already explained for this seed are reused"""
+    import xgboost as xgb
+
+    values = X.to_numpy(dtype=np.float32)
+    cached = _contribs_cache.get(seed)
+    # Draws with the same seed share their first rows, so a larger cached block covers smaller sizes
+    if cached is not None and len(cached[0]) >= len(values) and np.array_equal(cached[0][:len(values)], values):
+        return cached[1][:len(values)]
+    data = xgb.DMatrix(values, feature_names=bundle.feature_names)
+    contribs = bundle.model.get_booster().predict(data, pred_contribs=True)
+    _contribs_cache[seed] = (values, contribs)
+    return contribs
+
+
+def _setup_case_export(n_rows, seed):
+    from case_analysis import build_case_analysis
+
+    bundle, X = _model_rows(n_rows, seed)
+    contribs = _contribs(bundle, X, seed)
+    prob = bundle.model.predict_proba(X)[:, 1]
+    rows = list(X.iterrows())
+
+    def analyses():
+        for i, (idx, row) in enumerate(rows):
+            yield idx, build_case_analysis(idx, row, contribs[i, :-1], bundle.feature_names, float(prob[i]),
+                                           bundle.threshold, float(contribs[i, -1]))
+
+    return {"analyses": analyses, "dir": None}
+
+
+def _fresh_export_dir(state):
+    if state["dir"] is not None:
+        shutil.rmtree(state["dir"], ignore_errors=True)
+    state["dir"] = Path(tempfile.mkdtemp(prefix="bench_export_"))
+    (state["dir"] / "json").mkdir()
+
+
+def _remove_export_dir(state):
+    if state["dir"] is not None:
+        shutil.rmtree(state["dir"], ignore_errors=True)
+
+
+def _export(state):
+    from case_export import export_cases
+    export_dir = state["dir"]
+    export_cases(state["analyses"](), export_dir / "json", export_dir / "fp.json", export_dir / "cl.json",
+                 pending_path=export_dir / "pending.json")
+
+
+def _run_case_export(state):
+    # First export: every case is new and written
+    _fresh_export_dir(state)
+    _export(state)
+
+
+def _setup_case_export_warm(n_rows, seed):
+    state = _setup_case_export(n_rows, seed)
+    _run_case_export(state)
+    return state
+
+
+def _run_case_export_warm(state):
+    # Re-export with unchanged results: fingerprints compared, nothing written
+    _export(state)
+
+
+def _setup_load_case_json(n_rows, seed):
+    state = _setup_case_export_warm(n_rows, seed)
+    return {"ids": sorted(p.stem for p in (state["dir"] / "json").glob("*.json")), "dir": state["dir"]}
+
+
+def _run_load_case_json(state):
+    # Same reads as load_case_json() in app_final.py
+    json_dir = state["dir"] / "json"
+    for case_id in state["ids"]:
+        path = json_dir / f"{case_id}.json"
+        if path.exists():
+            with open(path) as f:
+                json.load(f)
+
+
+CASES = {
+    "features": {"setup": _setup_features, "run": _run_features, "sizes": [10_000, 40_000, 160_000]},
+    "rebalance": {"setup": _setup_rebalance, "run": _run_rebalance, "sizes": [5_000, 20_000, 40_000]},
+    "training": {"setup": _setup_training, "run": _run_training, "sizes": [5_000, 20_000]},
+    "shap_full": {"setup": _setup_shap_full, "run": _run_shap_full, "sizes": [100, 400]},
+    "get_prediction": {"setup": _setup_get_prediction, "run": _run_get_prediction, "sizes": [200, 1_000]},
+    "whatif_shap": {"setup": _setup_whatif_shap, "run": _run_whatif_shap, "sizes": [20, 50]},
+    "whatif_shap_surrogate": {"setup": _setup_whatif_shap, "run": _run_whatif_shap_surrogate, "sizes": [20, 50],
+                              "requires": "surrogate"},
+    "case_export": {"setup": _setup_case_export, "run": _run_case_export, "sizes": [500, 2_000],
+                    "teardown": _remove_export_dir},
+    "case_export_warm": {"setup": _setup_case_export_warm, "run": _run_case_export_warm, "sizes": [500, 2_000],
+                         "teardown": _remove_export_dir},
+    "load_case_json": {"setup": _setup_load_case_json, "run": _run_load_case_json, "sizes": [200, 1_000],
+                       "teardown": _remove_export_dir},
+}
+MODEL_CASES = {"shap_full", "get_prediction", "whatif_shap", "whatif_shap_surrogate", "case_export",
+               "case_export_warm", "load_case_json"}
+
+
+# ------------------------------------------------------------
+# Running and history
+# ------------------------------------------------------------
+def environment():
+    import xgboost
+    import sklearn
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "xgboost": xgboost.__version__,
+        "sklearn": sklearn.__version__,
+    }
+
+
+def run_case(name, n_rows, seed=42, repeats=3, warmup=1):
+    """Timings of one case at one size: median / min / all repeats and per-row cost"""
+    case = CASES[name]
+    state = case["setup"](n_rows, seed)
+    try:
+        for _ in range(warmup):
+            case["run"](state)
+        times = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            case["run"](state)
+            times.append(time.perf_counter() - start)
+    finally:
+        # Temporary folders (case export) are removed even if a run fails
+        if "teardown" in case:
+            case["teardown"](state)
+    median = float(np.median(times))
+    return {
+        "case": name,
+        "n_rows": int(n_rows),
+        "seed": seed,
+        "repeats": repeats,
+        "times_s": times,
+        "median_s": median,
+        "min_s": float(min(times)),
+        "per_row_ms": median * 1000 / n_rows,
+    }
+
+
+def run_suite(cases=None, scale=1.0, seed=42, repeats=3, tag=None, history_path=HISTORY_PATH, data=None):
+    """Run the selected cases at every default size times `scale`; appends to the history"""
+    global DATA_PATH
+    DATA_PATH = data or DATA_PATH
+    run_id = datetime.now().strftime("%Y%m%d-%H%M%S")
+    env = environment()
+    have_model = Path("output/model.pkl").exists() and Path("output/explainer.pkl").exists()
+    Path(history_path).parent.mkdir(parents=True, exist_ok=True)
+    results = []
+    for name in cases or list(CASES):
+        if name not in CASES:
+            raise ValueError(f"❌ Caso desconocido: {name} (disponibles: {', '.join(CASES)})")
+        if name in MODEL_CASES and not have_model:
+            print(f"⏭️ {name}: faltan los artefactos de output/ (ejecuta el pipeline)")
+            continue
+        if CASES[name].get("requires") == "surrogate" and load_bundle().surrogate is None:
+            print(f"⏭️ {name}: no hay surrogate (DISTILL_TREES=0)")
+            continue
+        for size in CASES[name]["sizes"]:
+            n_rows = max(1, int(round(size * scale)))
+            result = run_case(name, n_rows, seed=seed, repeats=repeats)
+            result.update(run_id=run_id, tag=tag, data=DATA_PATH, timestamp=datetime.now().isoformat(timespec="seconds"), env=env)
+            with open(history_path, "a") as f:
+                f.write(json.dumps(result) + "\n")
+            results.append(result)
+            spread = (max(result["times_s"]) - result["min_s"]) / result["median_s"] if result["median_s"] else 0.0
+            print(f"  {name:<22} {n_rows:>8,} filas  {result['median_s']:9.3f} s  "
+                  f"{result['per_row_ms']:9.4f} ms/fila  (±{spread:.0%})")
+    return run_id, results
+
+
+def load_history(path=HISTORY_PATH):
+    path = Path(path)
+    if not path.exists():
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare_runs(history, baseline=None, candidate=None, threshold=0.10, metric="median_s"):
+    """
+    Rows of (case, n_rows, baseline, candidate, ratio, status) for the cases
+    the two runs share. Defaults: candidate = latest run, baseline = the run
+    before it.
+    """
+    run_ids = sorted({r["run_id"] for r in history})
+    candidate = candidate or (run_ids[-1] if run_ids else None)
+    if baseline is None:
+        earlier = [r for r in run_ids if r < candidate]
+        baseline = earlier[-1] if earlier else None
+    if baseline is None or candidate is None:
+        raise ValueError("❌ Hacen falta al menos dos ejecuciones en el historial")
+
+    def by_key(run_id):
+        return {(r["case"], r["n_rows"], r["seed"], r.get("data", "dataset.csv")): r
+                for r in history if r["run_id"] == run_id}
+
+    base, cand = by_key(baseline), by_key(candidate)
+    rows = []
+    for key in sorted(set(base) & set(cand)):
+        ratio = cand[key][metric] / base[key][metric] if base[key][metric] > 0 else float("inf")
+        if ratio > 1 + threshold:
+            # Overlapping repeat ranges are reported as noise, not as a regression
+            slower = min(cand[key]["times_s"]) > max(base[key]["times_s"])
+            status = "REGRESSION" if slower else "noisy"
+        else:
+            status = "improved" if ratio < 1 - threshold else "ok"
+        rows.append((key[0], key[1], base[key][metric], cand[key][metric], ratio, status))
+    return baseline, candidate, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark suite for the pipeline and app hot paths")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("run")
+    p.add_argument("--cases", default=None, help="Comma-separated case names (default: all)")
+    p.add_argument("--scale", type=float, default=1.0, help="Multiplier on every default size")
+    p.add_argument("--seed", type=int, default=42)
+    p.add_argument("--repeats", type=int, default=3)
+    p.add_argument("--tag", default=None, help="Free-text label stored with the results")
+    p.add_argument("--data", default=DATA_PATH, help="Raw rows to sample from (CSV / Parquet)")
+    p.add_argument("--history", default=str(HISTORY_PATH))
+    sub.add_parser("list")
+    p = sub.add_parser("compare")
+    p.add_argument("--baseline", default=None, help="Run id (default: the run before the candidate)")
+    p.add_argument("--candidate", default=None, help="Run id (default: latest)")
+    p.add_argument("--threshold", type=float, default=0.10, help="Relative slowdown flagged as a regression")
+    p.add_argument("--metric", choices=["median_s", "min_s"], default="median_s")
+    p.add_argument("--history", default=str(HISTORY_PATH))
+    args = parser.parse_args()
+    warnings.filterwarnings("ignore")
+
+    if args.command == "list":
+        for name, case in CASES.items():
+            sizes = ", ".join(f"{s:,}" for s in case["sizes"])
+            print(f"  {name:<22} tamaños {sizes}" + ("  (usa output/)" if name in MODEL_CASES else ""))
+        return
+
+    if args.command == "run":
+        cases = args.cases.split(",") if args.cases else None
+        print(f"⏱️ Benchmarks sobre {args.data} (seed {args.seed}, x{args.scale} tamaños, {args.repeats} repeticiones)")
+        run_id, results = run_suite(cases, args.scale, args.seed, args.repeats, args.tag, args.history, args.data)
+        print(f"✅ Run {run_id}: {len(results)} resultados en {args.history}")
+        return
+
+    baseline, candidate, rows = compare_runs(load_history(args.history), args.baseline, args.candidate,
+                                             args.threshold, args.metric)
+    print(f"📊 {candidate} vs {baseline} ({args.metric}, umbral {args.threshold:.0%})")
+    for case, n_rows, base, cand, ratio, status in rows:
+        flag = {"REGRESSION": "❌", "noisy": "⚠️", "improved": "✅"}.get(status, "  ")
+        print(f"{flag} {case:<22} {n_rows:>8,} filas  {base:9.3f} s → {cand:9.3f} s  x{ratio:5.2f}  {status}")
+    regressions = sum(1 for row in rows if row[-1] == "REGRESSION")
+    print(f"{regressions} regresiones de {len(rows)} casos comparados")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Schneider Electric Datathon - Bootstrap Confidence Intervals
+Vectorized bootstrap of the reported test metrics. Each batch of replicates is
+a (replicates x rows) matrix of resampling counts, so the confusion matrix of
+every replicate is a matrix-vector product and AUC is a cumulative sum over the
+probability-sorted columns. No Python loop runs per replicate.
+"""
+
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+METRICS = ["f1_score", "auc", "precision", "recall", "accuracy"]
+
+
+def _resample_counts(rng, n_rows, n_boot):
+    """(n_boot, n_rows) matrix with how many times each row was drawn"""
+    idx = rng.integers(0, n_rows, size=(n_boot, n_rows))
+    idx += (np.arange(n_boot) * n_rows)[:, None]
+    return np.bincount(idx.ravel(), minlength=n_boot * n_rows).reshape(n_boot, n_rows).astype(np.float32)
+
+
+def _bootstrap_batch(y_true, y_prob, threshold, n_boot, seed):
+    """Metrics for one batch of replicates; returns {metric: array(n_boot)}"""
+    rng = np.random.default_rng(seed)
+    y_true = np.asarray(y_true, dtype=bool)
+    y_prob = np.asarray(y_prob, dtype=float)
+    counts = _resample_counts(rng, len(y_true), n_boot)
+
+    y_pred = y_prob >= threshold
+    tp = counts @ (y_pred & y_true).astype(np.float32)
+    fp = counts @ (y_pred & ~y_true).astype(np.float32)
+    fn = counts @ (~y_pred & y_true).astype(np.float32)
+    n_pos = counts @ y_true.astype(np.float32)
+    n_total = float(len(y_true))
+    tn = n_total - n_pos - fp
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(tp + fp > 0, tp / (tp + fp), 0.0)
+        recall = np.where(n_pos > 0, tp / n_pos, 0.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+
+    # AUC (Mann-Whitney) on weighted rows; tied probabilities are grouped and count half
+    order = np.argsort(y_prob, kind="mergesort")
+    sorted_prob = y_prob[order]
+    starts = np.flatnonzero(np.r_[True, sorted_prob[1:] != sorted_prob[:-1]])
+    sorted_counts = counts[:, order]
+    sorted_pos = y_true[order]
+    pos_w = np.add.reduceat(sorted_counts * sorted_pos, starts, axis=1)
+    neg_w = np.add.reduceat(sorted_counts * ~sorted_pos, starts, axis=1)
+    neg_below = np.cumsum(neg_w, axis=1, dtype=np.float64) - neg_w
+    n_neg = n_total - n_pos
+    with np.errstate(divide="ignore", invalid="ignore"):
+        auc = (pos_w * (neg_below + 0.5 * neg_w)).sum(axis=1) / (n_pos * n_neg)
+
+    return {
+        "f1_score": f1,
+        "auc": auc,
+        "precision": precision,
+        "recall": recall,
+        "accuracy": (tp + tn) / n_total,
+    }
+
+
+def bootstrap_metrics(y_true, y_prob, threshold, n_boot=2000, batch_size=250, workers=1, seed=42):
+    """
+    Draw n_boot bootstrap replicates of (y_true, y_prob) and return the metric
+    distributions as {metric: array(n_boot)}.
+
+    Replicates are generated in batches of batch_size (memory is
+    batch_size x rows counts); with workers > 1 the batches run in a process pool.
+    """
+    y_true = np.asarray(y_true)
+    y_prob = np.asarray(y_prob)
+    sizes = [min(batch_size, n_boot - start) for start in range(0, n_boot, batch_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    jobs = [(y_true, y_prob, threshold, size, child) for size, child in zip(sizes, seeds)]
+
+    if workers and workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            results = list(pool.map(_bootstrap_batch, *zip(*jobs)))
+    else:
+        results = [_bootstrap_batch(*job) for job in jobs]
+
+    return {name: np.concatenate([r[name] for r in results]) for name in METRICS}
+
+
+def confidence_intervals(y_true, y_prob, threshold, n_boot=2000, confidence=0.95,
+                         batch_size=250, workers=1, seed=42):
+    """Percentile intervals for every reported metric, ready for global_insights.json"""
+    start = time.perf_counter()
+    samples = bootstrap_metrics(
+        y_true, y_prob, threshold,
+        n_boot=n_boot, batch_size=batch_size, workers=workers, seed=seed
+    )
+    alpha = (1.0 - confidence) / 2.0
+    intervals = {}
+    for name, values in samples.items():
+        values = values[np.isfinite(values)]
+        intervals[name] = {
+            "low": float(np.quantile(values, alpha)),
+            "high": float(np.quantile(values, 1.0 - alpha)),
+            "std": float(values.std(ddof=1)),
+        }
+    return {
+        "confidence": confidence,
+        "n_bootstrap": int(n_boot),
+        "threshold": float(threshold),
+        "seconds": time.perf_counter() - start,
+        "metrics": intervals,
+    }
+
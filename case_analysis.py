@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Schneider Electric Datathon - Per-Case Analysis
+Builds the opportunity analysis written to output/json/<id>.json by the
+pipeline and returned by the scoring service, so both share one shape.
+"""
+
+import numpy as np
+
+FACTOR_EXPLANATIONS = {
+    "customer_activity": "Nivel global de actividad del cliente",
+    "customer_engagement": "Interacciones y calidad de relación con el cliente",
+    "total_competitors": "Número total de competidores presentes",
+    "competitor_diversity": "Diversidad de competidores en la oferta",
+    "opp_old": "Antigüedad de la oportunidad",
+    "opp_maturity": "Madurez de la oportunidad",
+    "opp_quality_score": "Score agregado de calidad de oportunidad",
+    "product_A_ratio": "Peso de ventas históricas de Product A",
+    "total_past_sales": "Volumen total de ventas históricas",
+    "cust_hitrate": "Tasa de éxito histórica con el cliente",
+    "cust_interactions": "Número de interacciones con el cliente",
+    "cust_contracts": "Número de contratos con el cliente",
+    "has_competition": "Indicador de presencia de competencia",
+    "competition_risk": "Riesgo asociado a la competencia",
+    "product_mix": "Diversidad de productos activos",
+    "product_count": "Número de líneas de producto en la oportunidad",
+    "iberia_competition": "Competencia en clientes de Iberia",
+    "iberia_engagement": "Engagement de clientes de Iberia"
+}
+
+
+def get_factor_explanation(feature_name: str) -> str:
+    return FACTOR_EXPLANATIONS.get(feature_name, feature_name.replace("_", " ").title())
+
+
+def threshold_confidence(prob, threshold):
+    """High / Medium / Low from the distance to the decision threshold"""
+    return "High" if abs(prob - threshold) > 0.3 else ("Medium" if abs(prob - threshold) > 0.15 else "Low")
+
+
+def build_case_analysis(case_id, x_row, shap_row, feature_names, prob, threshold, base_value,
+                        actual=None, confidence=None, uncertainty=None, top_k=5):
+    """
+    Analysis dict for one opportunity.
+
+    `actual` is None for open opportunities; `shap_row` None leaves
+    shap_analysis empty; `confidence` overrides the threshold-distance rule
+    (e.g. with the ensemble's dispersion-based level).
+    """
+    pred = int(prob >= threshold)
+
+    shap_analysis = None
+    if shap_row is not None:
+        shap_pairs = list(zip(feature_names, shap_row))
+        shap_sorted = sorted(shap_pairs, key=lambda x: abs(x[1]), reverse=True)
+        top_positive = [(f, float(v)) for f, v in shap_sorted if v > 0][:top_k]
+        top_negative = [(f, float(v)) for f, v in shap_sorted if v < 0][:top_k]
+        shap_analysis = {
+            "base_value": float(base_value),
+            "prediction_value": float(base_value + np.asarray(shap_row).sum()),
+            "top_positive_factors": [
+                {
+                    "feature": feat,
+                    "shap_value": val,
+                    "explanation": get_factor_explanation(feat)
+                }
+                for feat, val in top_positive
+            ],
+            "top_negative_factors": [
+                {
+                    "feature": feat,
+                    "shap_value": val,
+                    "explanation": get_factor_explanation(feat)
+                }
+                for feat, val in top_negative
+            ]
+        }
+
+    if x_row.get("total_competitors", 0) > 0:
+        competitive_action = "Monitor competitive landscape and adjust pricing/offer."
+    else:
+        competitive_action = "Capitalize on the lack of competition to close fast."
+
+    return {
+        "opportunity_id": str(case_id),
+        "prediction": {
+            "predicted_outcome": "Win" if pred == 1 else "Loss",
+            "actual_outcome": None if actual is None else ("Win" if actual == 1 else "Loss"),
+            "win_probability": float(prob),
+            "threshold": float(threshold),
+            "confidence": confidence or threshold_confidence(prob, threshold),
+            "uncertainty": uncertainty
+        },
+        "key_features": {
+            "customer_activity": float(x_row.get("customer_activity", 0.0)),
+            "total_competitors": float(x_row.get("total_competitors", 0.0)),
+            "opp_quality_score": float(x_row.get("opp_quality_score", 0.0)),
+            "cust_hitrate": float(x_row.get("cust_hitrate", 0.0)),
+            "product_A_ratio": float(x_row.get("product_A_ratio", 0.0))
+        },
+        "shap_analysis": shap_analysis,
+        "business_recommendation": {
+            "action": (
+                "Accelerate"
+                if prob > 0.7 else
+                ("Nurture" if prob > 0.4 else "Re-evaluate")
+            ),
+            "priority": (
+                "High"
+                if prob > 0.7 else
+                ("Medium" if prob > 0.4 else "Low")
+            ),
+            "next_steps": [
+                "Leverage existing engagement" if prob > 0.5 else "Increase touchpoints and engagement",
+                "Maintain momentum with key stakeholders" if pred == 1 else "Clarify blockers with decision-makers",
+                competitive_action
+            ]
+        }
+    }
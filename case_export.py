@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""
+Schneider Electric Datathon - Incremental Case Export
+Writes output/json/<id>.json only for opportunities whose result actually
+changed since the previous run. Each case is reduced to a compact
+fingerprint (probability bucket, predicted outcome, confidence, action,
+priority and its main driver each way) and compared with the fingerprints
+saved by the last export:
+
+    output/case_fingerprints.json        {id: fingerprint} from the last export
+    output/case_changelog.json           added / changed / removed IDs of this run
+    output/case_pending_enrichment.json  IDs still waiting for LLM next steps, oldest first
+
+Unchanged cases keep their file (including any LLM-enriched next steps);
+with full=True they are rewritten with those next steps carried over.
+Removed cases have their file deleted. Files are replaced, never rewritten
+in place (write_case): the model registry hard-links them into each
+published version.
+
+Every case written without LLM next steps (added, changed, or rewritten
+after its file went missing) joins the pending list, and only the Gemini
+stage takes cases off it (mark_enriched). Cases beyond the Gemini cap or
+whose call failed are therefore retried on the next run.
+
+Drivers are factor families (customer, competition, ...), not single
+features: after a retrain, SHAP credit moves freely between correlated
+columns such as customer_activity / customer_engagement / cust_hitrate,
+which would flag most cases as changed while the story told is the same.
+A direction with no material family (below DRIVER_MIN_SHAP log-odds) has
+no driver.
+
+Usage:
+    python case_export.py            # summary of the last changelog
+"""
+
+import os
+import json
+import argparse
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+from threshold_curve import BUCKET_EDGES, BUCKET_LABELS
+
+FINGERPRINTS_PATH = Path("output/case_fingerprints.json")
+CHANGELOG_PATH = Path("output/case_changelog.json")
+PENDING_PATH = Path("output/case_pending_enrichment.json")
+# business_recommendation fields written by the LLM stage
+LLM_FIELDS = ["next_steps", "ai_generated"]
+DRIVER_MIN_SHAP = 0.25
+
+FACTOR_FAMILIES = {
+    "customer": [
+        "cust_hitrate", "cust_interactions", "cust_contracts", "customer_activity", "customer_engagement",
+        "contract_hitrate_ratio", "hitrate_interaction", "hitrate_contracts", "low_engagement_risk",
+        "iberia_engagement",
+    ],
+    "competition": [
+        "competitor_X", "competitor_Y", "competitor_Z", "total_competitors", "has_competition",
+        "competitor_diversity", "competition_engagement", "competition_risk", "iberia_competition",
+    ],
+    "opportunity": [
+        "opp_old", "opp_age_squared", "opp_maturity", "is_new_opp", "is_mature_opp", "opp_quality_score",
+        "opp_month",
+    ],
+    "sales_history": [
+        "product_A_sold_in_the_past", "product_B_sold_in_the_past", "total_past_sales", "product_A_ratio",
+        "has_past_sales",
+    ],
+    "offer": ["product_A_recommended", "product_A", "product_C", "product_D", "product_mix", "product_count"],
+    "region": ["cust_in_iberia"],
+}
+FEATURE_FAMILY = {feature: family for family, features in FACTOR_FAMILIES.items() for feature in features}
+
+
+def probability_bucket(prob):
+    """Low / Medium / High / Very High on (low, high] intervals, as in the global insights"""
+    bucket = int(np.clip(np.searchsorted(BUCKET_EDGES, prob, side="left") - 1, 0, len(BUCKET_LABELS) - 1))
+    return BUCKET_LABELS[bucket]
+
+
+def main_driver(factors, min_shap=DRIVER_MIN_SHAP):
+    """Factor family with the largest summed SHAP among the listed factors, or None if not material"""
+    totals = {}
+    for item in factors:
+        family = FEATURE_FAMILY.get(item["feature"], item["feature"])
+        totals[family] = totals.get(family, 0.0) + abs(item["shap_value"])
+    if not totals:
+        return None
+    family, total = max(totals.items(), key=lambda kv: kv[1])
+    return family if total >= min_shap else None
+
+
+def case_fingerprint(analysis):
+    """Fields of a case analysis that matter downstream; numeric drift inside them is ignored"""
+    prediction = analysis["prediction"]
+    recommendation = analysis["business_recommendation"]
+    shap_analysis = analysis.get("shap_analysis") or {}
+    return {
+        "bucket": probability_bucket(prediction["win_probability"]),
+        "outcome": prediction["predicted_outcome"],
+        "confidence": prediction["confidence"],
+        "action": recommendation["action"],
+        "priority": recommendation["priority"],
+        "driver_up": main_driver(shap_analysis.get("top_positive_factors", [])),
+        "driver_down": main_driver(shap_analysis.get("top_negative_factors", [])),
+    }
+
+
+def load_fingerprints(path=FINGERPRINTS_PATH):
+    """{id: fingerprint} of the previous export, or None on the first run"""
+    path = Path(path)
+    if not path.exists():
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def load_changelog(path=CHANGELOG_PATH):
+    path = Path(path)
+    if not path.exists():
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def load_pending(path=PENDING_PATH):
+    """IDs waiting for LLM enrichment, oldest first, or None before the first tracked export"""
+    path = Path(path)
+    if not path.exists():
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def is_enriched(analysis):
+    return bool((analysis.get("business_recommendation") or {}).get("ai_generated"))
+
+
+def _read_case(path):
+    if not path.exists():
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def _carry_llm_fields(old, analysis):
+    """Keep the LLM next steps of an unchanged case when its file is rewritten"""
+    if old is not None and is_enriched(old):
+        for key in LLM_FIELDS:
+            analysis["business_recommendation"][key] = old["business_recommendation"][key]
+
+
+def write_case(path, analysis):
+    """Write one case JSON through a temporary file and os.replace"""
+    tmp_path = Path(f"{path}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(analysis, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def export_cases(analyses, json_dir="output/json", fingerprints_path=FINGERPRINTS_PATH,
+                 changelog_path=CHANGELOG_PATH, full=False, pending_path=PENDING_PATH):
+    """
+    Write the analyses (iterable of (case_id, analysis)) whose fingerprint
+    changed, delete the JSON of cases no longer present and save the new
+    fingerprints, the changelog and the pending-enrichment list. With
+    full=True every case is rewritten (the changelog still reports real
+    changes). Returns the changelog.
+    """
+    json_dir = Path(json_dir)
+    previous = load_fingerprints(fingerprints_path)
+    known = previous or {}
+    current = {}
+    added, changed, written = [], [], 0
+    kept, unenriched = [], []
+
+    for case_id, analysis in analyses:
+        case_id = str(case_id)
+        fingerprint = case_fingerprint(analysis)
+        current[case_id] = fingerprint
+        path = json_dir / f"{case_id}.json"
+        old = known.get(case_id)
+        if old is None:
+            added.append(case_id)
+        elif old != fingerprint:
+            changed.append({"id": case_id, "fields": sorted(k for k in fingerprint if fingerprint[k] != old.get(k))})
+        elif not full and path.exists():
+            kept.append(case_id)
+            continue
+        else:
+            _carry_llm_fields(_read_case(path), analysis)
+        write_case(path, analysis)
+        written += 1
+        if not is_enriched(analysis):
+            unenriched.append(case_id)
+
+    removed = sorted(set(known) - set(current))
+    for case_id in removed:
+        path = json_dir / f"{case_id}.json"
+        if path.exists():
+            os.remove(path)
+
+    old_pending = load_pending(pending_path)
+    if old_pending is None:
+        # First export that tracks enrichment: the kept files tell which cases already have it
+        old_pending = [case_id for case_id in kept if not is_enriched(_read_case(json_dir / f"{case_id}.json"))]
+    still_pending = set(kept) | set(unenriched)
+    pending = [case_id for case_id in old_pending if case_id in still_pending]
+    queued = set(pending)
+    pending += [case_id for case_id in unenriched if case_id not in queued]
+
+    changelog = {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "first_run": previous is None,
+        "counts": {
+            "added": len(added), "changed": len(changed), "removed": len(removed),
+            "unchanged": len(current) - len(added) - len(changed), "written": written,
+            "pending_enrichment": len(pending),
+        },
+        "added": added,
+        "changed": changed,
+        "removed": removed,
+    }
+    with open(fingerprints_path, "w") as f:
+        json.dump(current, f)
+    with open(changelog_path, "w") as f:
+        json.dump(changelog, f, indent=2)
+    with open(pending_path, "w") as f:
+        json.dump(pending, f)
+    return changelog
+
+
+def cases_to_enrich(pending_path=PENDING_PATH):
+    """IDs the LLM stage should process, oldest first"""
+    return load_pending(pending_path) or []
+
+
+def mark_enriched(case_ids, pending_path=PENDING_PATH):
+    """Take the cases the LLM stage enriched off the pending list; returns how many remain"""
+    done = {str(case_id) for case_id in case_ids}
+    pending = [case_id for case_id in cases_to_enrich(pending_path) if case_id not in done]
+    with open(pending_path, "w") as f:
+        json.dump(pending, f)
+    return len(pending)
+
+
+def print_changelog(changelog):
+    counts = changelog["counts"]
+    print(f"  nuevos {counts['added']} · cambiados {counts['changed']} · eliminados {counts['removed']} · "
+          f"sin cambios {counts['unchanged']} → {counts['written']} JSON escritos")
+    if counts.get("pending_enrichment") is not None:
+        print(f"  pendientes de enriquecer con LLM: {counts['pending_enrichment']}")
+    if changelog["changed"]:
+        fields = {}
+        for item in changelog["changed"]:
+            for field in item["fields"]:
+                fields[field] = fields.get(field, 0) + 1
+        print("  cambios por campo: " + ", ".join(f"{k} {v}" for k, v in sorted(fields.items(), key=lambda kv: -kv[1])))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summary of the last incremental case export")
+    parser.add_argument("--changelog", default=str(CHANGELOG_PATH))
+    parser.add_argument("--ids", action="store_true", help="Also list the IDs pending LLM enrichment")
+    args = parser.parse_args()
+
+    changelog = load_changelog(args.changelog)
+    if changelog is None:
+        print(f"ℹ️ No hay changelog en {args.changelog} (aún no se ha exportado)")
+        return
+    print(f"🗂️ Export de {changelog['generated_at']}" + (" (primera ejecución)" if changelog["first_run"] else ""))
+    print_changelog(changelog)
+    if args.ids:
+        print("\n".join(cases_to_enrich()))
+
+
+if __name__ == "__main__":
+    main()
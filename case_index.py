@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+Schneider Electric Datathon - Case Index
+Compact columnar index with one row per test opportunity (ID, probability,
+predicted/actual outcome, confidence, action, priority, top SHAP factor),
+written by the pipeline to output/case_index.parquet.
+
+The app keeps a CaseIndex in memory: filters are vectorized boolean masks and
+every sortable column has its argsort computed once, so a sorted, filtered
+page is an O(n) mask over a precomputed order instead of a fresh sort.
+"""
+
+import numpy as np
+import pandas as pd
+
+CASE_INDEX_PATH = "output/case_index.parquet"
+SORTABLE_COLUMNS = ["opportunity_id", "win_probability", "confidence", "priority", "top_factor_shap"]
+
+CONFIDENCE_LEVELS = ["Low", "Medium", "High"]
+ACTIONS = ["Re-evaluate", "Nurture", "Accelerate"]
+PRIORITIES = ["Low", "Medium", "High"]
+OUTCOMES = ["Loss", "Win"]
+
+
+def build_case_index(case_ids, y_prob, y_true, shap_values, feature_names, threshold, confidence=None):
+    """
+    Vectorized version of the per-case rules used for output/json/<id>.json.
+    `confidence` (Low / Medium / High per case, e.g. from the ensemble) overrides
+    the distance-to-threshold rule.
+    """
+    y_prob = np.asarray(y_prob, dtype=np.float64)
+    y_true = np.asarray(y_true).astype(np.int8)
+    shap_values = np.asarray(shap_values)
+    predicted = (y_prob >= threshold).astype(np.int8)
+
+    if confidence is None:
+        margin = np.abs(y_prob - threshold)
+        confidence = np.where(margin > 0.3, 2, np.where(margin > 0.15, 1, 0))
+    else:
+        confidence = pd.Categorical(np.asarray(confidence, dtype=str), CONFIDENCE_LEVELS).codes
+    # Accelerate / Nurture / Re-evaluate and High / Medium / Low share the cut-offs
+    tier = np.where(y_prob > 0.7, 2, np.where(y_prob > 0.4, 1, 0))
+
+    top = np.abs(shap_values).argmax(axis=1)
+    return pd.DataFrame({
+        "opportunity_id": np.asarray(case_ids),
+        "win_probability": y_prob.astype(np.float32),
+        "predicted_outcome": pd.Categorical.from_codes(predicted, OUTCOMES, ordered=True),
+        "actual_outcome": pd.Categorical.from_codes(y_true, OUTCOMES, ordered=True),
+        "confidence": pd.Categorical.from_codes(confidence, CONFIDENCE_LEVELS, ordered=True),
+        "action": pd.Categorical.from_codes(tier, ACTIONS, ordered=True),
+        "priority": pd.Categorical.from_codes(tier, PRIORITIES, ordered=True),
+        "top_factor": pd.Categorical.from_codes(top, list(feature_names)),
+        "top_factor_shap": shap_values[np.arange(len(top)), top].astype(np.float32),
+    })
+
+
+def save_case_index(index, path=CASE_INDEX_PATH):
+    index.to_parquet(path, index=False)
+
+
+def load_case_index(path=CASE_INDEX_PATH):
+    return pd.read_parquet(path)
+
+
+class CaseIndex:
+    """In-memory case index with cached sort orders"""
+
+    def __init__(self, frame):
+        self.frame = frame.reset_index(drop=True)
+        self._orders = {}
+        self._id_to_row = None
+        self._id_strings = None
+
+    def __len__(self):
+        return len(self.frame)
+
+    def ids(self):
+        return self.frame["opportunity_id"].to_numpy()
+
+    def row_of(self, case_id):
+        """Row position of an opportunity ID, or None"""
+        if self._id_to_row is None:
+            self._id_to_row = pd.Index(self.ids())
+        try:
+            return int(self._id_to_row.get_loc(case_id))
+        except KeyError:
+            return None
+
+    def id_prefix_rows(self, prefix):
+        """Row positions whose ID starts with prefix (binary search over sorted ID strings)"""
+        if self._id_strings is None:
+            strings = self.ids().astype(str)
+            order = np.argsort(strings, kind="stable")
+            self._id_strings = (strings[order], order)
+        strings, order = self._id_strings
+        lo = np.searchsorted(strings, prefix, side="left")
+        hi = np.searchsorted(strings, prefix + "\uffff", side="left")
+        return order[lo:hi]
+
+    def order(self, column):
+        """Ascending argsort of a column, computed once"""
+        if column not in self._orders:
+            values = self.frame[column]
+            keys = values.cat.codes.to_numpy() if isinstance(values.dtype, pd.CategoricalDtype) else values.to_numpy()
+            self._orders[column] = np.argsort(keys, kind="stable")
+        return self._orders[column]
+
+    def mask(self, prob_range=(0.0, 1.0), predicted=None, actual=None, confidence=None,
+             actions=None, priorities=None, top_factors=None, id_query=None):
+        """Boolean mask of the rows matching every given filter (None = no filter; IDs match by prefix)"""
+        frame = self.frame
+        prob = frame["win_probability"].to_numpy()
+        keep = (prob >= prob_range[0]) & (prob <= prob_range[1])
+        for column, allowed in [("predicted_outcome", predicted), ("actual_outcome", actual),
+                                ("confidence", confidence), ("action", actions),
+                                ("priority", priorities), ("top_factor", top_factors)]:
+            if allowed:
+                categories = frame[column].cat.categories
+                codes = [categories.get_loc(value) for value in allowed if value in categories]
+                keep &= np.isin(frame[column].cat.codes.to_numpy(), codes)
+        if id_query:
+            by_id = np.zeros(len(frame), dtype=bool)
+            by_id[self.id_prefix_rows(str(id_query).strip())] = True
+            keep &= by_id
+        return keep
+
+    def query(self, mask, sort_by="win_probability", ascending=False, page=1, page_size=50):
+        """(page DataFrame, number of matching rows) for a sorted, filtered view"""
+        order = self.order(sort_by)
+        if not ascending:
+            order = order[::-1]
+        rows = order[mask[order]]
+        start = (page - 1) * page_size
+        return self.frame.iloc[rows[start:start + page_size]], int(len(rows))
@@ -194,6 +194,12 @@ best_params = {
     "use_label_encoder": False
 }
 
+# Override with the result of tuning.py when a tuning run is available
+tuned_params_path = Path("output/tuning/best_params.json")
+if tuned_params_path.exists():
+    with open(tuned_params_path) as f:
+        best_params.update(json.load(f))
+
 xgb_model = XGBClassifier(**best_params)
 xgb_model.fit(X_train_bal, y_train_bal)
 
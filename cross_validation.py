@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+Schneider Electric Datathon - Cross-Validation & Threshold Stability
+Trains the k folds in parallel processes (each with its own SMOTETomek and
+XGBoost model), pools the out-of-fold probabilities and picks the decision
+threshold on the pooled predictions instead of a single train/test split.
+
+Usage:
+    python cross_validation.py --folds 5 --workers 5
+"""
+
+import os
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from xgboost import XGBClassifier
+from sklearn.model_selection import StratifiedKFold, train_test_split
+from sklearn.metrics import (
+    f1_score, roc_auc_score, precision_score,
+    recall_score, accuracy_score, precision_recall_curve
+)
+from imblearn.combine import SMOTETomek
+
+from tuning import load_best_params
+
+CV_DIR = Path("output/cv")
+
+
+def best_f1_threshold(y_true, y_prob):
+    """Threshold maximizing F1 on the precision-recall curve (same rule as the pipeline)"""
+    precisions, recalls, thresholds = precision_recall_curve(y_true, y_prob)
+    f1_scores = 2 * precisions * recalls / (precisions + recalls + 1e-10)
+    best_idx = np.argmax(f1_scores)
+    return float(thresholds[best_idx]) if len(thresholds) > 0 else 0.5
+
+
+def classification_metrics(y_true, y_prob, threshold):
+    """Metrics reported in global_insights.json, at a given threshold"""
+    y_pred = (y_prob >= threshold).astype(int)
+    return {
+        "threshold": float(threshold),
+        "f1_score": float(f1_score(y_true, y_pred)),
+        "auc": float(roc_auc_score(y_true, y_prob)),
+        "precision": float(precision_score(y_true, y_pred, zero_division=0)),
+        "recall": float(recall_score(y_true, y_pred)),
+        "accuracy": float(accuracy_score(y_true, y_pred)),
+    }
+
+
+# ------------------------------------------------------------
+# WORKER PROCESS
+# ------------------------------------------------------------
+_worker_data = {}
+
+
+def _init_worker(X, y):
+    _worker_data.update(X=X, y=y)
+
+
+def _fit_fold(fold, train_idx, val_idx, params, random_state):
+    """Resample, train and score one fold; returns out-of-fold probabilities"""
+    start = time.perf_counter()
+    X, y = _worker_data["X"], _worker_data["y"]
+    X_bal, y_bal = SMOTETomek(random_state=random_state + fold).fit_resample(X[train_idx], y[train_idx])
+
+    model = XGBClassifier(**{**params, "n_jobs": 1})
+    model.fit(X_bal, y_bal)
+    prob = model.predict_proba(X[val_idx])[:, 1]
+    return fold, prob, time.perf_counter() - start
+
+
+# ------------------------------------------------------------
+# CROSS-VALIDATION
+# ------------------------------------------------------------
+def _summary(values):
+    values = np.asarray(values, dtype=float)
+    return {"mean": float(values.mean()), "std": float(values.std(ddof=1)) if len(values) > 1 else 0.0,
+            "min": float(values.min()), "max": float(values.max())}
+
+
+def run_cross_validation(X, y, params=None, n_splits=5, workers=None, random_state=42, output_dir=CV_DIR):
+    """
+    Run stratified k-fold CV in worker processes and persist the report.
+
+    Returns a dict with per-fold metrics (at each fold's own F1-optimal threshold
+    and at the pooled threshold), their mean/std, and the pooled out-of-fold result.
+    """
+    params = dict(params or load_best_params())
+    workers = min(n_splits, workers or os.cpu_count() or 1)
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    X_arr = np.asarray(X, dtype=np.float32)
+    y_arr = np.asarray(y).astype(int)
+    splits = list(StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=random_state).split(X_arr, y_arr))
+
+    start = time.perf_counter()
+    oof = np.zeros(len(y_arr), dtype=float)
+    fold_seconds = [0.0] * n_splits
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(X_arr, y_arr)) as pool:
+        futures = [
+            pool.submit(_fit_fold, fold, train_idx, val_idx, params, random_state)
+            for fold, (train_idx, val_idx) in enumerate(splits)
+        ]
+        for future in futures:
+            fold, prob, seconds = future.result()
+            oof[splits[fold][1]] = prob
+            fold_seconds[fold] = seconds
+            print(f"  fold {fold + 1}/{n_splits} · {seconds:.1f}s")
+    wall_seconds = time.perf_counter() - start
+
+    pooled_th = best_f1_threshold(y_arr, oof)
+    folds = []
+    for fold, (_, val_idx) in enumerate(splits):
+        y_val, p_val = y_arr[val_idx], oof[val_idx]
+        fold_th = best_f1_threshold(y_val, p_val)
+        folds.append({
+            "fold": fold,
+            "n_samples": int(len(val_idx)),
+            "seconds": fold_seconds[fold],
+            "own_threshold": classification_metrics(y_val, p_val, fold_th),
+            "pooled_threshold": classification_metrics(y_val, p_val, pooled_th),
+        })
+
+    metric_names = ["f1_score", "auc", "precision", "recall", "accuracy"]
+    report = {
+        "n_splits": n_splits,
+        "workers": workers,
+        "wall_seconds": wall_seconds,
+        "sum_fold_seconds": float(sum(fold_seconds)),
+        "pooled": classification_metrics(y_arr, oof, pooled_th),
+        "threshold_stability": _summary([f["own_threshold"]["threshold"] for f in folds]),
+        "per_fold_summary": {
+            name: _summary([f["pooled_threshold"][name] for f in folds]) for name in metric_names
+        },
+        "folds": folds,
+    }
+
+    with open(output_dir / "cv_report.json", "w") as f:
+        json.dump(report, f, indent=2)
+    np.save(output_dir / "oof_probabilities.npy", oof)
+
+    f1_stats = report["per_fold_summary"]["f1_score"]
+    th_stats = report["threshold_stability"]
+    print(f"✅ Threshold pooled (OOF): {pooled_th:.3f} · thresholds por fold {th_stats['mean']:.3f} ± {th_stats['std']:.3f}")
+    print(f"✅ F1 por fold: {f1_stats['mean']:.4f} ± {f1_stats['std']:.4f}")
+    print(f"✅ Wall {wall_seconds:.1f}s vs {report['sum_fold_seconds']:.1f}s secuencial ({workers} workers)")
+    print(f"✅ Saved: {output_dir / 'cv_report.json'}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel k-fold CV and pooled threshold selection")
+    parser.add_argument("--data", default="dataset.csv")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    from features import load_dataset, check_required_columns, engineer_features, build_xy
+    from feature_selection import load_selected_features
+
+    df = load_dataset(args.data)
+    check_required_columns(df)
+    X, y = build_xy(engineer_features(df), load_selected_features())
+    X_train, _, y_train, _ = train_test_split(
+        X, y, test_size=0.2, random_state=42, stratify=y
+    )
+    run_cross_validation(X_train, y_train, n_splits=args.folds, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""
+Schneider Electric Datathon - Model Distillation
+Trains a compact surrogate booster (fewer, shallower trees) on the production
+model's soft probabilities. The training set is the balanced (SMOTETomek)
+training data plus two augmentations, all labelled by the teacher:
+
+  - jittered copies of training rows,
+  - What-If scenarios: rows whose slider features are redrawn over the
+    simulator's slider ranges, with the derived columns it recomputes.
+
+The student learns the teacher's probability surface rather than the raw 0/1
+outcomes, including the off-data points the sliders reach.
+
+The What-If Simulator can use the surrogate for instant slider feedback and
+the full model for the final numbers; the preview is on by default only when
+the surrogate's What-If Δp error is within PREVIEW_MAX_DELTA_ERROR. The
+pipeline distills only with DISTILL_TREES > 0 (off by default: no
+configuration measured so far passes that gate), refresh.py only with
+--distill. Outputs:
+
+    output/surrogate.pkl         XGBRegressor (reg:logistic)
+    output/surrogate_trees.npz   same trees for the NumPy evaluator
+    output/surrogate.json        AUC / F1 gap, fidelity and speedup
+
+Usage:
+    python distill.py --trees 250 --depth 8
+    python distill.py --sweep
+"""
+
+import json
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import roc_auc_score, f1_score
+
+SURROGATE_PATH = Path("output/surrogate.pkl")
+SURROGATE_TREES_PATH = Path("output/surrogate_trees.npz")
+SURROGATE_REPORT_PATH = Path("output/surrogate.json")
+SURROGATE_FILES = [SURROGATE_PATH.name, SURROGATE_TREES_PATH.name, SURROGATE_REPORT_PATH.name]
+
+# What-If Simulator slider ranges, shared with app_final.py (integer bounds = integer slider)
+WHAT_IF_RANGES = {
+    "cust_interactions": (0.0, 2.0),
+    "cust_hitrate": (0.0, 1.0),
+    "opp_old": (-2.0, 2.0),
+    "total_competitors": (0, 5),
+}
+# Largest mean What-If Δp error for which the app turns the surrogate preview on by default
+PREVIEW_MAX_DELTA_ERROR = 0.02
+
+
+def jitter(X, n_rows, scale=0.1, seed=42):
+    """n_rows resampled from X with Gaussian noise; integer columns stay integer and in range"""
+    rng = np.random.default_rng(seed)
+    values = X.to_numpy(dtype=np.float64)
+    rows = values[rng.integers(0, len(values), n_rows)]
+    noisy = rows + rng.normal(0, scale, rows.shape) * values.std(axis=0)
+    integer = np.all(values == np.round(values), axis=0)
+    noisy[:, integer] = np.round(noisy[:, integer])
+    noisy = np.clip(noisy, values.min(axis=0), values.max(axis=0))
+    return pd.DataFrame(noisy, columns=X.columns)
+
+
+def redraw_sliders(rows, rng):
+    """Slider features drawn uniformly over their ranges, derived columns recomputed like the app"""
+    rows = rows.reset_index(drop=True).astype(np.float64)
+    n_rows = len(rows)
+    for feature, (low, high) in WHAT_IF_RANGES.items():
+        if feature not in rows:
+            continue
+        if isinstance(low, int):
+            rows[feature] = rng.integers(low, high + 1, n_rows).astype(np.float64)
+        else:
+            rows[feature] = rng.uniform(low, high, n_rows)
+    if {"customer_activity", "cust_hitrate", "cust_interactions", "cust_contracts"} <= set(rows.columns):
+        rows["customer_activity"] = (rows["cust_hitrate"] + rows["cust_interactions"] + rows["cust_contracts"]) / 3.0
+    if {"customer_engagement", "cust_hitrate", "cust_interactions"} <= set(rows.columns):
+        rows["customer_engagement"] = rows["cust_hitrate"] * rows["cust_interactions"]
+    return rows
+
+
+def what_if_scenarios(X, n_rows, seed=42):
+    """n_rows resampled from X with the What-If sliders redrawn"""
+    rng = np.random.default_rng(seed)
+    return redraw_sliders(X.iloc[rng.integers(0, len(X), n_rows)], rng)
+
+
+def distill(teacher, X_fit, n_estimators=250, max_depth=8, learning_rate=0.3, augment=0.25,
+            scenarios=0.5, seed=42):
+    """Student booster fitted to the teacher's probabilities on X_fit plus augmented rows"""
+    from xgboost import XGBRegressor
+
+    X_fit = pd.DataFrame(X_fit).reset_index(drop=True)
+    parts = [X_fit]
+    if augment > 0:
+        parts.append(jitter(X_fit, int(len(X_fit) * augment), seed=seed))
+    if scenarios > 0:
+        parts.append(what_if_scenarios(X_fit, int(len(X_fit) * scenarios), seed=seed + 1))
+    X_distill = pd.concat(parts, ignore_index=True)
+    soft = teacher.predict_proba(X_distill)[:, 1]
+
+    student = XGBRegressor(
+        objective="reg:logistic", n_estimators=n_estimators, max_depth=max_depth,
+        learning_rate=learning_rate, subsample=0.9, colsample_bytree=0.9,
+        random_state=seed, n_jobs=-1,
+    )
+    student.fit(X_distill, soft)
+    return student, len(X_distill)
+
+
+def _row_latency_ms(predict, X, repeats=200):
+    X = np.asarray(X, dtype=np.float32)
+    predict(X[:1])
+    times = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        predict(X[i % len(X)][None, :])
+        times.append(time.perf_counter() - start)
+    return float(np.median(times) * 1000)
+
+
+def _contribs_latency_ms(model, X, repeats=100):
+    """Median time of an exact TreeSHAP explanation for one row"""
+    import xgboost as xgb
+    booster = model.get_booster()
+    X = np.asarray(X, dtype=np.float32)
+    times = []
+    for i in range(repeats):
+        data = xgb.DMatrix(X[i % len(X)][None, :], feature_names=booster.feature_names)
+        start = time.perf_counter()
+        booster.predict(data, pred_contribs=True)
+        times.append(time.perf_counter() - start)
+    return float(np.median(times) * 1000)
+
+
+def _n_leaves(model):
+    return int((model.get_booster().trees_to_dataframe()["Feature"] == "Leaf").sum())
+
+
+def what_if_delta_error(teacher, student, X, n_rows=500, seed=0):
+    """Mean |Δp error| and sign agreement of probability changes on simulated slider moves"""
+    base = X.sample(min(n_rows, len(X)), random_state=seed).reset_index(drop=True).astype(np.float64)
+    moved = redraw_sliders(base, np.random.default_rng(seed))
+    d_teacher = teacher.predict_proba(moved)[:, 1] - teacher.predict_proba(base)[:, 1]
+    d_student = student.predict(moved) - student.predict(base)
+    clear = np.abs(d_teacher) > 0.05
+    return {
+        "mean_abs_error": float(np.abs(d_student - d_teacher).mean()),
+        "sign_agreement": float((np.sign(d_student[clear]) == np.sign(d_teacher[clear])).mean()) if clear.any() else 1.0,
+    }
+
+
+def evaluate_surrogate(teacher, student, X_test, y_test, threshold):
+    """Quality gap, fidelity to the teacher and speedup on the test set"""
+    p_teacher = teacher.predict_proba(X_test)[:, 1]
+    p_student = student.predict(X_test)
+    report = {"threshold": float(threshold),
+              "what_if_delta_error": what_if_delta_error(teacher, student, X_test)}
+    for name, model, prob in [("teacher", teacher, p_teacher), ("student", student, p_student)]:
+        predict = model.predict_proba if name == "teacher" else model.predict
+        report[name] = {
+            "n_trees": int(model.get_booster().num_boosted_rounds()),
+            "max_depth": int(model.get_params()["max_depth"]),
+            "n_leaves": _n_leaves(model),
+            "auc": float(roc_auc_score(y_test, prob)),
+            "f1": float(f1_score(y_test, (prob >= threshold).astype(int))),
+            "row_latency_ms": _row_latency_ms(predict, X_test),
+            "shap_row_ms": _contribs_latency_ms(model, X_test),
+        }
+    t, s = report["teacher"], report["student"]
+    report["auc_gap"] = t["auc"] - s["auc"]
+    report["f1_gap"] = t["f1"] - s["f1"]
+    report["mean_abs_prob_diff"] = float(np.abs(p_teacher - p_student).mean())
+    report["decision_agreement"] = float(((p_teacher >= threshold) == (p_student >= threshold)).mean())
+    report["speedup_row"] = t["row_latency_ms"] / s["row_latency_ms"]
+    report["speedup_shap"] = t["shap_row_ms"] / s["shap_row_ms"]
+    return report
+
+
+def preview_by_default(report, tolerance=PREVIEW_MAX_DELTA_ERROR):
+    """True when the surrogate tracks the full model's What-If changes within tolerance"""
+    return report["what_if_delta_error"]["mean_abs_error"] <= tolerance
+
+
+def save_surrogate(student, report, output_dir="output"):
+    import joblib
+    from tree_export import CompiledTrees
+
+    output_dir = Path(output_dir)
+    joblib.dump(student, output_dir / SURROGATE_PATH.name)
+    CompiledTrees.from_model(student).save(output_dir / SURROGATE_TREES_PATH.name)
+    with open(output_dir / SURROGATE_REPORT_PATH.name, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+def print_report(report):
+    t, s = report["teacher"], report["student"]
+    print(f"  teacher  {t['n_trees']:>4} árboles (prof. {t['max_depth']}) · AUC {t['auc']:.4f} · "
+          f"F1 {t['f1']:.4f} · 1 fila {t['row_latency_ms']:.2f} ms · SHAP {t['shap_row_ms']:.2f} ms")
+    print(f"  student  {s['n_trees']:>4} árboles (prof. {s['max_depth']}) · AUC {s['auc']:.4f} · "
+          f"F1 {s['f1']:.4f} · 1 fila {s['row_latency_ms']:.2f} ms · SHAP {s['shap_row_ms']:.2f} ms")
+    print(f"  gap AUC {report['auc_gap']:+.4f} · gap F1 {report['f1_gap']:+.4f} · "
+          f"|Δp| medio {report['mean_abs_prob_diff']:.3f} · misma decisión {report['decision_agreement']:.1%} · "
+          f"speedup x{report['speedup_row']:.1f} (predicción) x{report['speedup_shap']:.1f} (SHAP)")
+    delta = report["what_if_delta_error"]
+    print(f"  What-If: error medio del cambio {delta['mean_abs_error']:.3f} · "
+          f"misma dirección {delta['sign_agreement']:.1%} · vista rápida por defecto "
+          f"{'sí' if preview_by_default(report) else 'no'} (tolerancia {PREVIEW_MAX_DELTA_ERROR})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Distill output/model.pkl into a compact surrogate")
+    parser.add_argument("--data", default="dataset.csv")
+    parser.add_argument("--trees", type=int, default=250)
+    parser.add_argument("--depth", type=int, default=8)
+    parser.add_argument("--augment", type=float, default=0.25, help="Jittered rows per training row")
+    parser.add_argument("--scenarios", type=float, default=0.5, help="What-If scenario rows per training row")
+    parser.add_argument("--sweep", action="store_true", help="Compare several student sizes, save nothing")
+    args = parser.parse_args()
+
+    import joblib
+    from sklearn.model_selection import train_test_split
+    from imblearn.combine import SMOTETomek
+    from features import load_dataset, check_required_columns, engineer_features, build_xy
+
+    teacher = joblib.load("output/model.pkl")
+    feature_names = joblib.load("output/feature_names.pkl")
+    X_test = joblib.load("output/X_test.pkl")[feature_names]
+    y_test = joblib.load("output/y_test.pkl")
+    with open("output/threshold.txt") as f:
+        threshold = float(f.read().strip())
+
+    # Same split and balancing as the pipeline, so the student never sees X_test
+    df = load_dataset(args.data)
+    check_required_columns(df)
+    X, y = build_xy(engineer_features(df))
+    X_train, _, y_train, _ = train_test_split(X[feature_names], y, test_size=0.2, random_state=42, stratify=y)
+    X_fit, _ = SMOTETomek(random_state=42).fit_resample(X_train, y_train)
+
+    configs = [(40, 3), (80, 4), (150, 6), (150, 8), (250, 8)] if args.sweep else [(args.trees, args.depth)]
+    for n_trees, depth in configs:
+        start = time.perf_counter()
+        student, n_rows = distill(teacher, X_fit, n_trees, depth,
+                                   augment=args.augment, scenarios=args.scenarios)
+        print(f"📦 Student {n_trees}x{depth} entrenado en {time.perf_counter() - start:.1f}s sobre {n_rows:,} filas")
+        report = evaluate_surrogate(teacher, student, X_test, y_test, threshold)
+        print_report(report)
+
+    if not args.sweep:
+        save_surrogate(student, report)
+        print(f"✅ Saved: {SURROGATE_PATH}, {SURROGATE_TREES_PATH}, {SURROGATE_REPORT_PATH}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+"""
+Schneider Electric Datathon - Multi-Seed Ensemble
+Trains N variants of the production XGBoost configuration, each with its own
+seed (and, in bootstrap mode, its own resample of the training rows), in
+parallel worker processes. Members are stored as raw UBJ booster bytes in one
+file (output/ensemble.pkl) and per-test-case scores in
+output/ensemble_scores.parquet.
+
+Scoring returns the member probabilities for every row, reduced to:
+
+  - mean_probability   average over members,
+  - std                spread between members,
+  - agreement          share of members on the majority side of the threshold,
+  - confidence         High / Medium / Low from |mean - threshold| / std.
+
+Large batches run each booster's inplace predict on the same float32 matrix.
+Small batches (the app, a scoring service) walk the trees of all members in a
+single vectorized pass with the NumPy evaluator from tree_export.py.
+
+Usage:
+    python ensemble.py --members 5 --mode bootstrap --workers 4
+    python ensemble.py --members 4 --scaling
+"""
+
+import os
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from case_index import CONFIDENCE_LEVELS
+
+ENSEMBLE_PATH = Path("output/ensemble.pkl")
+ENSEMBLE_SCORES_PATH = Path("output/ensemble_scores.parquet")
+# |mean - threshold| in units of member spread
+CONFIDENCE_Z = (1.0, 3.0)
+
+
+# ------------------------------------------------------------
+# WORKER PROCESS
+# ------------------------------------------------------------
+_worker_data = {}
+
+
+def _init_worker(X, y, params, threads):
+    _worker_data.update(X=X, y=y, params=params, threads=threads)
+
+
+def _fit_member(seed, bootstrap):
+    """Train one member; returns (seed, raw UBJ bytes, fit seconds)"""
+    from xgboost import XGBClassifier
+
+    X, y = _worker_data["X"], _worker_data["y"]
+    if bootstrap:
+        rows = np.random.default_rng(seed).integers(0, len(X), len(X))
+        X, y = X[rows], y[rows]
+    params = dict(_worker_data["params"], random_state=int(seed), n_jobs=_worker_data["threads"])
+    params.pop("use_label_encoder", None)
+    start = time.perf_counter()
+    model = XGBClassifier(**params).fit(X, y)
+    return int(seed), bytes(model.get_booster().save_raw("ubj")), time.perf_counter() - start
+
+
+# ------------------------------------------------------------
+# TRAINING
+# ------------------------------------------------------------
+def train_ensemble(X, y, n_members=5, mode="seed", workers=None, params=None, seed=42):
+    """
+    Fit n_members variants in a process pool (workers x threads <= cores).
+
+    mode="seed" changes only the random seed (row/column subsampling);
+    mode="bootstrap" also resamples the training rows with replacement.
+    """
+    if mode not in ("seed", "bootstrap"):
+        raise ValueError(f"❌ Modo desconocido: {mode}")
+    from tuning import load_best_params
+
+    params = dict(params or load_best_params())
+    feature_names = list(X.columns)
+    X_arr = np.asarray(X, dtype=np.float32)
+    y_arr = np.asarray(y).astype(int)
+    seeds = [seed + i for i in range(n_members)]
+    cores = os.cpu_count() or 1
+    workers = max(1, min(n_members, workers or cores))
+    threads = max(1, cores // workers)
+
+    start = time.perf_counter()
+    if workers == 1:
+        _init_worker(X_arr, y_arr, params, threads)
+        results = [_fit_member(s, mode == "bootstrap") for s in seeds]
+        _worker_data.clear()
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(X_arr, y_arr, params, threads)) as pool:
+            results = list(pool.map(_fit_member, seeds, [mode == "bootstrap"] * n_members))
+    wall = time.perf_counter() - start
+
+    ensemble = ModelEnsemble([raw for _, raw, _ in results], feature_names, mode, seeds)
+    ensemble.training = {
+        "workers": workers,
+        "threads_per_worker": threads,
+        "wall_seconds": wall,
+        "member_seconds": [s for _, _, s in results],
+    }
+    return ensemble
+
+
+# ------------------------------------------------------------
+# SCORING
+# ------------------------------------------------------------
+def confidence_from_dispersion(mean, std, threshold):
+    """High / Medium / Low from the distance to the threshold in member standard deviations"""
+    z = np.abs(np.asarray(mean) - threshold) / np.maximum(np.asarray(std), 1e-3)
+    return np.where(z >= CONFIDENCE_Z[1], 2, np.where(z >= CONFIDENCE_Z[0], 1, 0))
+
+
+class ModelEnsemble:
+    """Members as raw booster bytes; boosters and merged NumPy trees are built on first use"""
+
+    def __init__(self, members, feature_names, mode="seed", seeds=None):
+        self.members = list(members)
+        self.feature_names = list(feature_names)
+        self.mode = mode
+        self.seeds = list(seeds or range(len(self.members)))
+        self.training = None
+        self._boosters = None
+        self._merged = None
+
+    def __len__(self):
+        return len(self.members)
+
+    @property
+    def nbytes(self):
+        return sum(len(raw) for raw in self.members)
+
+    def boosters(self):
+        if self._boosters is None:
+            import xgboost as xgb
+            self._boosters = []
+            for raw in self.members:
+                booster = xgb.Booster()
+                booster.load_model(bytearray(raw))
+                self._boosters.append(booster)
+        return self._boosters
+
+    def merged_trees(self):
+        """(CompiledTrees with every member's trees, per-member tree offsets, per-member base margins)"""
+        if self._merged is None:
+            from tree_export import CompiledTrees, export_trees
+            parts = [export_trees(booster) for booster in self.boosters()]
+            node_offsets = np.cumsum([0] + [len(p["left"]) for p in parts[:-1]])
+            merged = {
+                key: np.concatenate([p[key] for p in parts])
+                for key in ["feature", "threshold", "default_left", "value"]
+            }
+            merged["left"] = np.concatenate([p["left"] + off for p, off in zip(parts, node_offsets)])
+            merged["roots"] = np.concatenate([p["roots"] + off for p, off in zip(parts, node_offsets)])
+            merged.update(
+                max_depth=max(p["max_depth"] for p in parts), base_margin=0.0, logistic=True,
+                feature_names=self.feature_names, fingerprint="ensemble",
+            )
+            tree_offsets = np.cumsum([0] + [len(p["roots"]) for p in parts[:-1]])
+            self._merged = (CompiledTrees(merged), tree_offsets, np.array([p["base_margin"] for p in parts]))
+        return self._merged
+
+    def _leaf_margins(self, X):
+        """(rows, members) margins from one pass over the merged trees"""
+        trees, tree_offsets, base = self.merged_trees()
+        leaves = trees.leaf_values(X)
+        return np.add.reduceat(leaves, tree_offsets, axis=1, dtype=np.float64) + base
+
+    def member_probabilities(self, X, small_batch=64):
+        """(members, rows) probability matrix"""
+        if hasattr(X, "columns"):
+            X = X[self.feature_names]
+        X = np.atleast_2d(np.asarray(X, dtype=np.float32))
+        if len(X) <= small_batch:
+            return (1 / (1 + np.exp(-self._leaf_margins(X)))).T
+        return np.vstack([booster.inplace_predict(X) for booster in self.boosters()])
+
+    def predict(self, X, threshold=0.5):
+        """DataFrame with mean_probability, std, agreement and confidence per row"""
+        probs = self.member_probabilities(X)
+        mean = probs.mean(axis=0)
+        std = probs.std(axis=0, ddof=1) if len(probs) > 1 else np.zeros(probs.shape[1])
+        votes = (probs >= threshold).mean(axis=0)
+        return pd.DataFrame({
+            "mean_probability": mean,
+            "std": std,
+            "agreement": np.maximum(votes, 1 - votes),
+            "confidence": pd.Categorical.from_codes(
+                confidence_from_dispersion(mean, std, threshold), CONFIDENCE_LEVELS, ordered=True
+            ),
+        }, index=X.index if hasattr(X, "index") else None)
+
+
+def save_ensemble(ensemble, path=ENSEMBLE_PATH):
+    """Plain dict of raw member bytes and metadata (no pickled classes)"""
+    import joblib
+    joblib.dump({
+        "members": ensemble.members,
+        "feature_names": ensemble.feature_names,
+        "mode": ensemble.mode,
+        "seeds": ensemble.seeds,
+        "training": ensemble.training,
+    }, path)
+
+
+def load_ensemble(path=ENSEMBLE_PATH):
+    import joblib
+    state = joblib.load(path)
+    ensemble = ModelEnsemble(state["members"], state["feature_names"], state["mode"], state["seeds"])
+    ensemble.training = state["training"]
+    return ensemble
+
+
+def save_ensemble_scores(scores, path=ENSEMBLE_SCORES_PATH):
+    scores.rename_axis("opportunity_id").reset_index().assign(
+        opportunity_id=lambda df: df["opportunity_id"].astype(str)
+    ).to_parquet(path, index=False)
+
+
+def load_ensemble_scores(path=ENSEMBLE_SCORES_PATH):
+    return pd.read_parquet(path).set_index("opportunity_id")
+
+
+# ------------------------------------------------------------
+# BENCHMARK
+# ------------------------------------------------------------
+def scoring_overhead(ensemble, single_model, X, repeats=200):
+    """Batch and single-row scoring time of the ensemble versus the single production model"""
+    X_arr = np.asarray(X[ensemble.feature_names], dtype=np.float32)
+
+    def timed(fn):
+        fn()
+        start = time.perf_counter()
+        fn()
+        return time.perf_counter() - start
+
+    def row_ms(fn):
+        fn(X_arr[:1])
+        times = []
+        for i in range(repeats):
+            row = X_arr[i % len(X_arr)][None, :]
+            start = time.perf_counter()
+            fn(row)
+            times.append(time.perf_counter() - start)
+        return float(np.median(times) * 1000)
+
+    booster = single_model.get_booster()
+    return {
+        "members": len(ensemble),
+        "batch_rows": len(X_arr),
+        "single_batch_s": timed(lambda: booster.inplace_predict(X_arr)),
+        "ensemble_batch_s": timed(lambda: ensemble.member_probabilities(X_arr)),
+        "single_row_ms": row_ms(lambda row: booster.inplace_predict(row)),
+        "ensemble_row_ms": row_ms(lambda row: ensemble.member_probabilities(row)),
+        "stored_mb": ensemble.nbytes / 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train a multi-seed XGBoost ensemble in parallel")
+    parser.add_argument("--data", default="dataset.csv")
+    parser.add_argument("--members", type=int, default=5)
+    parser.add_argument("--mode", choices=["seed", "bootstrap"], default="bootstrap")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--scaling", action="store_true", help="Time training at 1, 2, 4, ... workers")
+    args = parser.parse_args()
+
+    import joblib
+    from sklearn.model_selection import train_test_split
+    from imblearn.combine import SMOTETomek
+    from features import load_dataset, check_required_columns, engineer_features, build_xy
+
+    feature_names = joblib.load("output/feature_names.pkl")
+    X_test = joblib.load("output/X_test.pkl")[feature_names]
+    with open("output/threshold.txt") as f:
+        threshold = float(f.read().strip())
+
+    df = load_dataset(args.data)
+    check_required_columns(df)
+    X, y = build_xy(engineer_features(df))
+    X_train, _, y_train, _ = train_test_split(X[feature_names], y, test_size=0.2, random_state=42, stratify=y)
+    X_fit, y_fit = SMOTETomek(random_state=42).fit_resample(X_train, y_train)
+
+    if args.scaling:
+        counts, w = [], 1
+        while w <= (args.workers or os.cpu_count() or 1):
+            counts.append(w)
+            w *= 2
+        for w in counts:
+            ensemble = train_ensemble(X_fit, y_fit, args.members, args.mode, workers=w)
+            t = ensemble.training
+            print(f"  workers={w:<3} x {t['threads_per_worker']} hilos · {t['wall_seconds']:.1f}s "
+                  f"({args.members} miembros)")
+        return
+
+    ensemble = train_ensemble(X_fit, y_fit, args.members, args.mode, workers=args.workers)
+    t = ensemble.training
+    print(f"✅ {len(ensemble)} miembros ({args.mode}) en {t['wall_seconds']:.1f}s con {t['workers']} workers "
+          f"(suma por miembro {sum(t['member_seconds']):.1f}s) · {ensemble.nbytes / 1e6:.1f} MB")
+
+    scores = ensemble.predict(X_test, threshold)
+    save_ensemble(ensemble)
+    save_ensemble_scores(scores)
+    print(scores["confidence"].value_counts().to_string())
+    print(f"✅ Saved: {ENSEMBLE_PATH}, {ENSEMBLE_SCORES_PATH}")
+
+    overhead = scoring_overhead(ensemble, joblib.load("output/model.pkl"), X_test)
+    print(f"  batch {overhead['batch_rows']:,} filas: {overhead['single_batch_s']:.2f}s (1 modelo) → "
+          f"{overhead['ensemble_batch_s']:.2f}s ({overhead['members']} miembros)")
+    print(f"  1 fila: {overhead['single_row_ms']:.2f} ms (1 modelo) → {overhead['ensemble_row_ms']:.2f} ms "
+          f"(árboles fusionados)")
+
+
+if __name__ == "__main__":
+    main()
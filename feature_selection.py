@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Schneider Electric Datathon - Redundant Feature Pruning
+Section 2 builds several overlapping columns (customer_engagement and
+hitrate_interaction are the same product; opp_age_squared, opp_maturity and
+is_mature_opp move in lockstep with opp_old on this data). This stage finds:
+
+  - exact duplicates (identical column bytes),
+  - near-duplicates (|Pearson r| above a threshold, 0.995 by default),
+  - zero-importance features (no gain in a short probe XGBoost model),
+
+and writes the surviving list to output/selected_features.json, which
+training, tuning, CV and the saved feature_names.pkl (scoring, refresh, app)
+then follow. Features the app and the per-case JSON read by name are never
+dropped.
+
+The pipeline prunes only with FEATURE_PRUNING=1: it changes the production
+model's feature set, and --benchmark measured no SHAP or inference speedup
+on this data.
+
+Usage:
+    python feature_selection.py              # detect and persist
+    python feature_selection.py --benchmark  # training / SHAP / inference speedup
+"""
+
+import json
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+SELECTED_FEATURES_PATH = Path("output/selected_features.json")
+
+# Read by name in app_final.py (What-If, Segment Analytics) and in the per-case / global JSON
+PROTECTED_FEATURES = [
+    "cust_hitrate", "cust_interactions", "cust_contracts", "total_competitors", "opp_old",
+    "customer_activity", "customer_engagement", "opp_quality_score", "product_A_ratio",
+    "cust_in_iberia", "has_competition", "opp_month",
+]
+
+
+def exact_duplicates(X):
+    """{dropped: kept} for columns whose values are byte-identical to an earlier column"""
+    seen, dropped = {}, {}
+    for column in X.columns:
+        key = np.ascontiguousarray(X[column].to_numpy(dtype=np.float64)).tobytes()
+        if key in seen:
+            dropped[column] = seen[key]
+        else:
+            seen[key] = column
+    return dropped
+
+
+def correlated_pairs(X, threshold=0.995):
+    """(a, b, r) for column pairs with |r| >= threshold, a before b"""
+    values = X.to_numpy(dtype=np.float64)
+    std = values.std(axis=0)
+    usable = np.flatnonzero(std > 0)
+    corr = np.corrcoef(values[:, usable], rowvar=False)
+    i, j = np.triu_indices(len(usable), k=1)
+    hits = np.flatnonzero(np.abs(corr[i, j]) >= threshold)
+    return [(X.columns[usable[i[k]]], X.columns[usable[j[k]]], float(corr[i[k], j[k]])) for k in hits]
+
+
+def zero_importance_features(X, y, params=None, n_estimators=150):
+    """Features with zero gain in a short probe model (constant columns included)"""
+    from xgboost import XGBClassifier
+    from tuning import load_best_params
+
+    params = dict(params or load_best_params())
+    params.pop("use_label_encoder", None)
+    params["n_estimators"] = min(n_estimators, params.get("n_estimators", n_estimators))
+    probe = XGBClassifier(**params).fit(X, y)
+    gain = pd.Series(probe.feature_importances_, index=X.columns)
+    return gain[gain <= 0].index.tolist()
+
+
+def select_features(X, y, corr_threshold=0.995, probe=True, protected=PROTECTED_FEATURES, params=None):
+    """Detect redundant columns on the training data; returns the selection report"""
+    protected = set(protected)
+    dropped = {}
+
+    for column, kept in exact_duplicates(X).items():
+        if column in protected and kept in protected:
+            continue
+        # Keep the protected one when only one side is protected
+        if column in protected:
+            column, kept = kept, column
+        if column not in dropped:
+            dropped[column] = {"reason": "exact_duplicate", "of": kept}
+
+    for a, b, r in correlated_pairs(X.drop(columns=list(dropped)), corr_threshold):
+        if a in dropped or b in dropped or (a in protected and b in protected):
+            continue
+        column, kept = (a, b) if a not in protected and b in protected else (b, a)
+        dropped[column] = {"reason": "correlated", "of": kept, "r": round(r, 6)}
+
+    if probe:
+        remaining = X.drop(columns=list(dropped))
+        for column in zero_importance_features(remaining, y, params):
+            if column not in protected:
+                dropped[column] = {"reason": "zero_importance"}
+
+    selected = [c for c in X.columns if c not in dropped]
+    return {
+        "n_original": int(X.shape[1]),
+        "n_selected": len(selected),
+        "corr_threshold": corr_threshold,
+        "selected": selected,
+        "dropped": dropped,
+    }
+
+
+def save_selected_features(report, path=SELECTED_FEATURES_PATH):
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+def load_selected_features(path=SELECTED_FEATURES_PATH):
+    """Persisted feature list, or None when no pruning has been run"""
+    path = Path(path)
+    if not path.exists():
+        return None
+    with open(path) as f:
+        return json.load(f)["selected"]
+
+
+# ------------------------------------------------------------
+# BENCHMARK
+# ------------------------------------------------------------
+def benchmark_pruning(X_train, y_train, X_test, y_test, selected, params=None, shap_rows=500, latency_repeats=200):
+    """Training, SHAP and single-row inference time with all features versus the selection"""
+    import shap
+    from xgboost import XGBClassifier
+    from sklearn.metrics import roc_auc_score
+    from tuning import load_best_params
+
+    params = dict(params or load_best_params())
+    results = {}
+    for name, columns in [("all", list(X_train.columns)), ("selected", list(selected))]:
+        start = time.perf_counter()
+        model = XGBClassifier(**params).fit(X_train[columns], y_train)
+        train_s = time.perf_counter() - start
+
+        explainer = shap.TreeExplainer(model, feature_perturbation="interventional")
+        start = time.perf_counter()
+        explainer.shap_values(X_test[columns].iloc[:shap_rows])
+        shap_s = time.perf_counter() - start
+
+        row = X_test[columns].iloc[:1].to_numpy()
+        model.predict_proba(row)
+        latencies = []
+        for _ in range(latency_repeats):
+            start = time.perf_counter()
+            model.predict_proba(row)
+            latencies.append(time.perf_counter() - start)
+
+        trees = model.get_booster().trees_to_dataframe()
+        results[name] = {
+            "n_features": len(columns),
+            "n_leaves": int((trees["Feature"] == "Leaf").sum()),
+            "train_s": train_s,
+            "shap_s": shap_s,
+            "row_latency_ms": float(np.median(latencies) * 1000),
+            "auc": float(roc_auc_score(y_test, model.predict_proba(X_test[columns])[:, 1])),
+        }
+
+    for key in ["train_s", "shap_s", "row_latency_ms"]:
+        results[f"speedup_{key}"] = results["all"][key] / results["selected"][key]
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Detect and prune redundant engineered features")
+    parser.add_argument("--data", default="dataset.csv")
+    parser.add_argument("--corr-threshold", type=float, default=0.995)
+    parser.add_argument("--no-probe", action="store_true", help="Skip the zero-importance probe model")
+    parser.add_argument("--benchmark", action="store_true")
+    args = parser.parse_args()
+
+    from sklearn.model_selection import train_test_split
+    from features import load_dataset, check_required_columns, engineer_features, build_xy
+
+    df = load_dataset(args.data)
+    check_required_columns(df)
+    X, y = build_xy(engineer_features(df))
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=0.2, random_state=42, stratify=y
+    )
+
+    report = select_features(X_train, y_train, args.corr_threshold, probe=not args.no_probe)
+    for column, why in report["dropped"].items():
+        print(f"  - {column}: {why}")
+    print(f"✅ {report['n_selected']}/{report['n_original']} features seleccionadas")
+
+    if args.benchmark:
+        results = benchmark_pruning(X_train, y_train, X_test, y_test, report["selected"])
+        for name in ["all", "selected"]:
+            r = results[name]
+            print(f"  {name:<9} {r['n_features']} features · {r['n_leaves']:,} hojas · train {r['train_s']:.1f}s · "
+                  f"SHAP {r['shap_s']:.1f}s · 1 fila {r['row_latency_ms']:.2f} ms · AUC {r['auc']:.4f}")
+        print(f"  speedup: train x{results['speedup_train_s']:.2f} · SHAP x{results['speedup_shap_s']:.2f} · "
+              f"inferencia x{results['speedup_row_latency_ms']:.2f}")
+        report["benchmark"] = results
+
+    save_selected_features(report)
+    print(f"✅ Saved: {SELECTED_FEATURES_PATH}")
+
+
+if __name__ == "__main__":
+    main()
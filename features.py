@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Schneider Electric Datathon - Feature Engineering
+Shared feature construction used by the pipeline and its auxiliary stages.
+"""
+
+import numpy as np
+
+REQUIRED_COLS = [
+    "id", "target_variable",
+    "cust_hitrate", "cust_interactions", "cust_contracts",
+    "product_A_sold_in_the_past", "product_B_sold_in_the_past",
+    "product_A_recommended",
+    "product_A", "product_C", "product_D",
+    "competitor_X", "competitor_Y", "competitor_Z",
+    "cust_in_iberia",
+    "opp_old", "opp_month"
+]
+
+
+def load_dataset(path, nrows=None):
+    """dataset.csv, or a CSV / Parquet file with the same columns (e.g. from synthetic_data.py)"""
+    import pandas as pd
+
+    if str(path).endswith(".parquet"):
+        if nrows is None:
+            return pd.read_parquet(path)
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        batches, n = [], 0
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=min(nrows, 65_536)):
+            batches.append(batch.slice(0, nrows - n))
+            n += len(batches[-1])
+            if n >= nrows:
+                break
+        return pa.Table.from_batches(batches).to_pandas()
+    return pd.read_csv(path, nrows=nrows)
+
+
+def check_required_columns(df):
+    """Raise if any raw column needed by the pipeline is missing"""
+    missing = [c for c in REQUIRED_COLS if c not in df.columns]
+    if missing:
+        raise ValueError(f"❌ Faltan columnas en dataset.csv: {missing}")
+
+
+def engineer_features(df, interactions_median=None):
+    """
+    Return a copy of the raw dataframe with all engineered columns added.
+
+    `low_engagement_risk` compares against the median of cust_interactions. The
+    pipeline computes it on the full dataset; scoring small batches should pass
+    the stored training median (metadata.json) so results do not depend on the
+    batch composition.
+    """
+    df_fe = df.copy()
+    if interactions_median is None:
+        interactions_median = df_fe["cust_interactions"].median()
+
+    df_fe["total_competitors"] = df_fe["competitor_X"] + df_fe["competitor_Y"] + df_fe["competitor_Z"]
+    df_fe["has_competition"] = (df_fe["total_competitors"] > 0).astype(int)
+    df_fe["competitor_diversity"] = (
+        (df_fe["competitor_X"] > 0).astype(int) +
+        (df_fe["competitor_Y"] > 0).astype(int) +
+        (df_fe["competitor_Z"] > 0).astype(int)
+    )
+
+    df_fe["customer_activity"] = (
+        df_fe["cust_hitrate"] + df_fe["cust_interactions"] + df_fe["cust_contracts"]
+    ) / 3.0
+    df_fe["customer_engagement"] = df_fe["cust_hitrate"] * df_fe["cust_interactions"]
+    df_fe["contract_hitrate_ratio"] = df_fe["cust_contracts"] / (df_fe["cust_hitrate"] + 1e-3)
+
+    df_fe["total_past_sales"] = df_fe["product_A_sold_in_the_past"] + df_fe["product_B_sold_in_the_past"]
+    df_fe["product_A_ratio"] = df_fe["product_A_sold_in_the_past"] / (df_fe["total_past_sales"] + 1e-3)
+    df_fe["has_past_sales"] = (df_fe["total_past_sales"] > 0).astype(int)
+
+    df_fe["opp_age_squared"] = df_fe["opp_old"] ** 2
+    df_fe["opp_maturity"] = np.log1p(df_fe["opp_old"] + 10)
+    df_fe["is_new_opp"] = (df_fe["opp_old"] < -0.5).astype(int)
+    df_fe["is_mature_opp"] = (df_fe["opp_old"] > 1.0).astype(int)
+
+    df_fe["product_mix"] = df_fe["product_A"] + df_fe["product_C"] + df_fe["product_D"]
+    df_fe["product_count"] = (
+        (df_fe["product_A"] > 0).astype(int) +
+        (df_fe["product_C"] > 0).astype(int) +
+        (df_fe["product_D"] > 0).astype(int)
+    )
+
+    df_fe["hitrate_interaction"] = df_fe["cust_hitrate"] * df_fe["cust_interactions"]
+    df_fe["hitrate_contracts"] = df_fe["cust_hitrate"] * df_fe["cust_contracts"]
+    df_fe["competition_engagement"] = df_fe["total_competitors"] * df_fe["customer_engagement"]
+
+    df_fe["competition_risk"] = df_fe["total_competitors"] / (df_fe["customer_activity"] + 1e-3)
+    df_fe["low_engagement_risk"] = (
+        (df_fe["cust_interactions"] < interactions_median) &
+        (df_fe["total_competitors"] > 0)
+    ).astype(int)
+
+    df_fe["opp_quality_score"] = (
+        df_fe["cust_hitrate"] * 0.3 +
+        df_fe["customer_activity"] * 0.3 +
+        df_fe["product_A_ratio"] * 0.4
+    )
+
+    df_fe["iberia_competition"] = df_fe["cust_in_iberia"] * df_fe["total_competitors"]
+    df_fe["iberia_engagement"] = df_fe["cust_in_iberia"] * df_fe["customer_engagement"]
+
+    return df_fe
+
+
+def build_xy(df_fe, selected_features=None):
+    """
+    Split an engineered dataframe into the numeric feature matrix and target.
+    `selected_features` restricts X to a pruned list (output/selected_features.json).
+    """
+    X = df_fe.drop(columns=["id", "target_variable"])
+    X = X.select_dtypes(include=[np.number])
+    if selected_features is not None:
+        X = X[list(selected_features)]
+    y = df_fe["target_variable"]
+    return X, y
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+Schneider Electric Datathon - Figure Rendering
+Renders the pipeline figures from the arrays persisted in
+output/figures/inputs.npz, off the pipeline's critical path. Each
+(figure, profile) pair is drawn in its own worker process and skipped when
+neither its inputs nor its profile changed since the last render.
+
+Profiles are "name:dpi:format" entries; the "print" profile writes to
+output/images/ (the paths used by the app and the slides), any other profile
+to output/images/<name>/.
+
+output/images/manifest.json keeps, per "<profile>/<figure>", the input
+fingerprint, the draw + save time in ms and the sha256 of the written file
+(render_time_ms looks a file up by content, so copies in the model registry
+resolve too).
+
+Usage:
+    python figures.py --profiles print:300:png,web:110:png --workers 3
+"""
+
+import os
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+FIGURE_INPUTS = Path("output/figures/inputs.npz")
+IMAGES_DIR = Path("output/images")
+MANIFEST_NAME = "manifest.json"
+DEFAULT_PROFILES = "print:300:png,web:110:png"
+
+# Bump when a renderer changes so existing images are redrawn
+RENDER_VERSION = 1
+
+
+def save_figure_inputs(path=FIGURE_INPUTS, **arrays):
+    """Persist the arrays the renderers need (called by the pipeline)"""
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    np.savez_compressed(path, **arrays)
+
+
+def parse_profiles(spec):
+    """'print:300:png,web:110:png' -> [{'name': 'print', 'dpi': 300, 'format': 'png'}, ...]"""
+    profiles = []
+    for item in spec.split(","):
+        name, dpi, fmt = item.strip().split(":")
+        profiles.append({"name": name, "dpi": int(dpi), "format": fmt})
+    return profiles
+
+
+def output_path(figure, profile, images_dir=IMAGES_DIR):
+    images_dir = Path(images_dir)
+    folder = images_dir if profile["name"] == "print" else images_dir / profile["name"]
+    return folder / f"{figure}.{profile['format']}"
+
+
+# ------------------------------------------------------------
+# RENDERERS
+# ------------------------------------------------------------
+def render_shap_summary(inputs, path, dpi):
+    import matplotlib.pyplot as plt
+    import shap
+
+    plt.figure(figsize=(10, 6))
+    shap.summary_plot(
+        inputs["shap_sample"], inputs["X_sample"],
+        feature_names=list(inputs["feature_names"]), show=False, max_display=20
+    )
+    plt.title("SHAP Summary Plot - Top 20 Features", fontsize=14, fontweight="bold")
+    plt.tight_layout()
+    plt.savefig(path, dpi=dpi, bbox_inches="tight")
+    plt.close()
+
+
+def render_feature_importance(inputs, path, dpi):
+    import matplotlib.pyplot as plt
+    import pandas as pd
+    import seaborn as sns
+
+    feature_importance = pd.DataFrame({
+        "feature": inputs["feature_names"],
+        "importance": inputs["importances"]
+    }).sort_values("importance", ascending=False)
+
+    plt.figure(figsize=(8, 8))
+    top_15 = feature_importance.head(15)
+    sns.barplot(data=top_15, x="importance", y="feature", orient="h")
+    plt.title("Top 15 Feature Importances (XGBoost)", fontsize=14, fontweight="bold")
+    plt.xlabel("Importance")
+    plt.ylabel("Feature")
+    plt.tight_layout()
+    plt.savefig(path, dpi=dpi, bbox_inches="tight")
+    plt.close()
+
+
+def render_probability_distribution(inputs, path, dpi):
+    import matplotlib.pyplot as plt
+    import pandas as pd
+
+    y_prob, y_test = inputs["y_prob"], inputs["y_test"]
+    plt.figure(figsize=(12, 5))
+
+    plt.subplot(1, 2, 1)
+    plt.hist(y_prob[y_test == 0], bins=40, alpha=0.7, label="Actual Loss", color="red")
+    plt.hist(y_prob[y_test == 1], bins=40, alpha=0.7, label="Actual Win", color="green")
+    plt.xlabel("Predicted Win Probability")
+    plt.ylabel("Frequency")
+    plt.title("Probability Distribution by Actual Outcome")
+    plt.legend()
+    plt.grid(alpha=0.3)
+
+    plt.subplot(1, 2, 2)
+    bins_prob = [0, 0.3, 0.5, 0.7, 1.0]
+    labels_prob = ["Low", "Medium", "High", "Very High"]
+    prob_categories = pd.cut(y_prob, bins=bins_prob, labels=labels_prob)
+    category_counts = prob_categories.value_counts().reindex(labels_prob, fill_value=0)
+    colors = ["red", "orange", "lightgreen", "darkgreen"]
+    plt.bar(category_counts.index, category_counts.values, color=colors)
+    plt.xlabel("Confidence Level")
+    plt.ylabel("Number of Opportunities")
+    plt.title("Prediction Confidence Distribution")
+    plt.grid(alpha=0.3, axis="y")
+
+    plt.tight_layout()
+    plt.savefig(path, dpi=dpi, bbox_inches="tight")
+    plt.close()
+
+
+# figure name -> (renderer, input arrays it depends on)
+FIGURES = {
+    "shap_summary": (render_shap_summary, ["shap_sample", "X_sample", "feature_names"]),
+    "feature_importance": (render_feature_importance, ["feature_names", "importances"]),
+    "probability_distribution": (render_probability_distribution, ["y_prob", "y_test"]),
+}
+
+
+def input_fingerprint(inputs, figure, profile):
+    """Hash of the arrays a figure reads plus its profile"""
+    digest = hashlib.sha256(f"{RENDER_VERSION}|{figure}|{profile}".encode())
+    for key in FIGURES[figure][1]:
+        array = np.ascontiguousarray(inputs[key])
+        digest.update(key.encode())
+        digest.update(str(array.dtype).encode())
+        digest.update(str(array.shape).encode())
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+def _render_task(inputs_path, figure, profile, images_dir):
+    """Worker entry point: load the inputs and draw one figure"""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    plt.rcParams["figure.dpi"] = 120
+
+    with np.load(inputs_path, allow_pickle=False) as data:
+        inputs = {key: data[key] for key in FIGURES[figure][1]}
+    path = output_path(figure, profile, images_dir)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    start = time.perf_counter()
+    FIGURES[figure][0](inputs, path, profile["dpi"])
+    return str(path), (time.perf_counter() - start) * 1000
+
+
+def _file_sha256(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def render_time_ms(path, images_dir=IMAGES_DIR):
+    """Render time recorded for this exact file (matched by sha256), or None"""
+    manifest_path = Path(images_dir) / MANIFEST_NAME
+    if not manifest_path.exists() or not Path(path).exists():
+        return None
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    digest = _file_sha256(path)
+    return next((entry["render_ms"] for entry in manifest.values()
+                 if isinstance(entry, dict) and entry.get("sha256") == digest), None)
+
+
+def render_all(inputs_path=FIGURE_INPUTS, profiles=None, workers=None, force=False, images_dir=IMAGES_DIR):
+    """Render every stale (figure, profile) pair into images_dir; returns the list of written paths"""
+    profiles = parse_profiles(profiles or os.environ.get("FIGURE_PROFILES", DEFAULT_PROFILES))
+    manifest_path = Path(images_dir) / MANIFEST_NAME
+    manifest = {}
+    if manifest_path.exists() and not force:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    with np.load(inputs_path, allow_pickle=False) as data:
+        inputs = {key: data[key] for key in data.files}
+
+    tasks = []
+    for figure in FIGURES:
+        for profile in profiles:
+            key = f"{profile['name']}/{figure}"
+            fingerprint = input_fingerprint(inputs, figure, profile)
+            path = output_path(figure, profile, images_dir)
+            entry = manifest.get(key)
+            # Manifests written before render times were recorded hold bare fingerprints: redrawn once
+            if isinstance(entry, dict) and entry["fingerprint"] == fingerprint and path.exists():
+                print(f"  = {path} (sin cambios)")
+                continue
+            tasks.append((key, fingerprint, figure, profile))
+
+    written = []
+    if tasks:
+        workers = min(len(tasks), workers or os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [(key, fp, pool.submit(_render_task, str(inputs_path), figure, profile, str(images_dir)))
+                       for key, fp, figure, profile in tasks]
+            for key, fingerprint, future in futures:
+                path, render_ms = future.result()
+                manifest[key] = {"fingerprint": fingerprint, "render_ms": round(render_ms, 1),
+                                 "sha256": _file_sha256(path)}
+                written.append(path)
+                print(f"✅ Saved: {path} ({render_ms:.0f} ms)")
+
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render pipeline figures from persisted arrays")
+    parser.add_argument("--inputs", default=str(FIGURE_INPUTS))
+    parser.add_argument("--profiles", default=None, help=f"Default: {DEFAULT_PROFILES}")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--force", action="store_true", help="Ignore the manifest and redraw everything")
+    args = parser.parse_args()
+    render_all(args.inputs, profiles=args.profiles, workers=args.workers, force=args.force)
+
+
+if __name__ == "__main__":
+    main()
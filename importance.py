@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+Schneider Electric Datathon - Global Feature Importance
+Three views of global importance side by side: XGBoost gain, mean |SHAP| from
+the existing SHAP matrix, and permutation importance on the test set (drop in
+AUC when a column is shuffled).
+
+Permutation importance runs one task per column in worker processes. Each task
+stacks all its shuffled repeats into a single matrix and scores it with one
+batched predict_proba call. `max_samples` bounds the rows used.
+
+Usage:
+    python importance.py --repeats 5 --workers 4 --max-samples 5000
+"""
+
+import os
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import roc_auc_score
+
+IMPORTANCE_PATH = Path("output/importance.json")
+
+
+def mean_abs_shap_importance(shap_values, feature_names):
+    """Mean |SHAP| per feature, highest first"""
+    values = np.abs(np.asarray(shap_values)).mean(axis=0)
+    return pd.Series(values, index=list(feature_names)).sort_values(ascending=False)
+
+
+# ------------------------------------------------------------
+# WORKER PROCESS
+# ------------------------------------------------------------
+_worker_data = {}
+
+
+def _init_worker(model, X, y, n_repeats, single_thread=True):
+    if single_thread:
+        # Each worker holds its own copy of the model; one thread per process
+        model.set_params(n_jobs=1)
+    # Repeats stacked vertically; each task overwrites one column and restores it
+    _worker_data.update(model=model, X=X, y=y, n_repeats=n_repeats, tiled=np.tile(X, (n_repeats, 1)))
+
+
+def _permute_column(j, seed):
+    """AUC of each shuffled repeat of column j (one batched prediction)"""
+    X, y, tiled = _worker_data["X"], _worker_data["y"], _worker_data["tiled"]
+    n, n_repeats = len(X), _worker_data["n_repeats"]
+    rng = np.random.default_rng([seed, j])
+    tiled[:, j] = np.concatenate([X[rng.permutation(n), j] for _ in range(n_repeats)])
+    prob = _worker_data["model"].predict_proba(tiled)[:, 1]
+    tiled[:, j] = np.tile(X[:, j], n_repeats)
+    return j, [roc_auc_score(y, prob[r * n:(r + 1) * n]) for r in range(n_repeats)]
+
+
+# ------------------------------------------------------------
+# PERMUTATION IMPORTANCE
+# ------------------------------------------------------------
+def permutation_importance(model, X, y, n_repeats=5, workers=None, max_samples=None, seed=42):
+    """
+    Mean and std of the AUC drop per shuffled column.
+
+    Returns (DataFrame indexed by feature, info dict with baseline AUC, rows
+    used and wall time).
+    """
+    feature_names = list(X.columns)
+    X_arr = np.asarray(X, dtype=np.float32)
+    y_arr = np.asarray(y).astype(int)
+    if max_samples and len(X_arr) > max_samples:
+        # Stratified sub-sample keeps the class balance of the test set
+        from sklearn.model_selection import train_test_split
+        keep, _ = train_test_split(np.arange(len(X_arr)), train_size=max_samples,
+                                   stratify=y_arr, random_state=seed)
+        X_arr, y_arr = X_arr[np.sort(keep)], y_arr[np.sort(keep)]
+
+    start = time.perf_counter()
+    baseline = roc_auc_score(y_arr, model.predict_proba(X_arr)[:, 1])
+    workers = min(len(feature_names), workers or os.cpu_count() or 1)
+
+    scores = {}
+    if workers == 1:
+        _init_worker(model, X_arr, y_arr, n_repeats, single_thread=False)
+        for j in range(len(feature_names)):
+            scores[j] = _permute_column(j, seed)[1]
+        _worker_data.clear()
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(model, X_arr, y_arr, n_repeats)) as pool:
+            for j, aucs in pool.map(_permute_column, range(len(feature_names)), [seed] * len(feature_names)):
+                scores[j] = aucs
+
+    drops = baseline - np.array([scores[j] for j in range(len(feature_names))])
+    table = pd.DataFrame({
+        "permutation_mean": drops.mean(axis=1),
+        "permutation_std": drops.std(axis=1, ddof=1) if n_repeats > 1 else np.zeros(len(drops)),
+    }, index=feature_names).sort_values("permutation_mean", ascending=False)
+    info = {
+        "metric": "auc",
+        "baseline": float(baseline),
+        "n_samples": int(len(y_arr)),
+        "n_repeats": int(n_repeats),
+        "workers": int(workers),
+        "seconds": time.perf_counter() - start,
+    }
+    return table, info
+
+
+def compute_global_importance(model, X, y, shap_values, n_repeats=5, workers=None, max_samples=None, seed=42):
+    """Gain, mean |SHAP| and permutation importance in one table (n_repeats=0 skips permutation)"""
+    feature_names = list(X.columns)
+    table = pd.DataFrame({
+        "gain": pd.Series(model.feature_importances_, index=feature_names),
+        "mean_abs_shap": mean_abs_shap_importance(shap_values, feature_names),
+    })
+    info = None
+    if n_repeats > 0:
+        permutation, info = permutation_importance(model, X, y, n_repeats, workers, max_samples, seed)
+        table = table.join(permutation)
+    for column in ["gain", "mean_abs_shap", "permutation_mean"]:
+        if column in table:
+            table[f"{column}_rank"] = table[column].rank(ascending=False, method="min").astype(int)
+    return table.sort_values("mean_abs_shap", ascending=False), info
+
+
+def save_global_importance(table, info, path=IMPORTANCE_PATH):
+    report = {
+        "permutation": info,
+        "features": {feature: {k: float(v) for k, v in row.items()} for feature, row in table.iterrows()},
+    }
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+def load_global_importance(path=IMPORTANCE_PATH):
+    """(table, permutation info) as written by save_global_importance"""
+    with open(path) as f:
+        report = json.load(f)
+    return pd.DataFrame.from_dict(report["features"], orient="index"), report["permutation"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gain, SHAP and permutation importance from saved artifacts")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--max-samples", type=int, default=None)
+    parser.add_argument("--scaling", action="store_true", help="Time permutation importance at 1, 2, 4, ... workers")
+    args = parser.parse_args()
+
+    import joblib
+    model = joblib.load("output/model.pkl")
+    X_test = joblib.load("output/X_test.pkl")
+    y_test = joblib.load("output/y_test.pkl")
+    shap_values = joblib.load("output/shap_values.pkl")
+
+    if args.scaling:
+        counts, w = [], 1
+        while w <= (args.workers or os.cpu_count() or 1):
+            counts.append(w)
+            w *= 2
+        for w in counts:
+            _, info = permutation_importance(model, X_test, y_test, args.repeats, w, args.max_samples)
+            print(f"  workers={w:<3} {info['seconds']:.1f}s ({info['n_samples']:,} filas x {args.repeats} repeticiones)")
+        return
+
+    table, info = compute_global_importance(
+        model, X_test, y_test, shap_values, args.repeats, args.workers, args.max_samples
+    )
+    save_global_importance(table, info)
+    print(table.head(15).to_string())
+    if info:
+        print(f"✅ Permutation importance: {info['seconds']:.1f}s con {info['workers']} workers")
+    print(f"✅ Saved: {IMPORTANCE_PATH}")
+
+
+if __name__ == "__main__":
+    main()
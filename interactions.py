@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Schneider Electric Datathon - SHAP Interaction Values
+Opt-in stage that quantifies pairwise interactions (e.g. competition x Iberia).
+
+Interaction values are features x features per row and expensive for deep
+trees, so rows are streamed in small chunks through a process pool (XGBoost's
+native path-dependent TreeSHAP, one thread per worker) and each chunk is
+reduced to running F x F sums right away. Only those sums stay in memory,
+and at most 2 x workers chunks are in flight.
+
+Usage:
+    python interactions.py --rows 400 --workers 4 --top 10
+"""
+
+import os
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from pathlib import Path
+
+import numpy as np
+
+INTERACTIONS_PATH = Path("output/interactions.json")
+
+
+# ------------------------------------------------------------
+# WORKER PROCESS
+# ------------------------------------------------------------
+_worker_data = {}
+
+
+def _init_worker(raw_model, feature_names):
+    import xgboost as xgb
+    booster = xgb.Booster()
+    booster.load_model(bytearray(raw_model))
+    booster.set_param({"nthread": 1})
+    _worker_data.update(booster=booster, feature_names=feature_names)
+
+
+def _chunk_sums(X_chunk):
+    """Sum of |interaction| and signed interaction over the rows of one chunk"""
+    import xgboost as xgb
+    data = xgb.DMatrix(X_chunk, feature_names=_worker_data["feature_names"])
+    values = _worker_data["booster"].predict(data, pred_interactions=True)[:, :-1, :-1].astype(np.float64)
+    return np.abs(values).sum(axis=0), values.sum(axis=0), len(X_chunk)
+
+
+# ------------------------------------------------------------
+# STREAMED AGGREGATION
+# ------------------------------------------------------------
+def top_pairs(mean_abs, mean_signed, feature_names, top_n=10):
+    """Strongest off-diagonal pairs; SHAP splits each interaction over (i, j) and (j, i)"""
+    n = len(feature_names)
+    i, j = np.triu_indices(n, k=1)
+    strength = 2 * mean_abs[i, j]
+    main = np.diag(mean_abs)
+    pairs = []
+    for k in np.argsort(strength)[::-1][:top_n]:
+        a, b = i[k], j[k]
+        pairs.append({
+            "features": [feature_names[a], feature_names[b]],
+            "mean_abs_interaction": float(strength[k]),
+            "mean_interaction": float(2 * mean_signed[a, b]),
+            "relative_to_main_effects": float(strength[k] / max(main[a] + main[b], 1e-12)),
+        })
+    return pairs
+
+
+def run_interactions(model, X, max_rows=400, chunk_size=20, workers=None, top_n=10, seed=42):
+    """
+    Mean |interaction| matrix over a row sample, computed chunk by chunk.
+
+    Returns a dict with the top-N pairs, the strongest main effects, the
+    full mean-|interaction| matrix and timing.
+    """
+    feature_names = list(X.columns)
+    X_arr = np.asarray(X, dtype=np.float32)
+    if max_rows and len(X_arr) > max_rows:
+        rng = np.random.default_rng(seed)
+        X_arr = X_arr[np.sort(rng.choice(len(X_arr), size=max_rows, replace=False))]
+    chunks = [X_arr[start:start + chunk_size] for start in range(0, len(X_arr), chunk_size)]
+    workers = min(len(chunks), workers or os.cpu_count() or 1)
+
+    raw_model = bytes(model.get_booster().save_raw("ubj"))
+    n_features = len(feature_names)
+    abs_sum = np.zeros((n_features, n_features))
+    signed_sum = np.zeros((n_features, n_features))
+    n_rows = 0
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(raw_model, feature_names)) as pool:
+        pending = set()
+        for chunk in chunks:
+            pending.add(pool.submit(_chunk_sums, chunk))
+            if len(pending) < 2 * workers:
+                continue
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                chunk_abs, chunk_signed, rows = future.result()
+                abs_sum += chunk_abs
+                signed_sum += chunk_signed
+                n_rows += rows
+            print(f"  → {n_rows}/{len(X_arr)} filas")
+        for future in pending:
+            chunk_abs, chunk_signed, rows = future.result()
+            abs_sum += chunk_abs
+            signed_sum += chunk_signed
+            n_rows += rows
+    seconds = time.perf_counter() - start
+
+    mean_abs = abs_sum / n_rows
+    mean_signed = signed_sum / n_rows
+    main = np.diag(mean_abs)
+    return {
+        "n_rows": int(n_rows),
+        "chunk_size": int(chunk_size),
+        "workers": int(workers),
+        "seconds": seconds,
+        "top_pairs": top_pairs(mean_abs, mean_signed, feature_names, top_n),
+        "top_main_effects": [
+            {"feature": feature_names[k], "mean_abs_main_effect": float(main[k])}
+            for k in np.argsort(main)[::-1][:top_n]
+        ],
+        "feature_names": feature_names,
+        "mean_abs_matrix": mean_abs.tolist(),
+    }
+
+
+def save_interactions(report, path=INTERACTIONS_PATH):
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streamed SHAP interaction values for the saved model")
+    parser.add_argument("--rows", type=int, default=400, help="Rows of X_test to sample (0 = all)")
+    parser.add_argument("--chunk-size", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    import joblib
+    model = joblib.load("output/model.pkl")
+    X_test = joblib.load("output/X_test.pkl")
+    report = run_interactions(model, X_test, args.rows, args.chunk_size, args.workers, args.top)
+    save_interactions(report)
+    for pair in report["top_pairs"]:
+        a, b = pair["features"]
+        print(f"  {a} x {b}: {pair['mean_abs_interaction']:.4f}")
+    print(f"✅ {report['n_rows']} filas en {report['seconds']:.1f}s con {report['workers']} workers")
+    print(f"✅ Saved: {INTERACTIONS_PATH}")
+
+
+if __name__ == "__main__":
+    main()
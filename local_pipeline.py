@@ -5,15 +5,15 @@ End-to-end script that trains XGBoost, generates SHAP assets, and exports JSON i
 """
 
 import os
+import sys
 import json
 import shutil
 import warnings
+import subprocess
 from pathlib import Path
 
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
 
 from xgboost import XGBClassifier
 from sklearn.model_selection import train_test_split
@@ -25,16 +25,38 @@ from imblearn.combine import SMOTETomek
 
 import shap
 
+from features import load_dataset, check_required_columns, engineer_features, build_xy
+from feature_selection import select_features, save_selected_features
+from tuning import run_tuning, load_best_params
+from cross_validation import run_cross_validation
+from bootstrap import confidence_intervals
+from threshold_curve import build_threshold_curve, save_threshold_curve
+from figures import save_figure_inputs, render_all
+from case_index import build_case_index, save_case_index
+from neighbors import build_neighbor_indexes, save_neighbor_indexes
+from archetypes import fit_archetypes, save_archetypes
+from importance import compute_global_importance, save_global_importance
+from interactions import run_interactions, save_interactions
+from tree_export import CompiledTrees, verify as verify_compiled
+from distill import distill, evaluate_surrogate, save_surrogate, print_report, SURROGATE_FILES
+from ensemble import train_ensemble, save_ensemble, save_ensemble_scores
+from case_analysis import build_case_analysis
+from case_export import export_cases, print_changelog, cases_to_enrich, mark_enriched, write_case
+import model_registry
+from profiling import StageProfiler, print_report as print_profile
+
 # Load environment variables
 from dotenv import load_dotenv
 load_dotenv()
 
 warnings.filterwarnings("ignore")
-plt.rcParams["figure.dpi"] = 120
 
 # ------------------------------------------------------------
 # 0. OUTPUT
 # ------------------------------------------------------------
+# PIPELINE_PROFILE=1 mide cada etapa (output/profile/report.json + trace.json)
+profiler = StageProfiler.from_env()
+profiler.stage("0. OUTPUT")
 os.makedirs("output/json", exist_ok=True)
 os.makedirs("output/images", exist_ok=True)
 
@@ -43,87 +65,28 @@ print("✅ Librerías cargadas y carpetas creadas")
 # ------------------------------------------------------------
 # 1. CARGAR DATOS
 # ------------------------------------------------------------
-df = pd.read_csv("dataset.csv")
+profiler.stage("1. CARGAR DATOS")
+# DATASET_PATH: otro CSV / Parquet con las mismas columnas (p. ej. de synthetic_data.py)
+dataset_path = os.environ.get("DATASET_PATH", "dataset.csv")
+df = load_dataset(dataset_path)
 print("\n" + "="*70)
 print("📂 DATASET CARGADO")
 print("="*70)
 print(f"Shape: {df.shape}")
 print(f"Columns: {list(df.columns)}")
 
-required_cols = [
-    "id", "target_variable",
-    "cust_hitrate", "cust_interactions", "cust_contracts",
-    "product_A_sold_in_the_past", "product_B_sold_in_the_past",
-    "product_A_recommended",
-    "product_A", "product_C", "product_D",
-    "competitor_X", "competitor_Y", "competitor_Z",
-    "cust_in_iberia",
-    "opp_old", "opp_month"
-]
-
-missing = [c for c in required_cols if c not in df.columns]
-if missing:
-    raise ValueError(f"❌ Faltan columnas en dataset.csv: {missing}")
-else:
-    print("✅ Todas las columnas requeridas existen")
+check_required_columns(df)
+print("✅ Todas las columnas requeridas existen")
 
 # ------------------------------------------------------------
 # 2. FEATURE ENGINEERING (SOLO COLUMNAS EXISTENTES)
 # ------------------------------------------------------------
+profiler.stage("2. FEATURE ENGINEERING")
 print("\n" + "="*70)
 print("🔨 FEATURE ENGINEERING")
 print("="*70)
 
-df_fe = df.copy()
-
-df_fe["total_competitors"] = df_fe["competitor_X"] + df_fe["competitor_Y"] + df_fe["competitor_Z"]
-df_fe["has_competition"] = (df_fe["total_competitors"] > 0).astype(int)
-df_fe["competitor_diversity"] = (
-    (df_fe["competitor_X"] > 0).astype(int) +
-    (df_fe["competitor_Y"] > 0).astype(int) +
-    (df_fe["competitor_Z"] > 0).astype(int)
-)
-
-df_fe["customer_activity"] = (
-    df_fe["cust_hitrate"] + df_fe["cust_interactions"] + df_fe["cust_contracts"]
-) / 3.0
-df_fe["customer_engagement"] = df_fe["cust_hitrate"] * df_fe["cust_interactions"]
-df_fe["contract_hitrate_ratio"] = df_fe["cust_contracts"] / (df_fe["cust_hitrate"] + 1e-3)
-
-df_fe["total_past_sales"] = df_fe["product_A_sold_in_the_past"] + df_fe["product_B_sold_in_the_past"]
-df_fe["product_A_ratio"] = df_fe["product_A_sold_in_the_past"] / (df_fe["total_past_sales"] + 1e-3)
-df_fe["has_past_sales"] = (df_fe["total_past_sales"] > 0).astype(int)
-
-df_fe["opp_age_squared"] = df_fe["opp_old"] ** 2
-df_fe["opp_maturity"] = np.log1p(df_fe["opp_old"] + 10)
-df_fe["is_new_opp"] = (df_fe["opp_old"] < -0.5).astype(int)
-df_fe["is_mature_opp"] = (df_fe["opp_old"] > 1.0).astype(int)
-
-df_fe["product_mix"] = df_fe["product_A"] + df_fe["product_C"] + df_fe["product_D"]
-df_fe["product_count"] = (
-    (df_fe["product_A"] > 0).astype(int) +
-    (df_fe["product_C"] > 0).astype(int) +
-    (df_fe["product_D"] > 0).astype(int)
-)
-
-df_fe["hitrate_interaction"] = df_fe["cust_hitrate"] * df_fe["cust_interactions"]
-df_fe["hitrate_contracts"] = df_fe["cust_hitrate"] * df_fe["cust_contracts"]
-df_fe["competition_engagement"] = df_fe["total_competitors"] * df_fe["customer_engagement"]
-
-df_fe["competition_risk"] = df_fe["total_competitors"] / (df_fe["customer_activity"] + 1e-3)
-df_fe["low_engagement_risk"] = (
-    (df_fe["cust_interactions"] < df_fe["cust_interactions"].median()) &
-    (df_fe["total_competitors"] > 0)
-).astype(int)
-
-df_fe["opp_quality_score"] = (
-    df_fe["cust_hitrate"] * 0.3 +
-    df_fe["customer_activity"] * 0.3 +
-    df_fe["product_A_ratio"] * 0.4
-)
-
-df_fe["iberia_competition"] = df_fe["cust_in_iberia"] * df_fe["total_competitors"]
-df_fe["iberia_engagement"] = df_fe["cust_in_iberia"] * df_fe["customer_engagement"]
+df_fe = engineer_features(df)
 
 print(f"✅ Features finales: {df_fe.shape[1]} (incluyendo id y target)")
 print(f"✅ Nuevas columnas creadas: {df_fe.shape[1] - len(df.columns)}")
@@ -131,13 +94,12 @@ print(f"✅ Nuevas columnas creadas: {df_fe.shape[1] - len(df.columns)}")
 # ------------------------------------------------------------
 # 3. PREPARAR X, y
 # ------------------------------------------------------------
+profiler.stage("3. PREPARAR X, y")
 print("\n" + "="*70)
 print("📐 PREPARACIÓN DE DATOS")
 print("="*70)
 
-X = df_fe.drop(columns=["id", "target_variable"])
-X = X.select_dtypes(include=[np.number])
-y = df_fe["target_variable"]
+X, y = build_xy(df_fe)
 
 print(f"X shape: {X.shape}, y shape: {y.shape}")
 
@@ -148,9 +110,38 @@ X_train, X_test, y_train, y_test = train_test_split(
 print(f"✅ Train: {X_train.shape}")
 print(f"✅ Test : {X_test.shape}")
 
+# ------------------------------------------------------------
+# 3.5 PODA DE FEATURES REDUNDANTES
+# ------------------------------------------------------------
+profiler.stage("3.5 PODA DE FEATURES REDUNDANTES")
+# Duplicados exactos, |r| >= 0.995 e importancia cero (modelo sonda), sobre X_train.
+# Opt-in (FEATURE_PRUNING=1): cambia el conjunto de features del modelo y el benchmark
+# no mide mejora de SHAP ni de inferencia. Por defecto se entrena con todas las features.
+if os.environ.get("FEATURE_PRUNING", "0") == "1":
+    print("\n" + "="*70)
+    print("✂️ PODA DE FEATURES REDUNDANTES")
+    print("="*70)
+
+    selection = select_features(X_train, y_train, corr_threshold=0.995)
+    save_selected_features(selection, "output/selected_features.json")
+    for column, why in selection["dropped"].items():
+        detail = f" ({why['of']})" if "of" in why else ""
+        print(f"  - {column}: {why['reason']}{detail}")
+
+    selected_features = selection["selected"]
+    X = X[selected_features]
+    X_train = X_train[selected_features]
+    X_test = X_test[selected_features]
+    print(f"✅ {selection['n_selected']}/{selection['n_original']} features seleccionadas "
+          f"(output/selected_features.json)")
+elif os.path.exists("output/selected_features.json"):
+    # Tuning / CV / benchmarks would otherwise follow an earlier run's pruned list
+    os.remove("output/selected_features.json")
+
 # ------------------------------------------------------------
 # 4. SMOTETomek
 # ------------------------------------------------------------
+profiler.stage("4. SMOTETomek")
 print("\n" + "="*70)
 print("⚖️ SMOTETomek BALANCING")
 print("="*70)
@@ -168,34 +159,53 @@ print(f"✅ Train balanceado: {X_train_bal.shape}")
 # ------------------------------------------------------------
 # 5. XGBoost
 # ------------------------------------------------------------
+profiler.stage("5. XGBoost")
 print("\n" + "="*70)
 print("🤖 ENTRENANDO XGBOOST")
 print("="*70)
 
-best_params = {
-    "n_estimators": 591,
-    "max_depth": 11,
-    "learning_rate": 0.08699593128513321,
-    "subsample": 0.9237068376069122,
-    "colsample_bytree": 0.8494749947027712,
-    "min_child_weight": 1,
-    "gamma": 0.2773435281567039,
-    "reg_alpha": 0.1959828624191452,
-    "reg_lambda": 0.045227288910538066,
-    "scale_pos_weight": 1.0650660661526528,
-    "random_state": 42,
-    "eval_metric": "logloss",
-    "use_label_encoder": False
-}
+tuning_trials = os.environ.get("TUNING_TRIALS")
+tuning_budget = os.environ.get("TUNING_TIME_BUDGET")
+if tuning_trials or tuning_budget:
+    print("🎛️ Buscando hiperparámetros (successive halving en paralelo)...")
+    run_tuning(
+        X_train, y_train,
+        max_trials=int(tuning_trials) if tuning_trials else None,
+        time_budget=float(tuning_budget) if tuning_budget else None,
+        workers=int(os.environ.get("TUNING_WORKERS", 0)) or None
+    )
+
+# Tuned values from output/tuning/best_params.json, or the datathon defaults
+best_params = load_best_params()
+print(f"Parámetros: {best_params}")
 
 xgb_model = XGBClassifier(**best_params)
 xgb_model.fit(X_train_bal, y_train_bal)
 
 print("✅ XGBoost entrenado")
 
+# ------------------------------------------------------------
+# 5.5 (OPCIONAL) CROSS-VALIDATION + THRESHOLD ESTABLE
+# ------------------------------------------------------------
+profiler.stage("5.5 CROSS-VALIDATION + THRESHOLD ESTABLE")
+# CV_FOLDS=5 entrena los folds en paralelo y elige el threshold sobre las
+# probabilidades out-of-fold agregadas en lugar de un único split.
+cv_folds = int(os.environ.get("CV_FOLDS", 0))
+cv_report = None
+if cv_folds > 1:
+    print("\n" + "="*70)
+    print(f"🔁 CROSS-VALIDATION ({cv_folds} folds en paralelo)")
+    print("="*70)
+    cv_report = run_cross_validation(
+        X_train, y_train, best_params,
+        n_splits=cv_folds,
+        workers=int(os.environ.get("CV_WORKERS", 0)) or None
+    )
+
 # ------------------------------------------------------------
 # 6. EVALUACIÓN + OPTIMAL THRESHOLD (por F1)
 # ------------------------------------------------------------
+profiler.stage("6. EVALUACIÓN + OPTIMAL THRESHOLD")
 print("\n" + "="*70)
 print("📊 EVALUACIÓN DEL MODELO")
 print("="*70)
@@ -207,6 +217,10 @@ f1_scores = 2 * precisions * recalls / (precisions + recalls + 1e-10)
 best_idx = np.argmax(f1_scores)
 best_th = thresholds[best_idx] if len(thresholds) > 0 else 0.5
 
+if cv_report is not None:
+    print(f"Threshold del split de test: {best_th:.3f} → usando el threshold OOF de CV")
+    best_th = cv_report["pooled"]["threshold"]
+
 y_pred = (y_prob >= best_th).astype(int)
 
 f1 = f1_score(y_test, y_pred)
@@ -222,9 +236,24 @@ print(f"Precision: {precision:.4f}")
 print(f"Recall   : {recall:.4f}")
 print(f"Accuracy : {acc:.4f}")
 
+# Intervalos bootstrap (BOOTSTRAP_REPLICATES=0 para desactivar)
+n_bootstrap = int(os.environ.get("BOOTSTRAP_REPLICATES", 2000))
+metric_intervals = None
+if n_bootstrap > 0:
+    metric_intervals = confidence_intervals(
+        y_test.values, y_prob, best_th,
+        n_boot=n_bootstrap,
+        workers=int(os.environ.get("BOOTSTRAP_WORKERS", 1))
+    )
+    ci = metric_intervals["metrics"]
+    print(f"\nIC 95% bootstrap ({n_bootstrap} réplicas, {metric_intervals['seconds']:.2f}s):")
+    for name in ["f1_score", "auc", "precision", "recall", "accuracy"]:
+        print(f"  {name:<10}: [{ci[name]['low']:.4f}, {ci[name]['high']:.4f}]")
+
 # ------------------------------------------------------------
 # 7. SHAP
 # ------------------------------------------------------------
+profiler.stage("7. SHAP")
 print("\n" + "="*70)
 print("🔍 SHAP EXPLAINABILITY")
 print("="*70)
@@ -248,61 +277,102 @@ sample_idx = X_sample.index
 sample_positions = [X_test.index.get_loc(i) for i in sample_idx]
 shap_sample = shap_values_full[sample_positions]
 
-plt.figure(figsize=(10, 6))
-shap.summary_plot(shap_sample, X_sample, show=False, max_display=20)
-plt.title("SHAP Summary Plot - Top 20 Features", fontsize=14, fontweight="bold")
-plt.tight_layout()
-plt.savefig("output/images/shap_summary.png", dpi=300, bbox_inches="tight")
-plt.close()
-print("✅ Saved: output/images/shap_summary.png")
-
 feature_importance = pd.DataFrame({
     "feature": X.columns,
     "importance": xgb_model.feature_importances_
 }).sort_values("importance", ascending=False)
 
-plt.figure(figsize=(8, 8))
-top_15 = feature_importance.head(15)
-sns.barplot(data=top_15, x="importance", y="feature", orient="h")
-plt.title("Top 15 Feature Importances (XGBoost)", fontsize=14, fontweight="bold")
-plt.xlabel("Importance")
-plt.ylabel("Feature")
-plt.tight_layout()
-plt.savefig("output/images/feature_importance.png", dpi=300, bbox_inches="tight")
-plt.close()
-print("✅ Saved: output/images/feature_importance.png")
-
-plt.figure(figsize=(12, 5))
-
-plt.subplot(1, 2, 1)
-plt.hist(y_prob[y_test == 0], bins=40, alpha=0.7, label="Actual Loss", color="red")
-plt.hist(y_prob[y_test == 1], bins=40, alpha=0.7, label="Actual Win", color="green")
-plt.xlabel("Predicted Win Probability")
-plt.ylabel("Frequency")
-plt.title("Probability Distribution by Actual Outcome")
-plt.legend()
-plt.grid(alpha=0.3)
-
-plt.subplot(1, 2, 2)
 bins_prob = [0, 0.3, 0.5, 0.7, 1.0]
 labels_prob = ["Low", "Medium", "High", "Very High"]
 prob_categories = pd.cut(y_prob, bins=bins_prob, labels=labels_prob)
 category_counts = prob_categories.value_counts().reindex(labels_prob, fill_value=0)
-colors = ["red", "orange", "lightgreen", "darkgreen"]
-plt.bar(category_counts.index, category_counts.values, color=colors)
-plt.xlabel("Confidence Level")
-plt.ylabel("Number of Opportunities")
-plt.title("Prediction Confidence Distribution")
-plt.grid(alpha=0.3, axis="y")
 
-plt.tight_layout()
-plt.savefig("output/images/probability_distribution.png", dpi=300, bbox_inches="tight")
-plt.close()
-print("✅ Saved: output/images/probability_distribution.png")
+profiler.stage("7. SHAP: figuras")
+# Las figuras se renderizan fuera del camino crítico (figures.py) a partir de
+# estos arrays. FIGURES=sync para esperar al render, FIGURES=off para omitirlo.
+save_figure_inputs(
+    shap_sample=shap_sample,
+    X_sample=X_sample.values,
+    feature_names=np.array(X.columns, dtype=str),
+    importances=xgb_model.feature_importances_,
+    y_prob=y_prob,
+    y_test=y_test.values
+)
+print("✅ Saved: output/figures/inputs.npz")
+
+# En segundo plano se espera al render antes de publicar la versión (11.5), que incluye shap_summary.png
+figures_mode = os.environ.get("FIGURES", "background")
+render_process = None
+if figures_mode == "sync":
+    render_all()
+elif figures_mode != "off":
+    with open("output/figures/render.log", "w") as render_log:
+        render_process = subprocess.Popen(
+            [sys.executable, str(Path(__file__).resolve().parent / "figures.py")],
+            stdout=render_log, stderr=subprocess.STDOUT, start_new_session=True
+        )
+    print("🎨 Renderizando figuras en segundo plano (log: output/figures/render.log)")
+elif os.path.exists("output/images/web/shap_summary.png"):
+    # Rendered for an earlier run's model; it would be published with this one
+    os.remove("output/images/web/shap_summary.png")
+
+# ------------------------------------------------------------
+# 7.5 IMPORTANCIA GLOBAL (gain + mean |SHAP| + permutation)
+# ------------------------------------------------------------
+profiler.stage("7.5 IMPORTANCIA GLOBAL")
+# PERMUTATION_REPEATS=0 omite la permutation importance
+print("\n" + "="*70)
+print("📊 IMPORTANCIA GLOBAL (gain, SHAP, permutation)")
+print("="*70)
+
+permutation_repeats = int(os.environ.get("PERMUTATION_REPEATS", "5"))
+permutation_workers = int(os.environ.get("PERMUTATION_WORKERS", "0")) or None
+permutation_max_samples = int(os.environ.get("PERMUTATION_MAX_SAMPLES", "0")) or None
+
+importance_table, permutation_info = compute_global_importance(
+    xgb_model, X_test, y_test, shap_values_full,
+    n_repeats=permutation_repeats,
+    workers=permutation_workers,
+    max_samples=permutation_max_samples
+)
+save_global_importance(importance_table, permutation_info, "output/importance.json")
+
+if permutation_info:
+    print(f"Permutation importance: {permutation_info['n_samples']:,} filas x {permutation_info['n_repeats']} "
+          f"repeticiones · {permutation_info['seconds']:.1f}s con {permutation_info['workers']} workers")
+print(importance_table[[c for c in ["gain", "mean_abs_shap", "permutation_mean"] if c in importance_table]].head(10).to_string())
+print("✅ Saved: output/importance.json")
+
+# ------------------------------------------------------------
+# 7.6 (OPCIONAL) SHAP INTERACTION VALUES
+# ------------------------------------------------------------
+profiler.stage("7.6 SHAP INTERACTION VALUES")
+# Muy costoso con árboles profundos (~2.5s por fila y CPU):
+# SHAP_INTERACTION_ROWS=400 lo activa sobre una muestra de X_test.
+interaction_rows = int(os.environ.get("SHAP_INTERACTION_ROWS", "0"))
+interaction_report = None
+if interaction_rows > 0:
+    print("\n" + "="*70)
+    print(f"🔗 SHAP INTERACTION VALUES ({interaction_rows} filas)")
+    print("="*70)
+
+    interaction_report = run_interactions(
+        xgb_model, X_test,
+        max_rows=interaction_rows,
+        workers=int(os.environ.get("INTERACTION_WORKERS", "0")) or None,
+        top_n=int(os.environ.get("INTERACTION_TOP_N", "10"))
+    )
+    save_interactions(interaction_report, "output/interactions.json")
+    for pair in interaction_report["top_pairs"][:5]:
+        print(f"  {pair['features'][0]} x {pair['features'][1]}: {pair['mean_abs_interaction']:.4f}")
+    print(f"✅ {interaction_report['n_rows']} filas en {interaction_report['seconds']:.1f}s "
+          f"con {interaction_report['workers']} workers")
+    print("✅ Saved: output/interactions.json")
 
 # ------------------------------------------------------------
 # 8. GLOBAL JSON INSIGHTS
 # ------------------------------------------------------------
+profiler.stage("8. GLOBAL JSON INSIGHTS")
 print("\n" + "="*70)
 print("💾 GUARDANDO GLOBAL_INSIGHTS.JSON")
 print("="*70)
@@ -347,10 +417,22 @@ global_insights = {
         "recall": float(recall),
         "accuracy": float(acc)
     },
+    "model_performance_ci": metric_intervals,
     "feature_importance_top20": {
         feature: float(importance)
         for feature, importance in feature_importance.head(20).values
     },
+    "feature_importance_shap_top20": {
+        feature: float(value)
+        for feature, value in importance_table["mean_abs_shap"].head(20).items()
+    },
+    "feature_importance_permutation_top20": (
+        {
+            feature: float(value)
+            for feature, value in importance_table["permutation_mean"].sort_values(ascending=False).head(20).items()
+        }
+        if permutation_info else None
+    ),
     "prediction_distribution": {
         "total_samples": int(len(y_test)),
         "predicted_wins": int(y_pred.sum()),
@@ -361,6 +443,22 @@ global_insights = {
         "probability_buckets": probability_buckets
     },
     "feature_statistics": feature_statistics,
+    "cross_validation": (
+        {
+            "n_splits": cv_report["n_splits"],
+            "pooled": cv_report["pooled"],
+            "per_fold_summary": cv_report["per_fold_summary"],
+            "threshold_stability": cv_report["threshold_stability"]
+        }
+        if cv_report is not None else None
+    ),
+    "top_interactions": (
+        {
+            "n_rows": interaction_report["n_rows"],
+            "pairs": interaction_report["top_pairs"]
+        }
+        if interaction_report is not None else None
+    ),
     "shap_drivers": {
         "top_positive": top_positive_drivers,
         "top_negative": top_negative_drivers
@@ -386,9 +484,61 @@ with open("output/json/global_insights.json", "w") as f:
 
 print("✅ Saved: output/json/global_insights.json")
 
+# ------------------------------------------------------------
+# 8.5 ARQUETIPOS DE EXPLICACIÓN (clustering de SHAP)
+# ------------------------------------------------------------
+profiler.stage("8.5 ARQUETIPOS DE EXPLICACIÓN")
+# N_ARCHETYPES=0 desactiva esta etapa
+n_archetypes = int(os.environ.get("N_ARCHETYPES", "8"))
+if n_archetypes > 0:
+    print("\n" + "="*70)
+    print(f"🧩 ARQUETIPOS DE EXPLICACIÓN (MiniBatchKMeans, k={n_archetypes})")
+    print("="*70)
+
+    archetypes = fit_archetypes(
+        shap_values_full, X_test, y_test, y_prob, xgb_model,
+        n_archetypes=n_archetypes, threshold=best_th
+    )
+    save_archetypes(archetypes, "output/archetypes.json")
+
+    for arch in sorted(archetypes["archetypes"], key=lambda a: -a["size"]):
+        print(f"  #{arch['id']} {arch['name']:<45} n={arch['size']:>5}  win rate={arch['win_rate']:.2f}")
+    print(f"  Asignación rápida (sin SHAP) coincide en {archetypes['fast_assignment_agreement']:.1%} de los casos")
+    print("✅ Saved: output/archetypes.json")
+
+# ------------------------------------------------------------
+# 8.6 (OPCIONAL) ENSEMBLE MULTI-SEED → INCERTIDUMBRE POR CASO
+# ------------------------------------------------------------
+profiler.stage("8.6 ENSEMBLE MULTI-SEED → INCERTIDUMBRE POR CASO")
+ensemble_scores = None
+ensemble_members = int(os.environ.get("ENSEMBLE_MEMBERS", 0))
+if ensemble_members > 1:
+    print("\n" + "="*70)
+    print(f"🎲 ENSEMBLE ({ensemble_members} miembros, en paralelo)")
+    print("="*70)
+
+    ensemble = train_ensemble(
+        X_train_bal, y_train_bal,
+        n_members=ensemble_members,
+        mode=os.environ.get("ENSEMBLE_MODE", "bootstrap"),
+        workers=int(os.environ.get("ENSEMBLE_WORKERS", 0)) or None,
+        params=best_params
+    )
+    ensemble_scores = ensemble.predict(X_test, best_th)
+    save_ensemble(ensemble, "output/ensemble.pkl")
+    save_ensemble_scores(ensemble_scores, "output/ensemble_scores.parquet")
+
+    training = ensemble.training
+    print(f"✅ Entrenado en {training['wall_seconds']:.1f}s con {training['workers']} workers "
+          f"(suma por miembro {sum(training['member_seconds']):.1f}s) · {ensemble.nbytes / 1e6:.1f} MB")
+    print(f"  AUC media del ensemble: {roc_auc_score(y_test, ensemble_scores['mean_probability']):.4f}")
+    print(ensemble_scores["confidence"].value_counts().to_string())
+    print("✅ Saved: output/ensemble.pkl, output/ensemble_scores.parquet")
+
 # ------------------------------------------------------------
 # 9. INDIVIDUAL OPPORTUNITY JSON (todos los casos)
 # ------------------------------------------------------------
+profiler.stage("9. INDIVIDUAL OPPORTUNITY JSON")
 print("\n" + "="*70)
 print("👤 INDIVIDUAL OPPORTUNITY ANALYSIS (todos los casos)")
 print("="*70)
@@ -399,118 +549,46 @@ if isinstance(base_val, (list, np.ndarray)):
 else:
     base_val = float(base_val)
 
-def get_factor_explanation(feature_name: str) -> str:
-    explanations = {
-        "customer_activity": "Nivel global de actividad del cliente",
-        "customer_engagement": "Interacciones y calidad de relación con el cliente",
-        "total_competitors": "Número total de competidores presentes",
-        "competitor_diversity": "Diversidad de competidores en la oferta",
-        "opp_old": "Antigüedad de la oportunidad",
-        "opp_maturity": "Madurez de la oportunidad",
-        "opp_quality_score": "Score agregado de calidad de oportunidad",
-        "product_A_ratio": "Peso de ventas históricas de Product A",
-        "total_past_sales": "Volumen total de ventas históricas",
-        "cust_hitrate": "Tasa de éxito histórica con el cliente",
-        "cust_interactions": "Número de interacciones con el cliente",
-        "cust_contracts": "Número de contratos con el cliente",
-        "has_competition": "Indicador de presencia de competencia",
-        "competition_risk": "Riesgo asociado a la competencia",
-        "product_mix": "Diversidad de productos activos",
-        "product_count": "Número de líneas de producto en la oportunidad",
-        "iberia_competition": "Competencia en clientes de Iberia",
-        "iberia_engagement": "Engagement de clientes de Iberia"
-    }
-    return explanations.get(feature_name, feature_name.replace("_", " ").title())
-
 test_indices = X_test.index
 
-for idx_count, idx in enumerate(test_indices, start=1):
-    row_pos = X_test.index.get_loc(idx)
-    x_row = X_test.loc[idx]
-    shap_row = shap_values_full[row_pos]
-    actual = int(y_test.loc[idx])
-    prob = float(y_prob[row_pos])
-    pred = int(prob >= best_th)
-
-    shap_pairs = list(zip(X.columns, shap_row))
-    shap_sorted = sorted(shap_pairs, key=lambda x: abs(x[1]), reverse=True)
-
-    top_positive = [(f, float(v)) for f, v in shap_sorted if v > 0][:5]
-    top_negative = [(f, float(v)) for f, v in shap_sorted if v < 0][:5]
-
-    if x_row.get("total_competitors", 0) > 0:
-        competitive_action = "Monitor competitive landscape and adjust pricing/offer."
-    else:
-        competitive_action = "Capitalize on the lack of competition to close fast."
-
-    confidence = "High" if abs(prob - best_th) > 0.3 else ("Medium" if abs(prob - best_th) > 0.15 else "Low")
-
-    analysis = {
-        "opportunity_id": str(idx),
-        "prediction": {
-            "predicted_outcome": "Win" if pred == 1 else "Loss",
-            "actual_outcome": "Win" if actual == 1 else "Loss",
-            "win_probability": prob,
-            "threshold": float(best_th),
-            "confidence": confidence
-        },
-        "key_features": {
-            "customer_activity": float(x_row.get("customer_activity", 0.0)),
-            "total_competitors": float(x_row.get("total_competitors", 0.0)),
-            "opp_quality_score": float(x_row.get("opp_quality_score", 0.0)),
-            "cust_hitrate": float(x_row.get("cust_hitrate", 0.0)),
-            "product_A_ratio": float(x_row.get("product_A_ratio", 0.0))
-        },
-        "shap_analysis": {
-            "base_value": base_val,
-            "prediction_value": float(base_val + shap_row.sum()),
-            "top_positive_factors": [
-                {
-                    "feature": feat,
-                    "shap_value": val,
-                    "explanation": get_factor_explanation(feat)
-                }
-                for feat, val in top_positive
-            ],
-            "top_negative_factors": [
-                {
-                    "feature": feat,
-                    "shap_value": val,
-                    "explanation": get_factor_explanation(feat)
-                }
-                for feat, val in top_negative
-            ]
-        },
-        "business_recommendation": {
-            "action": (
-                "Accelerate"
-                if prob > 0.7 else
-                ("Nurture" if prob > 0.4 else "Re-evaluate")
-            ),
-            "priority": (
-                "High"
-                if prob > 0.7 else
-                ("Medium" if prob > 0.4 else "Low")
-            ),
-            "next_steps": [
-                "Leverage existing engagement" if prob > 0.5 else "Increase touchpoints and engagement",
-                "Maintain momentum with key stakeholders" if pred == 1 else "Clarify blockers with decision-makers",
-                competitive_action
-            ]
-        }
-    }
 
-    with open(f"output/json/{idx}.json", "w") as f:
-        json.dump(analysis, f, indent=2)
+def case_analyses():
+    for idx_count, idx in enumerate(test_indices, start=1):
+        row_pos = X_test.index.get_loc(idx)
 
-    if idx_count % 50 == 0:
-        print(f"  → {idx_count}/{len(test_indices)} JSONs generados")
+        confidence, uncertainty = None, None
+        if ensemble_scores is not None:
+            # Member spread replaces the distance-to-threshold rule
+            member = ensemble_scores.loc[idx]
+            confidence = str(member["confidence"])
+            uncertainty = {
+                "members": ensemble_members,
+                "mean_probability": float(member["mean_probability"]),
+                "std": float(member["std"]),
+                "agreement": float(member["agreement"]),
+            }
 
-print(f"✅ {len(test_indices)} análisis individuales guardados en output/json/")
+        yield idx, build_case_analysis(
+            idx, X_test.loc[idx], shap_values_full[row_pos], X.columns,
+            prob=float(y_prob[row_pos]), threshold=best_th, base_value=base_val,
+            actual=int(y_test.loc[idx]), confidence=confidence, uncertainty=uncertainty
+        )
+
+        if idx_count % 1000 == 0:
+            print(f"  → {idx_count}/{len(test_indices)} casos comparados")
+
+
+# Only cases whose fingerprint (bucket, outcome, action, top factors) changed are rewritten
+case_changelog = export_cases(
+    case_analyses(), "output/json", full=os.environ.get("CASE_EXPORT", "incremental") == "full"
+)
+print_changelog(case_changelog)
+print(f"✅ {len(test_indices)} análisis individuales al día en output/json/ (changelog en output/case_changelog.json)")
 
 # ------------------------------------------------------------
 # 10. SAVE MODEL & DATA FOR STREAMLIT
 # ------------------------------------------------------------
+profiler.stage("10. SAVE MODEL & DATA FOR STREAMLIT")
 print("\n" + "="*70)
 print("💾 SAVING MODEL & DATA FOR STREAMLIT")
 print("="*70)
@@ -527,12 +605,32 @@ joblib.dump(list(X.columns), "output/feature_names.pkl")
 with open("output/threshold.txt", "w") as f:
     f.write(str(best_th))
 
+# Sorted probabilities + cumulative TP/FP for the app's Threshold Explorer
+save_threshold_curve(build_threshold_curve(y_test, y_prob), "output/threshold_curve.npz")
+
+# Columnar case index for the app's Portfolio page
+case_index = build_case_index(
+    X_test.index, y_prob, y_test, shap_values_full, X.columns, best_th,
+    confidence=None if ensemble_scores is None else ensemble_scores["confidence"]
+)
+save_case_index(case_index, "output/case_index.parquet")
+
+# Similar-opportunity indexes (feature space and SHAP space) for the Case Explorer
+save_neighbor_indexes(build_neighbor_indexes(X_test, shap_values_full), "output/neighbors.pkl")
+
+# Booster flattened to NumPy arrays for xgboost-free scoring
+compiled_trees = CompiledTrees.from_model(xgb_model)
+compiled_trees.save("output/model_trees.npz")
+print(f"✅ Árboles compilados: {compiled_trees.n_trees} · error máx. vs booster "
+      f"{verify_compiled(compiled_trees, xgb_model, X_test):.1e}")
+
 metadata = {
     "n_features": len(X.columns),
     "n_test_samples": len(X_test),
     "threshold": float(best_th),
     "f1": float(f1),
-    "auc": float(auc)
+    "auc": float(auc),
+    "cust_interactions_median": float(df["cust_interactions"].median())
 }
 with open("output/metadata.json", "w") as f:
     json.dump(metadata, f, indent=2)
@@ -540,8 +638,36 @@ with open("output/metadata.json", "w") as f:
 print("✅ Model, explainer, data, and metadata saved in output/")
 
 # ------------------------------------------------------------
-# 11. GEMINI AI FOR INSIGHTS (ALL 300 CASES)
+# 10.5 MODELO COMPACTO (DISTILLATION) PARA EL WHAT-IF
+# ------------------------------------------------------------
+profiler.stage("10.5 MODELO COMPACTO PARA EL WHAT-IF")
+# Opt-in (e.g. DISTILL_TREES=250): the surrogates measured so far miss the What-If preview gate
+distill_trees = int(os.environ.get("DISTILL_TREES", 0))
+if distill_trees > 0:
+    print("\n" + "="*70)
+    print("📦 DISTILLATION: MODELO COMPACTO PARA EL WHAT-IF")
+    print("="*70)
+
+    surrogate, n_distill_rows = distill(
+        xgb_model, X_train_bal,
+        n_estimators=distill_trees,
+        max_depth=int(os.environ.get("DISTILL_DEPTH", 8))
+    )
+    surrogate_report = evaluate_surrogate(xgb_model, surrogate, X_test, y_test, best_th)
+    save_surrogate(surrogate, surrogate_report, "output")
+    print(f"Entrenado sobre {n_distill_rows:,} filas (balanceadas + jitter + escenarios What-If) etiquetadas por el modelo completo")
+    print_report(surrogate_report)
+    print("✅ Saved: output/surrogate.pkl, output/surrogate_trees.npz, output/surrogate.json")
+else:
+    # A surrogate of an earlier run's model must not be published with this one
+    for name in SURROGATE_FILES:
+        if os.path.exists(f"output/{name}"):
+            os.remove(f"output/{name}")
+
+# ------------------------------------------------------------
+# 11. GEMINI AI FOR INSIGHTS (CASOS PENDIENTES DE ENRIQUECER)
 # ------------------------------------------------------------
+profiler.stage("11. GEMINI AI")
 # FREE TIER: 15 requests/min → 4s delay between requests (~20 min total)
 # PAID API: Remove time.sleep(4) for instant processing (~2 min total)
 # ------------------------------------------------------------
@@ -594,11 +720,12 @@ Task:
 
         print("✅ LLM insights guardados en output/json/global_insights.json")
 
-        # ----- Case recommendations (ALL 300 cases with LLM) -----
+        # ----- Case recommendations (oldest pending cases first, up to 300; the rest wait for the next run) -----
         import time
-        sample_indices = list(X_test.index[:300])
+        sample_indices = cases_to_enrich()[:int(os.environ.get("GEMINI_MAX_CASES", 300))]
         total_cases = len(sample_indices)
         enhanced = 0
+        enriched_ids = []
 
         print(f"\n🔄 Processing {total_cases} cases with LLM (4s delay between requests for free tier)")
         print(f"⏱️ Estimated time: ~{total_cases * 4 / 60:.1f} minutes\n")
@@ -639,8 +766,8 @@ Output 3 actionable next steps in JSON under 'next_steps'. One sentence per step
                         case_data["business_recommendation"]["next_steps"] = llm_case.get("next_steps", case_data["business_recommendation"]["next_steps"])
                         case_data["business_recommendation"]["ai_generated"] = True
 
-                        with open(json_path, "w") as f:
-                            json.dump(case_data, f, indent=2, ensure_ascii=False)
+                        write_case(json_path, case_data)
+                        enriched_ids.append(idx)
                         enhanced += 1
                         break  # Success, exit retry loop
                     except Exception as retry_error:
@@ -661,16 +788,37 @@ Output 3 actionable next steps in JSON under 'next_steps'. One sentence per step
             if i < total_cases:  # Don't sleep after last request
                 time.sleep(4)
 
-        print(f"\n✅ Recomendaciones AI generadas para {enhanced} oportunidades")
+        remaining = mark_enriched(enriched_ids)
+        print(f"\n✅ Recomendaciones AI generadas para {enhanced} oportunidades · {remaining} pendientes para la próxima ejecución")
 
     except Exception as e:
         print(f"⚠️ No se pudieron generar insights con Gemini: {e}")
 else:
     print("\nℹ️ Saltando sección Gemini (define GEMINI_API_KEY para habilitarla).")
 
+# ------------------------------------------------------------
+# 11.5 REGISTRO DE VERSIONES (la app cambia en el siguiente rerun)
+# Tras Gemini: la versión incluye global_insights.json con los textos del LLM
+# ------------------------------------------------------------
+profiler.stage("11.5 REGISTRO DE VERSIONES")
+registry_keep = int(os.environ.get("REGISTRY_KEEP", 5))
+if registry_keep > 0:
+    if render_process is not None and render_process.poll() is None:
+        print("\n⏳ Esperando al render de figuras para publicar la versión ...")
+        render_process.wait()
+    if render_process is not None and render_process.returncode != 0:
+        print("⚠️ El render de figuras falló (output/figures/render.log): la versión se publica sin shap_summary.png")
+        if os.path.exists("output/images/web/shap_summary.png"):
+            os.remove("output/images/web/shap_summary.png")
+    model_version = model_registry.publish("output", source="pipeline")
+    evicted = model_registry.evict(keep_last=registry_keep)
+    print(f"\n🗂️ Versión publicada y activa: {model_version}"
+          + (f" · {len(evicted)} versiones antiguas eliminadas" if evicted else ""))
+
 # ------------------------------------------------------------
 # 12. RESUMEN FINAL
 # ------------------------------------------------------------
+profiler.stage("12. RESUMEN FINAL")
 print("\n" + "="*60)
 print("EXPLAINABILITY ANALYSIS COMPLETE")
 print("="*60)
@@ -690,3 +838,8 @@ print("  - output/images/feature_importance.png")
 print("  - output/images/probability_distribution.png")
 print("\n✅ Ready for Streamlit / PPT / Business demo")
 print("="*60)
+
+profile_report = profiler.finish()
+if profile_report is not None:
+    print("\n⏱️ PERFIL POR ETAPA (output/profile/report.json, output/profile/trace.json)")
+    print_profile(profile_report)
@@ -0,0 +1,454 @@
+# -*- coding: utf-8 -*-
+"""
+Schneider Electric Datathon - Model Registry
+Versioned copies of the model artifacts under output/registry/, so a new model
+can be published while the app keeps serving the current one:
+
+    output/registry/
+        ACTIVE                       version id the app should serve
+        activations.jsonl            activation log (used by rollback)
+        20260101-120000-1a2b3c4d/
+            manifest.json            source, metrics, parent, sha256 + size per file
+            model.pkl, explainer.pkl, feature_names.pkl, threshold.txt,
+            metadata.json, model_trees.npz, surrogate.* (when present)
+            X_test.pkl, y_test.pkl, shap_values.pkl, global_insights.json,
+            case_index.parquet, neighbors.pkl, ... (DATA_FILES, when present)
+            cases/<id>.json          per-case JSON of output/json/ (hard links)
+
+Versions are written to a temporary directory and renamed into place, and
+ACTIVE is replaced atomically, so a reader never sees a half-published
+version. HotSwapLoader follows ACTIVE: when it changes, the new bundle is
+loaded and warmed in a background thread while the old one keeps serving,
+and the swap happens on the next call after it is ready.
+
+The data the app shows next to the model (test set, SHAP matrix, global
+insights, case index, neighbours, archetypes, threshold curve, ...) is
+published with it, so a swap never pairs the new model with the previous
+run's data. ModelBundle.artifact(name) resolves those files and
+ModelBundle.case_json_path(id) the per-case JSON. The case files are
+hard-linked, not copied (most cases are unchanged between versions), so
+they must be replaced rather than rewritten in place (case_export.write_case);
+the manifest records one digest for the whole folder. Versions published
+before data files were registered read them from output/; versions
+published before the case JSON was registered have none.
+
+Without a registry the loader serves output/ directly, as before.
+
+Usage:
+    python model_registry.py publish --source pipeline
+    python model_registry.py list
+    python model_registry.py activate 20260101-120000-1a2b3c4d
+    python model_registry.py rollback
+    python model_registry.py verify
+    python model_registry.py evict --keep 3
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import argparse
+import threading
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+REGISTRY_DIR = Path("output/registry")
+REQUIRED_FILES = ["model.pkl", "explainer.pkl", "feature_names.pkl", "threshold.txt", "metadata.json"]
+OPTIONAL_FILES = ["model_trees.npz", "surrogate.pkl", "surrogate_trees.npz", "surrogate.json"]
+# Registry name -> path under the pipeline's output folder
+DATA_FILES = {
+    "X_test.pkl": "X_test.pkl",
+    "y_test.pkl": "y_test.pkl",
+    "shap_values.pkl": "shap_values.pkl",
+    "global_insights.json": "json/global_insights.json",
+    "threshold_curve.npz": "threshold_curve.npz",
+    "case_index.parquet": "case_index.parquet",
+    "neighbors.pkl": "neighbors.pkl",
+    "importance.json": "importance.json",
+    "archetypes.json": "archetypes.json",
+    "ensemble_scores.parquet": "ensemble_scores.parquet",
+    "shap_summary.png": "images/web/shap_summary.png",
+}
+# Per-case JSON: every file of output/json/ except the DATA_FILES stored there
+CASES_DIR = "cases"
+CASES_SOURCE = "json"
+OUTPUT_DIR = Path("output")
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _case_files(source_dir):
+    """Per-case JSON files of an output folder, sorted by name"""
+    folder = Path(source_dir) / CASES_SOURCE
+    if not folder.is_dir():
+        return []
+    shared = {Path(relative).name for relative in DATA_FILES.values() if relative.startswith(f"{CASES_SOURCE}/")}
+    return sorted(p for p in folder.glob("*.json") if p.name not in shared)
+
+
+def _folder_entry(paths):
+    """Manifest entry of a folder: one sha256 over (name, sha256) of its files, total size and count"""
+    digest = hashlib.sha256()
+    size = 0
+    for path in paths:
+        digest.update(f"{path.name}:{_sha256(path)}\n".encode())
+        size += path.stat().st_size
+    return {"sha256": digest.hexdigest(), "bytes": size, "count": len(paths)}
+
+
+def link_or_copy(source, target):
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def _write_atomic(path, text):
+    tmp_path = Path(f"{path}.tmp")
+    with open(tmp_path, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def active_version(root=REGISTRY_DIR):
+    """Version id in ACTIVE, or None when there is no registry"""
+    path = Path(root) / "ACTIVE"
+    if not path.exists():
+        return None
+    return path.read_text().strip() or None
+
+
+def read_manifest(version, root=REGISTRY_DIR):
+    with open(Path(root) / version / "manifest.json") as f:
+        return json.load(f)
+
+
+def list_versions(root=REGISTRY_DIR):
+    """Manifests of every published version, oldest first"""
+    root = Path(root)
+    if not root.exists():
+        return []
+    return [read_manifest(path.name, root) for path in sorted(root.iterdir())
+            if (path / "manifest.json").exists()]
+
+
+def publish(source_dir="output", root=REGISTRY_DIR, source="pipeline", metrics=None, activate_now=True):
+    """Copy the model artifacts of source_dir into a new version; returns its id"""
+    source_dir, root = Path(source_dir), Path(root)
+    missing = [name for name in REQUIRED_FILES if not (source_dir / name).exists()]
+    if missing:
+        raise FileNotFoundError(f"❌ Faltan artefactos para publicar: {missing}")
+
+    sources = {name: source_dir / name for name in REQUIRED_FILES + OPTIONAL_FILES}
+    sources.update({name: source_dir / relative for name, relative in DATA_FILES.items()})
+    sources = {name: path for name, path in sources.items() if path.exists()}
+    files = {name: {"sha256": _sha256(path), "bytes": path.stat().st_size} for name, path in sources.items()}
+    case_files = _case_files(source_dir)
+    if case_files:
+        files[CASES_DIR] = _folder_entry(case_files)
+
+    # Same model bytes published again map to the existing version
+    model_hash = files["model.pkl"]["sha256"]
+    for manifest in list_versions(root):
+        if manifest["files"] == files:
+            if activate_now:
+                activate(manifest["version"], root)
+            return manifest["version"]
+
+    version = f"{datetime.now():%Y%m%d-%H%M%S}-{model_hash[:8]}"
+    if metrics is None:
+        with open(source_dir / "metadata.json") as f:
+            metadata = json.load(f)
+        metrics = {key: metadata[key] for key in ("auc", "f1", "threshold") if key in metadata}
+    manifest = {
+        "version": version,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "source": source,
+        "parent": active_version(root),
+        "pinned": False,
+        "metrics": metrics,
+        "files": files,
+    }
+
+    root.mkdir(parents=True, exist_ok=True)
+    tmp_dir = root / f".{version}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir()
+    for name, path in sources.items():
+        shutil.copy2(path, tmp_dir / name)
+    if case_files:
+        (tmp_dir / CASES_DIR).mkdir()
+        for path in case_files:
+            link_or_copy(path, tmp_dir / CASES_DIR / path.name)
+    with open(tmp_dir / "manifest.json", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.rename(tmp_dir, root / version)
+
+    if activate_now:
+        activate(version, root)
+    return version
+
+
+def activate(version, root=REGISTRY_DIR):
+    """Point ACTIVE at version; the app switches on its next rerun"""
+    root = Path(root)
+    if not (root / version / "manifest.json").exists():
+        raise ValueError(f"❌ Versión desconocida: {version}")
+    if active_version(root) == version:
+        return
+    _write_atomic(root / "ACTIVE", version + "\n")
+    with open(root / "activations.jsonl", "a") as f:
+        f.write(json.dumps({"version": version, "at": datetime.now().isoformat(timespec="seconds")}) + "\n")
+
+
+def previous_version(root=REGISTRY_DIR):
+    """Most recently activated version other than the current one, or None"""
+    root = Path(root)
+    log_path = root / "activations.jsonl"
+    if not log_path.exists():
+        return None
+    current = active_version(root)
+    with open(log_path) as f:
+        history = [json.loads(line)["version"] for line in f if line.strip()]
+    for version in reversed(history):
+        if version != current and (root / version / "manifest.json").exists():
+            return version
+    return None
+
+
+def rollback(root=REGISTRY_DIR):
+    """Re-activate the version that was active before the current one; returns it"""
+    version = previous_version(root)
+    if version is None:
+        raise ValueError("❌ No hay ninguna versión anterior a la que volver")
+    activate(version, root)
+    return version
+
+
+def verify(version, root=REGISTRY_DIR):
+    """Files of a version whose size or sha256 no longer match the manifest"""
+    manifest = read_manifest(version, root)
+    bad = []
+    for name, info in manifest["files"].items():
+        path = Path(root) / version / name
+        if name == CASES_DIR:
+            if not path.is_dir() or _folder_entry(sorted(path.glob("*.json"))) != info:
+                bad.append(name)
+        elif not path.exists() or path.stat().st_size != info["bytes"] or _sha256(path) != info["sha256"]:
+            bad.append(name)
+    return bad
+
+
+def pin(version, pinned=True, root=REGISTRY_DIR):
+    """Pinned versions are never evicted"""
+    manifest = read_manifest(version, root)
+    manifest["pinned"] = bool(pinned)
+    _write_atomic(Path(root) / version / "manifest.json", json.dumps(manifest, indent=2))
+
+
+def evict(root=REGISTRY_DIR, keep_last=5, max_age_days=None):
+    """
+    Delete old versions; returns the removed ids. The newest keep_last
+    versions are kept, and the active one, the rollback target and pinned
+    ones are never removed; with max_age_days, older versions go even if
+    they are among the newest keep_last.
+    """
+    root = Path(root)
+    protected = {active_version(root), previous_version(root)}
+    manifests = list_versions(root)
+    now = datetime.now()
+    removed = []
+    for position, manifest in enumerate(reversed(manifests)):
+        version = manifest["version"]
+        if version in protected or manifest.get("pinned"):
+            continue
+        age_days = (now - datetime.fromisoformat(manifest["created_at"])).total_seconds() / 86400
+        too_old = max_age_days is not None and age_days > max_age_days
+        if position >= keep_last or too_old:
+            shutil.rmtree(root / version)
+            removed.append(version)
+    return removed
+
+
+# ------------------------------------------------------------
+# Loading for the app
+# ------------------------------------------------------------
+class ModelBundle:
+    """Everything the app needs from one model version, loaded and warmed"""
+
+    def __init__(self, version, path):
+        import joblib
+        from tree_export import load_compiled_trees, CompiledTrees
+
+        path = Path(path)
+        self.version = version
+        self.path = path
+        self.model = joblib.load(path / "model.pkl")
+        self.explainer = joblib.load(path / "explainer.pkl")
+        self.feature_names = joblib.load(path / "feature_names.pkl")
+        with open(path / "threshold.txt") as f:
+            self.threshold = float(f.read().strip())
+        with open(path / "metadata.json") as f:
+            self.metadata = json.load(f)
+        self.scorer = load_compiled_trees(path / "model_trees.npz", model=self.model) or self.model
+
+        self.surrogate = None
+        surrogate_paths = [path / "surrogate.pkl", path / "surrogate_trees.npz", path / "surrogate.json"]
+        if all(p.exists() for p in surrogate_paths):
+            with open(surrogate_paths[2]) as f:
+                report = json.load(f)
+            self.surrogate = (joblib.load(surrogate_paths[0]), CompiledTrees.load(surrogate_paths[1]), report)
+
+        # Versions published before data files were registered read them from output/
+        self.has_data = any((path / name).exists() or (path / relative).exists()
+                            for name, relative in DATA_FILES.items())
+
+        # First predictions pay one-off setup costs; pay them here, off the request path
+        row = np.zeros((1, len(self.feature_names)), dtype=np.float32)
+        self.scorer.predict_proba(row)
+        self.model.predict_proba(row)
+
+
+    def artifact(self, name):
+        """Path of one of DATA_FILES for this version, or None if it was not generated"""
+        relative = DATA_FILES[name]
+        candidates = [self.path / name, self.path / relative]
+        if not self.has_data:
+            candidates.append(OUTPUT_DIR / relative)
+        return next((p for p in candidates if p.exists()), None)
+
+    def case_json_path(self, case_id):
+        """Per-case JSON of this version, or None (not exported, or published before cases were versioned)"""
+        name = f"{case_id}.json"
+        # A registry version keeps them in cases/; the unregistered output/ bundle in json/
+        candidates = [self.path / CASES_DIR / name, self.path / CASES_SOURCE / name]
+        if not self.has_data:
+            candidates.append(OUTPUT_DIR / CASES_SOURCE / name)
+        return next((p for p in candidates if p.exists()), None)
+
+
+def _output_version(output_dir):
+    """Pseudo-version for an unregistered output/ folder (changes when model.pkl is rewritten)"""
+    stat = (Path(output_dir) / "model.pkl").stat()
+    return f"output@{stat.st_mtime_ns}"
+
+
+class HotSwapLoader:
+    """
+    Serves one ModelBundle and follows ACTIVE. current() is cheap (reads a
+    small file); when the target changes the new bundle is built in a
+    background thread and swapped in on the first call after it is ready.
+    """
+
+    def __init__(self, root=REGISTRY_DIR, output_dir="output", loader=ModelBundle):
+        self.root = Path(root)
+        self.output_dir = Path(output_dir)
+        self.loader = loader
+        self._lock = threading.Lock()
+        self._bundle = None
+        self._ready = None
+        self._warming = None
+        self.failed = {}
+
+    def target(self):
+        """(version id, directory) the loader should be serving"""
+        version = active_version(self.root)
+        if version is None:
+            return _output_version(self.output_dir), self.output_dir
+        return version, self.root / version
+
+    def _warm(self, version, path):
+        try:
+            bundle = self.loader(version, path)
+        except Exception as e:
+            with self._lock:
+                self.failed[version] = str(e)
+                self._warming = None
+            return
+        with self._lock:
+            self._ready = bundle
+            self._warming = None
+
+    def current(self):
+        """Bundle to use for this run; starts a background warm-up if ACTIVE moved"""
+        version, path = self.target()
+        with self._lock:
+            if self._ready is not None:
+                self._bundle, self._ready = self._ready, None
+            if self._bundle is None:
+                self._bundle = self.loader(version, path)
+                return self._bundle
+            start = (version != self._bundle.version and version != self._warming
+                     and version not in self.failed)
+            if start:
+                self._warming = version
+        if start:
+            threading.Thread(target=self._warm, args=(version, path), daemon=True).start()
+        return self._bundle
+
+    @property
+    def warming(self):
+        """Version currently being loaded in the background, or None"""
+        return self._warming
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Versioned model registry under output/registry")
+    parser.add_argument("--root", default=str(REGISTRY_DIR))
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("publish", help="Publish output/ as a new version")
+    p.add_argument("--from", dest="source_dir", default="output")
+    p.add_argument("--source", default="manual")
+    p.add_argument("--no-activate", action="store_true")
+    sub.add_parser("list")
+    p = sub.add_parser("activate")
+    p.add_argument("version")
+    sub.add_parser("rollback")
+    p = sub.add_parser("verify")
+    p.add_argument("version", nargs="?", help="Defaults to every version")
+    p = sub.add_parser("pin")
+    p.add_argument("version")
+    p.add_argument("--off", action="store_true")
+    p = sub.add_parser("evict")
+    p.add_argument("--keep", type=int, default=5)
+    p.add_argument("--max-age-days", type=float, default=None)
+    args = parser.parse_args()
+    root = Path(args.root)
+
+    if args.command == "publish":
+        version = publish(args.source_dir, root, source=args.source, activate_now=not args.no_activate)
+        print(f"✅ Publicada {version}" + ("" if args.no_activate else " (activa)"))
+    elif args.command == "list":
+        current = active_version(root)
+        for manifest in list_versions(root):
+            size = sum(info["bytes"] for info in manifest["files"].values()) / 1e6
+            metrics = " · ".join(f"{k} {v:.4f}" for k, v in manifest["metrics"].items())
+            flags = ("* " if manifest["version"] == current else "  ") + ("📌" if manifest.get("pinned") else "  ")
+            print(f"{flags} {manifest['version']}  {manifest['source']:<9} {size:6.1f} MB  {metrics}")
+    elif args.command == "activate":
+        activate(args.version, root)
+        print(f"✅ Activa: {args.version}")
+    elif args.command == "rollback":
+        print(f"↩️ Activa: {rollback(root)}")
+    elif args.command == "verify":
+        versions = [args.version] if args.version else [m["version"] for m in list_versions(root)]
+        for version in versions:
+            bad = verify(version, root)
+            print(f"{'✅' if not bad else '❌'} {version}" + (f": {', '.join(bad)}" if bad else ""))
+    elif args.command == "pin":
+        pin(args.version, not args.off, root)
+    elif args.command == "evict":
+        removed = evict(root, args.keep, args.max_age_days)
+        print(f"🧹 Eliminadas {len(removed)} versiones" + (f": {', '.join(removed)}" if removed else ""))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+Schneider Electric Datathon - Similar Opportunities
+Nearest-neighbour indexes over the test opportunities, in two similarity
+modes: engineered feature vectors (standardized) and SHAP vectors (already on
+a common log-odds scale). The pipeline persists both in output/neighbors.pkl.
+
+Small populations use an exact float32 scan. Large ones use an inverted-file
+index: vectors are grouped by k-means cell and stored contiguously, and a query
+only scans the cells whose centroids are closest.
+
+Usage:
+    python neighbors.py --benchmark --sizes 7000,100000,1000000
+"""
+
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+NEIGHBORS_PATH = Path("output/neighbors.pkl")
+EXACT_LIMIT = 50_000
+
+
+class NeighborIndex:
+    """Euclidean k-NN over a fixed set of vectors (exact or inverted-file)"""
+
+    def __init__(self, vectors, ids, standardize=False, n_lists="auto", n_probe=12, seed=42):
+        vectors = np.asarray(vectors, dtype=np.float64)
+        self.mean = vectors.mean(axis=0) if standardize else None
+        self.scale = None
+        if standardize:
+            scale = vectors.std(axis=0)
+            self.scale = np.where(scale > 0, scale, 1.0)
+            vectors = (vectors - self.mean) / self.scale
+        vectors = vectors.astype(np.float32)
+        ids = np.asarray(ids)
+
+        n = len(vectors)
+        if n_lists == "auto":
+            n_lists = int(np.sqrt(n)) if n > EXACT_LIMIT else 0
+        self.n_lists = n_lists
+        self.n_probe = min(n_probe, n_lists) if n_lists else 0
+
+        if n_lists:
+            from sklearn.cluster import MiniBatchKMeans
+            rng = np.random.default_rng(seed)
+            sample = vectors[rng.choice(n, size=min(n, 50 * n_lists), replace=False)]
+            kmeans = MiniBatchKMeans(n_clusters=n_lists, batch_size=8192, n_init=1,
+                                     max_iter=20, random_state=seed).fit(sample)
+            self.centroids = kmeans.cluster_centers_.astype(np.float32)
+            labels = self._nearest_centroids(vectors)
+            order = np.argsort(labels, kind="stable")
+            self.offsets = np.r_[0, np.cumsum(np.bincount(labels, minlength=n_lists))]
+        else:
+            self.centroids = None
+            order = np.arange(n)
+            self.offsets = None
+
+        # Rows are stored in cell order; `rows` maps back to the caller's positions
+        self.vectors = np.ascontiguousarray(vectors[order])
+        self.norms = (self.vectors.astype(np.float64) ** 2).sum(axis=1).astype(np.float32)
+        self.rows = order
+        self.ids = ids[order]
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def _nearest_centroids(self, vectors, chunk=65536):
+        c_norms = (self.centroids ** 2).sum(axis=1)
+        labels = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), chunk):
+            block = vectors[start:start + chunk]
+            labels[start:start + chunk] = np.argmin(c_norms - 2 * block @ self.centroids.T, axis=1)
+        return labels
+
+    def transform(self, vector):
+        """Bring a raw vector into the index space"""
+        vector = np.asarray(vector, dtype=np.float64)
+        if self.mean is not None:
+            vector = (vector - self.mean) / self.scale
+        return vector.astype(np.float32)
+
+    def _candidates(self, x):
+        if self.centroids is None:
+            return None
+        d = (self.centroids ** 2).sum(axis=1) - 2 * self.centroids @ x
+        probe = np.argpartition(d, self.n_probe - 1)[:self.n_probe]
+        return np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in probe])
+
+    def query(self, vector, k=5, exclude_id=None):
+        """(ids, distances, positions) of the k nearest stored vectors"""
+        x = self.transform(vector)
+        candidates = self._candidates(x)
+        if candidates is None:
+            d = self.norms - 2 * (self.vectors @ x)
+        else:
+            d = self.norms[candidates] - 2 * (self.vectors[candidates] @ x)
+        take = min(k + (exclude_id is not None), len(d))
+        best = np.argpartition(d, take - 1)[:take]
+        best = best[np.argsort(d[best])]
+        stored = best if candidates is None else candidates[best]
+        if exclude_id is not None:
+            stored = stored[self.ids[stored] != exclude_id][:k]
+        distances = np.sqrt(np.maximum(self.norms[stored] - 2 * (self.vectors[stored] @ x) + x @ x, 0))
+        return self.ids[stored], distances, self.rows[stored]
+
+
+def build_neighbor_indexes(X, shap_values, **kwargs):
+    """Feature-space and SHAP-space indexes over the same opportunities"""
+    return {
+        "features": NeighborIndex(X.to_numpy(), X.index.to_numpy(), standardize=True, **kwargs),
+        "shap": NeighborIndex(shap_values, X.index.to_numpy(), standardize=False, **kwargs),
+    }
+
+
+def save_neighbor_indexes(indexes, path=NEIGHBORS_PATH):
+    import joblib
+    joblib.dump(indexes, path)
+
+
+def load_neighbor_indexes(path=NEIGHBORS_PATH):
+    import joblib
+    return joblib.load(path)
+
+
+# ------------------------------------------------------------
+# BENCHMARK
+# ------------------------------------------------------------
+def _scaled_population(base, n, rng, noise=0.25):
+    """n rows resampled from base with small per-feature jitter"""
+    scale = base.std(axis=0)
+    rows = base[rng.integers(0, len(base), n)]
+    return rows + rng.normal(0, noise, rows.shape) * np.where(scale > 0, scale, 1.0)
+
+
+def benchmark(sizes=(7_000, 100_000, 1_000_000), n_queries=200, k=10, seed=42):
+    """Build time, query latency and recall@k versus an exact scan, per size and mode"""
+    import joblib
+    rng = np.random.default_rng(seed)
+    X_test = joblib.load("output/X_test.pkl").to_numpy(np.float64)
+    shap_values = joblib.load("output/shap_values.pkl")
+
+    results = []
+    for mode, base, standardize in [("features", X_test, True), ("shap", shap_values, False)]:
+        for n in sizes:
+            vectors = _scaled_population(base, n, rng)
+            ids = np.arange(n)
+            start = time.perf_counter()
+            index = NeighborIndex(vectors, ids, standardize=standardize)
+            build_s = time.perf_counter() - start
+
+            # Fresh draws, so queries are not stored rows
+            queries = _scaled_population(base, n_queries, rng)
+            latencies, recalls = [], []
+            exact_vectors = index.vectors
+            for q in queries:
+                start = time.perf_counter()
+                found, _, _ = index.query(q, k=k)
+                latencies.append((time.perf_counter() - start) * 1000)
+                x = index.transform(q)
+                exact = index.ids[np.argpartition(index.norms - 2 * exact_vectors @ x, k - 1)[:k]]
+                recalls.append(len(np.intersect1d(found, exact)) / k)
+            result = {
+                "mode": mode,
+                "rows": n,
+                "index": "ivf" if index.n_lists else "exact",
+                "build_s": round(build_s, 3),
+                "query_p50_ms": round(float(np.percentile(latencies, 50)), 3),
+                "query_p99_ms": round(float(np.percentile(latencies, 99)), 3),
+                f"recall_at_{k}": round(float(np.mean(recalls)), 4),
+            }
+            results.append(result)
+            print(f"  {mode:<8} n={n:>9,}  {result['index']:<5} build {build_s:7.2f}s  "
+                  f"p50 {result['query_p50_ms']:.2f} ms  p99 {result['query_p99_ms']:.2f} ms  "
+                  f"recall@{k} {result[f'recall_at_{k}']:.3f}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Similar-opportunity indexes")
+    parser.add_argument("--benchmark", action="store_true")
+    parser.add_argument("--sizes", default="7000,100000,1000000")
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark(sizes=[int(s) for s in args.sizes.split(",")], n_queries=args.queries)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
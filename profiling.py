@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""
+Schneider Electric Datathon - Pipeline Profiling
+Per-stage instrumentation for local_pipeline.py, enabled with
+PIPELINE_PROFILE=1. Each stage records:
+
+    wall_s           elapsed time
+    cpu_s            CPU time of this process (all threads)
+    children_cpu_s   CPU time of finished child processes (ensemble workers, figures)
+    peak_rss_mb      peak resident memory during the stage (VmHWM, reset per stage)
+    tracemalloc_mb   peak Python/NumPy heap allocations during the stage
+
+and the run writes:
+
+    output/profile/report.json   stages in order, plus totals
+    output/profile/trace.json    Chrome trace (chrome://tracing, Perfetto, speedscope)
+
+A sampling profiler can be attached to single stages with
+PIPELINE_PROFILE_SAMPLE (comma-separated stage prefixes, e.g. "7." or
+"4. SMOTE,7. SHAP"). A thread records the main thread's Python stack every
+PIPELINE_PROFILE_INTERVAL_MS (5 ms by default) and writes it in the folded
+format used by flamegraph.pl and speedscope:
+
+    output/profile/<stage>.folded
+
+Stacks are sampled between bytecodes, so time spent inside a long C call
+(an XGBoost fit, a NumPy kernel) is credited to the Python line that made
+the call.
+
+Stages are marked, not nested: profiler.stage(name) closes the previous one.
+PIPELINE_PROFILE_TRACEMALLOC=0 skips tracemalloc, which slows
+allocation-heavy Python code.
+
+Usage:
+    PIPELINE_PROFILE=1 python local_pipeline.py
+    python profiling.py                         # table of output/profile/report.json
+"""
+
+import os
+import sys
+import json
+import time
+import resource
+import argparse
+import threading
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+PROFILE_DIR = Path("output/profile")
+
+
+def _status_kb(field):
+    """A kB field of /proc/self/status (Linux), or None"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def _reset_peak_rss():
+    """Reset VmHWM so the next read is the peak of this stage; False where unsupported"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb():
+    hwm = _status_kb("VmHWM")
+    if hwm is None:
+        # Lifetime peak (kB on Linux, bytes on macOS)
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    return hwm / 1024
+
+
+def _children_cpu():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class StackSampler:
+    """Samples one thread's Python stack on a timer into folded-stack counts"""
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        this_file = os.path.abspath(__file__)
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                if os.path.abspath(code.co_filename) != this_file:
+                    stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self
+
+    def top_functions(self, n=10):
+        """(frame, samples) of the frames most often on top of the stack"""
+        leaves = Counter()
+        for stack, count in self.counts.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        return leaves.most_common(n)
+
+    def save_folded(self, path):
+        with open(path, "w") as f:
+            for stack, count in self.counts.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class StageProfiler:
+    """Marks consecutive pipeline stages; a disabled profiler does nothing"""
+
+    def __init__(self, enabled=False, output_dir=PROFILE_DIR, sample_stages=(), sample_interval_ms=5,
+                 trace_malloc=True):
+        self.enabled = enabled
+        self.output_dir = Path(output_dir)
+        self.sample_stages = [s.strip() for s in sample_stages if s.strip()]
+        self.sample_interval = sample_interval_ms / 1000
+        self.trace_malloc = trace_malloc
+        self.stages = []
+        self._current = None
+        self._sampler = None
+        self._origin = time.perf_counter()
+        self._startup_cpu = time.process_time()
+        self._rss_reset = False
+        if enabled and trace_malloc and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            enabled=os.environ.get("PIPELINE_PROFILE", "0") == "1",
+            sample_stages=os.environ.get("PIPELINE_PROFILE_SAMPLE", "").split(","),
+            sample_interval_ms=float(os.environ.get("PIPELINE_PROFILE_INTERVAL_MS", 5)),
+            trace_malloc=os.environ.get("PIPELINE_PROFILE_TRACEMALLOC", "1") != "0",
+        )
+
+    def stage(self, name):
+        """Close the running stage (if any) and start measuring `name`"""
+        if not self.enabled:
+            return
+        self._close()
+        self._rss_reset = _reset_peak_rss()
+        if self.trace_malloc:
+            tracemalloc.reset_peak()
+        self._current = {
+            "name": name,
+            "start": time.perf_counter(),
+            "cpu": time.process_time(),
+            "children_cpu": _children_cpu(),
+        }
+        if any(name.startswith(prefix) for prefix in self.sample_stages):
+            self._sampler = StackSampler(threading.main_thread().ident, self.sample_interval).start()
+
+    def _close(self):
+        if self._current is None:
+            return
+        now = time.perf_counter()
+        record = {
+            "name": self._current["name"],
+            "start_s": self._current["start"] - self._origin,
+            "wall_s": now - self._current["start"],
+            "cpu_s": time.process_time() - self._current["cpu"],
+            "children_cpu_s": _children_cpu() - self._current["children_cpu"],
+            "peak_rss_mb": _peak_rss_mb(),
+            "peak_rss_scope": "stage" if self._rss_reset else "process",
+            "rss_end_mb": (_status_kb("VmRSS") or 0) / 1024,
+        }
+        if self.trace_malloc:
+            record["tracemalloc_mb"] = tracemalloc.get_traced_memory()[1] / 1e6
+        if self._sampler is not None:
+            self._sampler.stop()
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            path = self.output_dir / f"{_slug(record['name'])}.folded"
+            self._sampler.save_folded(path)
+            record["samples"] = int(sum(self._sampler.counts.values()))
+            record["folded"] = str(path)
+            record["top_functions"] = self._sampler.top_functions()
+            self._sampler = None
+        self.stages.append(record)
+        self._current = None
+
+    def finish(self):
+        """Close the last stage and write the JSON report and the Chrome trace; returns the report"""
+        if not self.enabled:
+            return None
+        self._close()
+        if self.trace_malloc:
+            tracemalloc.stop()
+        report = {
+            "generated_at": datetime.now().isoformat(timespec="seconds"),
+            "argv": sys.argv,
+            "startup_cpu_s": self._startup_cpu,
+            "total_wall_s": time.perf_counter() - self._origin,
+            "total_cpu_s": sum(s["cpu_s"] for s in self.stages),
+            "max_rss_mb": max((s["peak_rss_mb"] for s in self.stages), default=0.0),
+            "stages": self.stages,
+        }
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.output_dir / "report.json", "w") as f:
+            json.dump(report, f, indent=2)
+        with open(self.output_dir / "trace.json", "w") as f:
+            json.dump(chrome_trace(report), f)
+        return report
+
+
+def _slug(name):
+    return "".join(c if c.isalnum() else "_" for c in name).strip("_").lower()
+
+
+def chrome_trace(report):
+    """Trace Event Format: one complete event per stage plus RSS / CPU counter tracks"""
+    pid = os.getpid()
+    events = [{"name": "process_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": "local_pipeline.py"}}]
+    for stage in report["stages"]:
+        ts = stage["start_s"] * 1e6
+        args = {k: v for k, v in stage.items() if k not in ("name", "start_s", "top_functions")}
+        events.append({"name": stage["name"], "cat": "stage", "ph": "X", "ts": ts,
+                       "dur": stage["wall_s"] * 1e6, "pid": pid, "tid": 0, "args": args})
+        counters = {"peak_rss_mb": stage["peak_rss_mb"]}
+        if "tracemalloc_mb" in stage:
+            counters["tracemalloc_mb"] = stage["tracemalloc_mb"]
+        events.append({"name": "memory", "ph": "C", "ts": ts, "pid": pid, "args": counters})
+        utilization = stage["cpu_s"] / stage["wall_s"] if stage["wall_s"] > 0 else 0.0
+        events.append({"name": "cpu_utilization", "ph": "C", "ts": ts, "pid": pid, "args": {"cores": utilization}})
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def print_report(report):
+    total = report["total_wall_s"] or 1.0
+    print(f"{'stage':<42} {'wall s':>8} {'%':>5} {'cpu s':>8} {'child s':>8} {'peak MB':>8} {'heap MB':>8}")
+    for s in report["stages"]:
+        heap = f"{s['tracemalloc_mb']:8.1f}" if "tracemalloc_mb" in s else f"{'-':>8}"
+        print(f"{s['name'][:42]:<42} {s['wall_s']:8.2f} {100 * s['wall_s'] / total:5.1f} {s['cpu_s']:8.2f} "
+              f"{s['children_cpu_s']:8.2f} {s['peak_rss_mb']:8.0f} {heap}")
+    print(f"{'total':<42} {report['total_wall_s']:8.2f} {100.0:5.1f} {report['total_cpu_s']:8.2f}")
+    for s in report["stages"]:
+        if s.get("top_functions"):
+            print(f"\n🔬 {s['name']}: {s['samples']} muestras ({s['folded']})")
+            for frame, count in s["top_functions"]:
+                print(f"  {100 * count / s['samples']:5.1f}%  {frame}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print a pipeline profiling report")
+    parser.add_argument("report", nargs="?", default=str(PROFILE_DIR / "report.json"))
+    args = parser.parse_args()
+
+    with open(args.report) as f:
+        report = json.load(f)
+    print(f"⏱️ Perfil de {report['generated_at']} · {report['total_wall_s']:.1f}s · pico {report['max_rss_mb']:.0f} MB")
+    print_report(report)
+
+
+if __name__ == "__main__":
+    main()
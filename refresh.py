@@ -0,0 +1,478 @@
+# -*- coding: utf-8 -*-
+"""
+Schneider Electric Datathon - Incremental Model Refresh
+Updates the saved booster (output/model.pkl) with a batch of newly closed
+opportunities instead of retraining every tree on the full history.
+
+Modes:
+    continue  Boost --new-trees additional trees on the new rows.
+    refresh   Keep the tree structure and re-fit every leaf value on the new rows.
+
+Both cost time proportional to the new batch. The candidate is promoted only if
+its held-out AUC (saved test set + a slice of the new batch) does not fall more
+than --tolerance below the current model.
+
+On promotion everything derived from the model is rebuilt for the saved test
+set: SHAP values, threshold curve, case index, neighbour indexes, global
+importance, archetypes, the SHAP figures, the model-dependent parts of
+global_insights.json and the per-case JSON (incremental export). The
+What-If surrogate is re-distilled only with --distill: it can only learn
+from the batch's rows and is then far less faithful (AUC 0.80 against
+0.92 for a 3,000-row batch), so by default the previous model's surrogate
+is removed and the app runs the What-If on the full model. The ensemble
+scores belong to the previous model's members and are removed (re-run
+ensemble.py). Global insights computed
+from the training run (bootstrap intervals, CV report, SHAP interactions)
+are cleared rather than left describing the old model.
+
+The rebuild is written to output/.refresh-staging/ (unchanged files and
+case JSON are hard-linked into it), published to the registry from there
+and only then moved over output/, so neither the app nor readers of
+output/ (scoring_service.py, an app without registry) see a model next to
+another model's artifacts; if anything fails, output/ is left as it was.
+
+The rebuild is kept proportional to the batch where it can be: in continue
+mode only the appended trees are explained (TreeSHAP is additive over
+trees) and permutation importance is opt-in (--permutation-repeats). In
+refresh mode every leaf changes, so SHAP is recomputed for the whole test
+set (minutes on one core).
+
+Usage:
+    python refresh.py --batch new_opportunities.csv --mode continue --new-trees 40
+"""
+
+import os
+import json
+import time
+import shutil
+import argparse
+from datetime import datetime
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+
+import xgboost as xgb
+from xgboost import XGBClassifier
+from sklearn.model_selection import train_test_split
+from sklearn.metrics import roc_auc_score, f1_score, precision_score, recall_score, accuracy_score
+from imblearn.combine import SMOTETomek
+
+import shap
+
+from features import load_dataset, check_required_columns, engineer_features, build_xy
+from tree_export import CompiledTrees
+from threshold_curve import build_threshold_curve, save_threshold_curve, BUCKET_EDGES, BUCKET_LABELS
+from case_index import build_case_index, save_case_index
+from neighbors import build_neighbor_indexes, save_neighbor_indexes
+from importance import compute_global_importance, save_global_importance
+from archetypes import fit_archetypes, save_archetypes, load_archetypes
+from distill import distill, evaluate_surrogate, save_surrogate, SURROGATE_FILES, print_report as print_surrogate_report
+from case_analysis import build_case_analysis
+from case_export import export_cases, print_changelog
+from figures import save_figure_inputs, render_all
+import model_registry
+
+OUTPUT_DIR = Path("output")
+STAGING_DIR = ".refresh-staging"
+# Pipeline outputs a refresh does not change, linked into the staging folder
+UNCHANGED_FILES = ["feature_names.pkl", "threshold.txt", "X_test.pkl", "y_test.pkl"]
+# Incremental export state, updated by the refresh's case export
+EXPORT_STATE_FILES = ["case_fingerprints.json", "case_pending_enrichment.json"]
+# Built from the previous model and not rebuilt by a refresh: removed on promotion
+DROPPED_FILES = ["ensemble_scores.parquet"]
+
+
+def _atomic_dump(obj, path):
+    """joblib.dump through a temporary file so readers never see a partial pickle"""
+    tmp_path = Path(f"{path}.tmp")
+    joblib.dump(obj, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _atomic_json(obj, path):
+    tmp_path = Path(f"{path}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(obj, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def load_batch(csv_path, feature_names, interactions_median=None):
+    """Read a raw opportunity batch and return features aligned to the model"""
+    df = load_dataset(csv_path)
+    check_required_columns(df)
+    X, y = build_xy(engineer_features(df, interactions_median=interactions_median))
+    return X[feature_names], y
+
+
+def continue_boosting(model, X_new, y_new, new_trees):
+    """Append new_trees trees fitted on the new rows to the existing booster"""
+    params = model.get_params()
+    params["n_estimators"] = new_trees
+    candidate = XGBClassifier(**params)
+    candidate.fit(X_new, y_new, xgb_model=model.get_booster())
+    return candidate
+
+
+def refresh_leaves(model, X_new, y_new):
+    """Re-estimate the leaf values of every existing tree from the new rows"""
+    # The refresh updater is not available through the sklearn wrapper (QuantileDMatrix)
+    params = model.get_xgb_params()
+    params.update(process_type="update", updater="refresh", refresh_leaf=True)
+    booster = xgb.train(
+        params,
+        xgb.DMatrix(X_new, label=y_new),
+        num_boost_round=model.get_booster().num_boosted_rounds(),
+        xgb_model=model.get_booster().copy(),
+    )
+    # The updater also recounts every node's cover on the batch; nodes no batch row reaches end with
+    # zero cover, which breaks TreeSHAP (NaN path weights). Keep the training covers, refresh only leaves
+    refreshed = json.loads(booster.save_raw("json"))
+    original = json.loads(model.get_booster().save_raw("json"))
+    trees = zip(refreshed["learner"]["gradient_booster"]["model"]["trees"],
+                original["learner"]["gradient_booster"]["model"]["trees"])
+    for tree, original_tree in trees:
+        tree["sum_hessian"] = original_tree["sum_hessian"]
+    candidate = XGBClassifier(**model.get_params())
+    candidate.load_model(bytearray(json.dumps(refreshed).encode()))
+    return candidate
+
+
+def evaluate(model, X_eval, y_eval, threshold):
+    """AUC and F1 (at the production threshold) on the held-out rows"""
+    prob = model.predict_proba(X_eval)[:, 1]
+    return {
+        "auc": float(roc_auc_score(y_eval, prob)),
+        "f1": float(f1_score(y_eval, (prob >= threshold).astype(int))),
+    }
+
+
+def update_global_insights(insights, model, X_test, y_test, y_prob, shap_values, importance_table,
+                           permutation_info, threshold):
+    """Recompute the model-dependent sections of global_insights.json for a refreshed model"""
+    y_pred = (y_prob >= threshold).astype(int)
+    insights["model_performance"] = {
+        "threshold": float(threshold),
+        "f1_score": float(f1_score(y_test, y_pred)),
+        "auc": float(roc_auc_score(y_test, y_prob)),
+        "precision": float(precision_score(y_test, y_pred)),
+        "recall": float(recall_score(y_test, y_pred)),
+        "accuracy": float(accuracy_score(y_test, y_pred)),
+    }
+    gain = pd.Series(model.feature_importances_, index=X_test.columns).sort_values(ascending=False)
+    insights["feature_importance_top20"] = {f: float(v) for f, v in gain.head(20).items()}
+    insights["feature_importance_shap_top20"] = {
+        f: float(v) for f, v in importance_table["mean_abs_shap"].head(20).items()
+    }
+    insights["feature_importance_permutation_top20"] = (
+        {f: float(v) for f, v in importance_table["permutation_mean"].sort_values(ascending=False).head(20).items()}
+        if permutation_info else None
+    )
+    buckets = pd.cut(y_prob, bins=BUCKET_EDGES, labels=BUCKET_LABELS).value_counts()
+    n_wins = int(y_pred.sum())
+    insights["prediction_distribution"] = {
+        "total_samples": int(len(y_test)),
+        "predicted_wins": n_wins,
+        "predicted_losses": int(len(y_pred) - n_wins),
+        "win_rate": float(y_pred.mean()),
+        "avg_win_probability": float(y_prob[y_pred == 1].mean()) if n_wins > 0 else 0.0,
+        "avg_loss_probability": float(y_prob[y_pred == 0].mean()) if n_wins < len(y_pred) else 0.0,
+        "probability_buckets": {label: int(buckets.get(label, 0)) for label in BUCKET_LABELS},
+    }
+    mean_shap = pd.Series(shap_values.mean(axis=0), index=X_test.columns).sort_values()
+    insights["shap_drivers"] = {
+        "top_positive": [{"feature": f, "mean_shap": float(v)} for f, v in mean_shap.tail(3).items()],
+        "top_negative": [{"feature": f, "mean_shap": float(v)} for f, v in mean_shap.head(3).items()],
+    }
+    # Computed during the training run; not reproducible from the test set alone
+    for key in ("model_performance_ci", "cross_validation", "top_interactions"):
+        insights[key] = None
+    insights["last_refresh"] = datetime.now().isoformat(timespec="seconds")
+    return insights
+
+
+def candidate_shap_values(candidate, model, mode, explainer, X_test, previous_shap_path, n_check=20):
+    """
+    SHAP matrix of the candidate on the test set. TreeSHAP is additive over
+    trees, so in continue mode the previous matrix plus the SHAP values of the
+    appended trees alone is exact; the previous matrix is first checked
+    against the previous model on a few rows. Refresh mode changes every
+    leaf and is recomputed in full.
+    """
+    if mode == "continue" and Path(previous_shap_path).exists():
+        previous_shap = joblib.load(previous_shap_path)
+        booster, previous_booster = candidate.get_booster(), model.get_booster()
+        n_old = previous_booster.num_boosted_rounds()
+        check = xgb.DMatrix(X_test.iloc[:n_check], feature_names=previous_booster.feature_names)
+        expected = previous_booster.predict(check, pred_contribs=True)[:, :-1]
+        if previous_shap.shape == X_test.shape and np.abs(expected - previous_shap[:n_check]).max() < 1e-4:
+            data = xgb.DMatrix(X_test, feature_names=booster.feature_names)
+            appended = booster[n_old:].predict(data, pred_contribs=True)[:, :-1]
+            return previous_shap + appended, "incremental"
+    shap_values = explainer.shap_values(X_test)
+    if isinstance(shap_values, list):
+        shap_values = shap_values[1]
+    return shap_values, "full"
+
+
+def prepare_staging(output_dir, staging_dir):
+    """Empty staging folder seeded with the files a refresh keeps or updates incrementally"""
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    (staging_dir / "json").mkdir(parents=True)
+    for name in UNCHANGED_FILES:
+        model_registry.link_or_copy(output_dir / name, staging_dir / name)
+    # Hard links: whatever the rebuild writes there must replace the file (write_case, _atomic_json)
+    for path in (output_dir / "json").iterdir():
+        if path.is_file():
+            model_registry.link_or_copy(path, staging_dir / "json" / path.name)
+    for name in EXPORT_STATE_FILES:
+        if (output_dir / name).exists():
+            shutil.copy2(output_dir / name, staging_dir / name)
+    model_registry.link_or_copy(output_dir / "model.pkl", staging_dir / "model_prev.pkl")
+
+
+def swap_into(staging_dir, output_dir, dropped=DROPPED_FILES):
+    """Move the staged artifacts over output/ (json/ as a whole folder), then remove the dropped files"""
+    for path in sorted(staging_dir.rglob("*")):
+        relative = path.relative_to(staging_dir)
+        if path.is_dir() or relative.parts[0] == "json":
+            continue
+        target = output_dir / relative
+        target.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(path, target)
+    old_json = output_dir / "json.old"
+    shutil.rmtree(old_json, ignore_errors=True)
+    os.rename(output_dir / "json", old_json)
+    os.rename(staging_dir / "json", output_dir / "json")
+    shutil.rmtree(old_json)
+    for name in dropped:
+        if (output_dir / name).exists():
+            os.remove(output_dir / name)
+
+
+def rebuild_artifacts(model, explainer, shap_values, X_test, y_test, threshold, X_batch, source_dir, target_dir,
+                      permutation_repeats=0, distill_surrogate=False):
+    """
+    Write every serving artifact derived from the model into target_dir
+    (previous artifacts are read from source_dir); returns the case changelog
+    """
+    source_dir, target_dir = Path(source_dir), Path(target_dir)
+    step = time.perf_counter()
+    _atomic_dump(shap_values, target_dir / "shap_values.pkl")
+    y_prob = model.predict_proba(X_test)[:, 1]
+
+    save_threshold_curve(build_threshold_curve(y_test, y_prob), target_dir / "threshold_curve.npz")
+    # Confidence comes from the threshold distance until the ensemble is re-run for this model
+    save_case_index(build_case_index(X_test.index, y_prob, y_test, shap_values, X_test.columns, threshold),
+                    target_dir / "case_index.parquet")
+    save_neighbor_indexes(build_neighbor_indexes(X_test, shap_values), target_dir / "neighbors.pkl")
+
+    importance_table, permutation_info = compute_global_importance(
+        model, X_test, y_test, shap_values, n_repeats=permutation_repeats
+    )
+    save_global_importance(importance_table, permutation_info, target_dir / "importance.json")
+
+    if (source_dir / "archetypes.json").exists():
+        n_archetypes = len(load_archetypes(source_dir / "archetypes.json")["archetypes"])
+        save_archetypes(fit_archetypes(shap_values, X_test, y_test, y_prob, model,
+                                       n_archetypes=n_archetypes, threshold=threshold),
+                        target_dir / "archetypes.json")
+
+    if distill_surrogate:
+        # Same size as the previous surrogate, if any; the real batch rows, not the resampled ones
+        size = {}
+        if (source_dir / "surrogate.json").exists():
+            with open(source_dir / "surrogate.json") as f:
+                student = json.load(f)["student"]
+            size = {"n_estimators": student["n_trees"], "max_depth": student["max_depth"]}
+        surrogate, _ = distill(model, X_batch, **size)
+        surrogate_report = evaluate_surrogate(model, surrogate, X_test, y_test, threshold)
+        save_surrogate(surrogate, surrogate_report, target_dir)
+        print_surrogate_report(surrogate_report)
+
+    with open(source_dir / "json" / "global_insights.json") as f:
+        insights = json.load(f)
+    update_global_insights(insights, model, X_test, y_test, y_prob, shap_values, importance_table,
+                           permutation_info, threshold)
+    _atomic_json(insights, target_dir / "json" / "global_insights.json")
+
+    sample = X_test.sample(min(800, len(X_test)), random_state=42)
+    save_figure_inputs(
+        target_dir / "figures" / "inputs.npz",
+        shap_sample=shap_values[[X_test.index.get_loc(i) for i in sample.index]],
+        X_sample=sample.values,
+        feature_names=np.array(X_test.columns, dtype=str),
+        importances=model.feature_importances_,
+        y_prob=y_prob,
+        y_test=y_test.values
+    )
+    render_all(target_dir / "figures" / "inputs.npz", images_dir=target_dir / "images")
+
+    base_value = explainer.expected_value
+    base_value = float(np.atleast_1d(base_value)[-1])
+    analyses = (
+        (idx, build_case_analysis(idx, X_test.iloc[pos], shap_values[pos], X_test.columns,
+                                  prob=float(y_prob[pos]), threshold=threshold, base_value=base_value,
+                                  actual=int(y_test.iloc[pos])))
+        for pos, idx in enumerate(X_test.index)
+    )
+    changelog = export_cases(analyses, target_dir / "json", target_dir / "case_fingerprints.json",
+                             target_dir / "case_changelog.json",
+                             pending_path=target_dir / "case_pending_enrichment.json")
+    print(f"  Artefactos regenerados en {time.perf_counter() - step:.1f}s")
+    return changelog
+
+
+def run_refresh(batch_path, mode="continue", new_trees=40, holdout=0.2, tolerance=0.0,
+                resample=True, dry_run=False, registry_keep=5, permutation_repeats=0, distill_surrogate=False,
+                output_dir=OUTPUT_DIR):
+    """Build a candidate from the new batch, compare it and promote it if it holds up"""
+    output_dir = Path(output_dir)
+    start = time.perf_counter()
+
+    model = joblib.load(output_dir / "model.pkl")
+    feature_names = joblib.load(output_dir / "feature_names.pkl")
+    X_test = joblib.load(output_dir / "X_test.pkl")
+    y_test = joblib.load(output_dir / "y_test.pkl")
+    with open(output_dir / "metadata.json") as f:
+        metadata = json.load(f)
+    with open(output_dir / "threshold.txt") as f:
+        threshold = float(f.read().strip())
+
+    X_new, y_new = load_batch(batch_path, feature_names, metadata.get("cust_interactions_median"))
+    print(f"📂 Nuevo batch: {len(X_new)} oportunidades ({int(y_new.sum())} wins)")
+    if y_new.nunique() < 2:
+        raise ValueError("❌ El batch necesita ejemplos de ambas clases")
+
+    X_fit, X_hold, y_fit, y_hold = train_test_split(
+        X_new, y_new, test_size=holdout, random_state=42, stratify=y_new
+    )
+    if resample:
+        X_fit, y_fit = SMOTETomek(random_state=42).fit_resample(X_fit, y_fit)
+
+    fit_start = time.perf_counter()
+    if mode == "continue":
+        candidate = continue_boosting(model, X_fit, y_fit, new_trees)
+    elif mode == "refresh":
+        candidate = refresh_leaves(model, X_fit, y_fit)
+    else:
+        raise ValueError(f"❌ Modo desconocido: {mode}")
+    fit_seconds = time.perf_counter() - fit_start
+
+    # Held-out set: the pipeline's test split plus the unseen slice of the new batch
+    X_eval = pd.concat([X_test[feature_names], X_hold])
+    y_eval = pd.concat([y_test, y_hold])
+    previous = evaluate(model, X_eval, y_eval, threshold)
+    current = evaluate(candidate, X_eval, y_eval, threshold)
+    promoted = (current["auc"] >= previous["auc"] - tolerance) and not dry_run
+
+    print(f"Modelo actual   : AUC {previous['auc']:.4f} · F1 {previous['f1']:.4f}")
+    print(f"Candidato ({mode}): AUC {current['auc']:.4f} · F1 {current['f1']:.4f}")
+
+    version = None
+    if promoted:
+        # Everything is built in a staging folder next to output/, published from there and only
+        # then moved over output/: until that point neither the app nor output/ readers see any of it
+        staging_dir = output_dir / STAGING_DIR
+        print("🔄 Construyendo modelo, SHAP, índices, arquetipos, figuras y JSON por caso "
+              f"en {staging_dir} ...")
+        try:
+            prepare_staging(output_dir, staging_dir)
+            _atomic_dump(candidate, staging_dir / "model.pkl")
+            CompiledTrees.from_model(candidate).save(staging_dir / "model_trees.npz")
+            explainer = shap.TreeExplainer(candidate, feature_perturbation="interventional")
+            _atomic_dump(explainer, staging_dir / "explainer.pkl")
+            metadata["last_refresh"] = datetime.now().isoformat(timespec="seconds")
+            with open(staging_dir / "metadata.json", "w") as f:
+                json.dump(metadata, f, indent=2)
+
+            shap_start = time.perf_counter()
+            shap_values, shap_mode = candidate_shap_values(candidate, model, mode, explainer, X_test[feature_names],
+                                                           output_dir / "shap_values.pkl")
+            shap_label = "solo árboles nuevos" if shap_mode == "incremental" else "completo"
+            print(f"  SHAP de {len(X_test):,} casos ({shap_label}, {time.perf_counter() - shap_start:.1f}s)")
+            changelog = rebuild_artifacts(candidate, explainer, shap_values, X_test[feature_names], y_test, threshold,
+                                          X_new, output_dir, staging_dir, permutation_repeats, distill_surrogate)
+            print_changelog(changelog)
+
+            version = model_registry.publish(staging_dir, output_dir / "registry", source="refresh",
+                                             metrics={"auc": current["auc"], "f1": current["f1"],
+                                                      "threshold": threshold})
+            swap_into(staging_dir, output_dir,
+                      DROPPED_FILES + ([] if distill_surrogate else SURROGATE_FILES))
+        except BaseException:
+            if version is None:
+                print("❌ Refresh interrumpido antes de publicar: output/ y la versión activa no han cambiado")
+            else:
+                print(f"❌ Versión {version} publicada pero output/ no se actualizó por completo")
+            raise
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+        model_registry.evict(output_dir / "registry", keep_last=registry_keep)
+        print("✅ Candidato promovido a output/model.pkl (anterior en output/model_prev.pkl)")
+        print(f"🗂️ Versión publicada y activa: {version} (la app cambia en el siguiente rerun)")
+    elif dry_run:
+        print("ℹ️ Dry run: no se modifica output/")
+    else:
+        print("⚠️ Candidato rechazado: el AUC held-out empeora más que la tolerancia")
+
+    record = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "batch": str(batch_path),
+        "mode": mode,
+        "new_trees": new_trees if mode == "continue" else 0,
+        "n_new_rows": int(len(X_new)),
+        "n_eval_rows": int(len(X_eval)),
+        "previous": previous,
+        "candidate": current,
+        "tolerance": tolerance,
+        "promoted": bool(promoted),
+        "version": version,
+        "fit_seconds": fit_seconds,
+        "total_seconds": time.perf_counter() - start,
+    }
+    history_path = output_dir / "refresh_history.json"
+    history = []
+    if history_path.exists():
+        with open(history_path) as f:
+            history = json.load(f)
+    history.append(record)
+    with open(history_path, "w") as f:
+        json.dump(history, f, indent=2)
+
+    return record
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental XGBoost refresh from a new batch")
+    parser.add_argument("--batch", required=True, help="CSV / Parquet with the raw columns of dataset.csv")
+    parser.add_argument("--mode", choices=["continue", "refresh"], default="continue")
+    parser.add_argument("--new-trees", type=int, default=40)
+    parser.add_argument("--holdout", type=float, default=0.2, help="Share of the batch kept for evaluation")
+    parser.add_argument("--tolerance", type=float, default=0.0, help="Allowed AUC drop before rejecting")
+    parser.add_argument("--no-resample", action="store_true", help="Skip SMOTETomek on the new rows")
+    parser.add_argument("--permutation-repeats", type=int, default=0,
+                        help="Permutation importance repeats for importance.json (default 0: gain and SHAP only)")
+    parser.add_argument("--distill", action="store_true",
+                        help="Re-distill the What-If surrogate on the batch (otherwise it is removed)")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--registry-keep", type=int, default=5, help="Registry versions kept after publishing")
+    args = parser.parse_args()
+
+    run_refresh(
+        args.batch,
+        mode=args.mode,
+        new_trees=args.new_trees,
+        holdout=args.holdout,
+        tolerance=args.tolerance,
+        resample=not args.no_resample,
+        dry_run=args.dry_run,
+        registry_keep=args.registry_keep,
+        permutation_repeats=args.permutation_repeats,
+        distill_surrogate=args.distill,
+    )
+
+
+if __name__ == "__main__":
+    main()
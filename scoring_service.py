@@ -0,0 +1,399 @@
+# -*- coding: utf-8 -*-
+"""
+Schneider Electric Datathon - Local Scoring Service
+Small HTTP service (standard library asyncio, no web framework) that scores
+raw opportunities with the saved model and returns, per opportunity, the same
+analysis as output/json/<id>.json.
+
+Concurrent requests are coalesced into micro-batches: the batcher waits for
+the first request, then keeps collecting until `max_batch` opportunities or
+`max_wait_ms` have passed. Each batch runs feature engineering once, one
+vectorized predict and one TreeSHAP call (XGBoost's native path-dependent
+TreeSHAP, the same values as output/explainer.pkl) on a single scoring thread,
+so the event loop keeps accepting requests while a batch is scored. If a
+merged batch fails, its requests are re-scored one by one, so only the
+offending request gets the error. A record without an id gets its position
+within its own request. Input columns must be finite JSON numbers (400
+otherwise).
+
+Endpoints:
+    POST /score    {"opportunities": [{raw columns...}, ...], "explain": true}
+                   or a single raw opportunity object
+    GET  /health
+    GET  /stats    batch counts and sizes
+
+Usage:
+    python scoring_service.py serve --port 8765 --max-batch 64 --max-wait-ms 5
+    python scoring_service.py loadtest --port 8765 --concurrency 1,4,16,64 --duration 10
+"""
+
+import json
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from features import REQUIRED_COLS, load_dataset, engineer_features
+from case_analysis import build_case_analysis
+
+INPUT_COLS = [c for c in REQUIRED_COLS if c not in ("id", "target_variable")]
+MAX_BODY_BYTES = 8 * 1024 * 1024
+
+
+class RequestError(Exception):
+    """Client error answered with HTTP 400"""
+
+
+def _is_finite_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and np.isfinite(value)
+
+
+# ------------------------------------------------------------
+# SCORING
+# ------------------------------------------------------------
+class Scorer:
+    """Saved model + feature engineering + TreeSHAP for batches of raw opportunities"""
+
+    def __init__(self, output_dir="output"):
+        import joblib
+        output_dir = Path(output_dir)
+        self.model = joblib.load(output_dir / "model.pkl")
+        self.booster = self.model.get_booster()
+        self.feature_names = list(joblib.load(output_dir / "feature_names.pkl"))
+        with open(output_dir / "threshold.txt") as f:
+            self.threshold = float(f.read().strip())
+        with open(output_dir / "metadata.json") as f:
+            self.interactions_median = json.load(f).get("cust_interactions_median")
+
+    @staticmethod
+    def validate(records):
+        """Raise RequestError unless every record carries the raw input columns as finite numbers"""
+        if not isinstance(records, list) or not records:
+            raise RequestError("'opportunities' must be a non-empty list")
+        for i, record in enumerate(records):
+            if not isinstance(record, dict):
+                raise RequestError(f"opportunity {i} is not an object")
+            missing = [c for c in INPUT_COLS if c not in record]
+            if missing:
+                raise RequestError(f"opportunity {i} is missing {missing}")
+            # The training data has no missing values; null, strings and booleans are not scored
+            invalid = [c for c in INPUT_COLS if not _is_finite_number(record[c])]
+            if invalid:
+                raise RequestError(f"opportunity {i} has non-numeric values in {invalid}")
+
+    def features(self, records):
+        df = pd.DataFrame.from_records(records)
+        df[INPUT_COLS] = df[INPUT_COLS].astype(float)
+        return engineer_features(df, interactions_median=self.interactions_median)[self.feature_names]
+
+    def score(self, records, explain):
+        """Analyses for a batch of records; explain[i] False skips SHAP for record i"""
+        import xgboost as xgb
+
+        X = self.features(records)
+        X_arr = X.to_numpy(dtype=np.float32)
+        prob = self.booster.inplace_predict(X_arr)
+        explain = np.asarray(explain, dtype=bool)
+
+        shap_rows = [None] * len(records)
+        base_value = None
+        if explain.any():
+            data = xgb.DMatrix(X_arr[explain], feature_names=self.feature_names)
+            contribs = self.booster.predict(data, pred_contribs=True)
+            base_value = float(contribs[0, -1])
+            for row, pos in zip(contribs, np.flatnonzero(explain)):
+                shap_rows[pos] = row[:-1]
+
+        results = []
+        for i, record in enumerate(records):
+            results.append(build_case_analysis(
+                record.get("id", i), X.iloc[i], shap_rows[i], self.feature_names,
+                prob=float(prob[i]), threshold=self.threshold, base_value=base_value or 0.0,
+            ))
+        return results
+
+
+# ------------------------------------------------------------
+# MICRO-BATCHING
+# ------------------------------------------------------------
+class MicroBatcher:
+    """Coalesces concurrent submissions into batches bounded by size and wait time"""
+
+    def __init__(self, score_fn, max_batch=64, max_wait_ms=5.0):
+        self.score_fn = score_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.queue = asyncio.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="scoring")
+        self.stats = {"batches": 0, "opportunities": 0, "requests": 0, "max_batch_seen": 0, "score_seconds": 0.0,
+                      "split_batches": 0}
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+        self.executor.shutdown(wait=False)
+
+    async def submit(self, records, explain=True):
+        # Records without an id get their position in this request, not in the merged batch
+        records = [record if "id" in record else {**record, "id": i} for i, record in enumerate(records)]
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((records, explain, future))
+        return await future
+
+    async def _collect(self):
+        batch = [await self.queue.get()]
+        size = len(batch[0][0])
+        deadline = asyncio.get_running_loop().time() + self.max_wait
+        while size < self.max_batch:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            records = [record for items, _, _ in batch for record in items]
+            explain = [flag for items, flag, _ in batch for _ in items]
+            start = time.perf_counter()
+            try:
+                results = await loop.run_in_executor(self.executor, self.score_fn, records, explain)
+            except Exception as e:
+                if len(batch) == 1:
+                    if not batch[0][2].done():
+                        batch[0][2].set_exception(e)
+                else:
+                    # One bad request must not fail the others merged with it
+                    self.stats["split_batches"] += 1
+                    await self._score_each(batch)
+                continue
+            self.stats["score_seconds"] += time.perf_counter() - start
+            self.stats["batches"] += 1
+            self.stats["requests"] += len(batch)
+            self.stats["opportunities"] += len(records)
+            self.stats["max_batch_seen"] = max(self.stats["max_batch_seen"], len(records))
+            offset = 0
+            for items, _, future in batch:
+                if not future.done():
+                    future.set_result(results[offset:offset + len(items)])
+                offset += len(items)
+
+
+    async def _score_each(self, batch):
+        """Score the requests of a failed batch one by one, each future getting its own result or error"""
+        loop = asyncio.get_running_loop()
+        for items, flag, future in batch:
+            try:
+                results = await loop.run_in_executor(self.executor, self.score_fn, items, [flag] * len(items))
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+                continue
+            if not future.done():
+                future.set_result(results)
+
+
+# ------------------------------------------------------------
+# HTTP FRONT END
+# ------------------------------------------------------------
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large",
+           500: "Internal Server Error"}
+
+
+def _response(status, payload, keep_alive=True):
+    body = json.dumps(payload).encode()
+    head = (f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode() + body
+
+
+class ScoringServer:
+    def __init__(self, scorer, max_batch=64, max_wait_ms=5.0):
+        self.scorer = scorer
+        self.batcher = MicroBatcher(scorer.score, max_batch, max_wait_ms)
+
+    async def route(self, method, path, body):
+        if method == "GET" and path == "/health":
+            return 200, {"status": "ok", "n_features": len(self.scorer.feature_names),
+                         "threshold": self.scorer.threshold}
+        if method == "GET" and path == "/stats":
+            stats = dict(self.batcher.stats)
+            stats["mean_batch"] = stats["opportunities"] / max(stats["batches"], 1)
+            stats["max_batch"] = self.batcher.max_batch
+            stats["max_wait_ms"] = self.batcher.max_wait * 1000
+            return 200, stats
+        if method == "POST" and path == "/score":
+            try:
+                payload = json.loads(body or b"null")
+            except ValueError:
+                raise RequestError("body is not valid JSON")
+            single = isinstance(payload, dict) and "opportunities" not in payload
+            records = [payload] if single else (payload or {}).get("opportunities")
+            explain = True if single else bool((payload or {}).get("explain", True))
+            self.scorer.validate(records)
+            results = await self.batcher.submit(records, explain)
+            return 200, results[0] if single else {"results": results}
+        return 404, {"error": f"{method} {path} not found"}
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = headers.get("connection", "").lower() != "close"
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY_BYTES:
+                    writer.write(_response(413, {"error": "body too large"}, keep_alive=False))
+                    await writer.drain()
+                    break
+                body = await reader.readexactly(length) if length else b""
+                try:
+                    status, payload = await self.route(method, path.split("?")[0], body)
+                except RequestError as e:
+                    status, payload = 400, {"error": str(e)}
+                except Exception as e:
+                    status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+                writer.write(_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8765):
+        self.batcher.start()
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f"✅ Scoring service en http://{host}:{port} "
+              f"(batch ≤ {self.batcher.max_batch}, espera ≤ {self.batcher.max_wait * 1000:.0f} ms)")
+        async with server:
+            await server.serve_forever()
+
+
+# ------------------------------------------------------------
+# LOAD TEST
+# ------------------------------------------------------------
+async def _http(reader, writer, method, path, payload=None):
+    body = json.dumps(payload).encode() if payload is not None else b""
+    writer.write((f"{method} {path} HTTP/1.1\r\nHost: localhost\r\n"
+                  f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n").encode() + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        if line.lower().startswith(b"content-length:"):
+            length = int(line.split(b":")[1])
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def _client(host, port, records, deadline, latencies, explain, seed):
+    reader, writer = await asyncio.open_connection(host, port)
+    rng = np.random.default_rng(seed)
+    try:
+        while time.perf_counter() < deadline:
+            record = records[rng.integers(len(records))]
+            start = time.perf_counter()
+            status, _ = await _http(reader, writer, "POST", "/score",
+                                    {"opportunities": [record], "explain": explain})
+            if status != 200:
+                raise RuntimeError(f"HTTP {status}")
+            latencies.append(time.perf_counter() - start)
+    finally:
+        writer.close()
+
+
+async def run_load_test(host="127.0.0.1", port=8765, concurrency=(1, 4, 16, 64), duration=10.0,
+                        explain=True, data="dataset.csv", sample=2000):
+    """Closed-loop clients (one keep-alive connection each) at increasing concurrency"""
+    df = load_dataset(data, nrows=sample)
+    records = df.drop(columns=["target_variable"]).to_dict(orient="records")
+    results = []
+    for level in concurrency:
+        reader, writer = await asyncio.open_connection(host, port)
+        _, before = await _http(reader, writer, "GET", "/stats")
+        latencies = []
+        start = time.perf_counter()
+        await asyncio.gather(*[
+            _client(host, port, records, start + duration, latencies, explain, seed)
+            for seed in range(level)
+        ])
+        elapsed = time.perf_counter() - start
+        _, after = await _http(reader, writer, "GET", "/stats")
+        writer.close()
+
+        batches = after["batches"] - before["batches"]
+        result = {
+            "concurrency": level,
+            "requests": len(latencies),
+            "throughput_rps": len(latencies) / elapsed,
+            "p50_ms": float(np.percentile(latencies, 50) * 1000),
+            "p99_ms": float(np.percentile(latencies, 99) * 1000),
+            "mean_batch": (after["opportunities"] - before["opportunities"]) / max(batches, 1),
+        }
+        results.append(result)
+        print(f"  c={level:<4} {result['throughput_rps']:8.1f} req/s · p50 {result['p50_ms']:8.1f} ms · "
+              f"p99 {result['p99_ms']:8.1f} ms · batch medio {result['mean_batch']:.1f}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-batching scoring service")
+    sub = parser.add_subparsers(dest="command", required=True)
+    serve = sub.add_parser("serve")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--max-batch", type=int, default=64)
+    serve.add_argument("--max-wait-ms", type=float, default=5.0)
+    load = sub.add_parser("loadtest")
+    load.add_argument("--host", default="127.0.0.1")
+    load.add_argument("--port", type=int, default=8765)
+    load.add_argument("--concurrency", default="1,4,16,64")
+    load.add_argument("--duration", type=float, default=10.0)
+    load.add_argument("--no-explain", action="store_true", help="Probability only, no SHAP")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        server = ScoringServer(Scorer(), args.max_batch, args.max_wait_ms)
+        try:
+            asyncio.run(server.serve(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+    else:
+        asyncio.run(run_load_test(
+            args.host, args.port, [int(c) for c in args.concurrency.split(",")],
+            args.duration, explain=not args.no_explain
+        ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Schneider Electric Datathon - Segment Analytics
+Query engine over the persisted SHAP matrix and test features. A segment is a
+list of predicates (feature, op, value); its size, win rate, mean and
+mean-absolute SHAP per feature and top-driver ranking come from masked
+vectorized reductions (a 0/1 weight vector times the SHAP matrix), and both
+predicate masks and segment summaries are memoized.
+
+Besides the model features, "win_probability" and "probability_bucket"
+(Low / Medium / High / Very High, as in the pipeline) can be filtered on.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+from threshold_curve import BUCKET_EDGES, BUCKET_LABELS
+
+OPERATORS = {
+    "==": lambda col, v: col == v,
+    "!=": lambda col, v: col != v,
+    "<": lambda col, v: col < v,
+    "<=": lambda col, v: col <= v,
+    ">": lambda col, v: col > v,
+    ">=": lambda col, v: col >= v,
+    "in": lambda col, v: np.isin(col, list(v)),
+    "between": lambda col, v: (col >= v[0]) & (col <= v[1]),
+}
+
+
+def _normalize(predicate):
+    """Hashable form of a predicate; list values become tuples"""
+    feature, op, value = predicate
+    if op not in OPERATORS:
+        raise ValueError(f"Operador no soportado: {op} (usa uno de {list(OPERATORS)})")
+    if isinstance(value, (list, tuple, set, np.ndarray)):
+        value = tuple(sorted(value)) if op == "in" else tuple(value)
+    return feature, op, value
+
+
+class SegmentEngine:
+    """Segment queries over one SHAP matrix; results are cached per predicate set"""
+
+    def __init__(self, X, shap_values, y_true, y_prob=None, threshold=0.5, cache_size=256):
+        self.feature_names = list(X.columns)
+        self.columns = {name: X[name].to_numpy() for name in self.feature_names}
+        self.shap = np.asarray(shap_values, dtype=np.float64)
+        self.abs_shap = np.abs(self.shap)
+        self.y_true = np.asarray(y_true, dtype=np.float64)
+        self.threshold = threshold
+        if y_prob is not None:
+            y_prob = np.asarray(y_prob, dtype=np.float64)
+            self.columns["win_probability"] = y_prob
+            # (low, high] intervals, same as pd.cut in the pipeline
+            buckets = np.clip(np.searchsorted(BUCKET_EDGES, y_prob, side="left") - 1, 0, len(BUCKET_LABELS) - 1)
+            self.columns["probability_bucket"] = np.array(BUCKET_LABELS, dtype=object)[buckets]
+        self.y_prob = y_prob
+        self.cache_size = cache_size
+        self._masks = OrderedDict()
+        self._summaries = OrderedDict()
+
+    def __len__(self):
+        return len(self.y_true)
+
+    @staticmethod
+    def _remember(cache, key, value, limit):
+        cache[key] = value
+        if len(cache) > limit:
+            cache.popitem(last=False)
+        return value
+
+    def predicate_mask(self, predicate):
+        feature, op, value = _normalize(predicate)
+        key = (feature, op, value)
+        if key in self._masks:
+            self._masks.move_to_end(key)
+            return self._masks[key]
+        if feature not in self.columns:
+            raise KeyError(f"Feature desconocida en el segmento: {feature}")
+        mask = OPERATORS[op](self.columns[feature], value)
+        mask.setflags(write=False)
+        return self._remember(self._masks, key, mask, self.cache_size * 4)
+
+    def mask(self, predicates):
+        """Rows matching every predicate (all rows for an empty list)"""
+        mask = np.ones(len(self), dtype=bool)
+        for predicate in predicates:
+            mask &= self.predicate_mask(predicate)
+        return mask
+
+    def summarize(self, predicates=(), top_k=10):
+        """Size, outcome rates, per-feature SHAP means and top drivers of a segment"""
+        key = (frozenset(_normalize(p) for p in predicates), top_k)
+        if key in self._summaries:
+            self._summaries.move_to_end(key)
+            return self._summaries[key]
+
+        mask = self.mask(predicates)
+        size = int(mask.sum())
+        summary = {
+            "predicates": [list(_normalize(p)) for p in predicates],
+            "size": size,
+            "share": size / len(self) if len(self) else 0.0,
+            "win_rate": None,
+            "mean_probability": None,
+            "predicted_win_rate": None,
+            "mean_shap": {},
+            "mean_abs_shap": {},
+            "top_drivers": [],
+        }
+        if size:
+            weights = mask / size
+            mean_shap = weights @ self.shap
+            mean_abs = weights @ self.abs_shap
+            summary["win_rate"] = float(weights @ self.y_true)
+            if self.y_prob is not None:
+                summary["mean_probability"] = float(weights @ self.y_prob)
+                summary["predicted_win_rate"] = float(weights @ (self.y_prob >= self.threshold))
+            summary["mean_shap"] = dict(zip(self.feature_names, mean_shap.tolist()))
+            summary["mean_abs_shap"] = dict(zip(self.feature_names, mean_abs.tolist()))
+            top = np.argsort(mean_abs)[::-1][:top_k]
+            summary["top_drivers"] = [
+                {
+                    "feature": self.feature_names[j],
+                    "mean_abs_shap": float(mean_abs[j]),
+                    "mean_shap": float(mean_shap[j]),
+                    "direction": "positive" if mean_shap[j] > 0 else "negative",
+                }
+                for j in top
+            ]
+        return self._remember(self._summaries, key, summary, self.cache_size)
+
+    def compare(self, predicates_a, predicates_b=(), top_k=10):
+        """Features whose mean SHAP differs most between segment A and segment B"""
+        a = self.summarize(predicates_a, top_k)
+        b = self.summarize(predicates_b, top_k)
+        if not a["size"] or not b["size"]:
+            return a, b, []
+        diffs = sorted(
+            ((f, a["mean_shap"][f] - b["mean_shap"][f]) for f in self.feature_names),
+            key=lambda item: abs(item[1]), reverse=True
+        )[:top_k]
+        return a, b, [{"feature": f, "mean_shap_difference": d} for f, d in diffs]
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Schneider Electric Datathon - SHAP Views
+Numpy-only preparation of SHAP visualizations for the dashboard.
+
+The beeswarm is built straight from the persisted SHAP matrix. To stay
+responsive with hundreds of thousands of points, each feature row is
+downsampled in a density-aware way: SHAP values are binned, sparse bins (the
+informative tails) keep every point, and only crowded bins are thinned down to
+a common cap chosen so the row fits its point budget.
+"""
+
+import numpy as np
+
+BEESWARM_COLORSCALE = [[0.0, "#008bfb"], [1.0, "#ff0052"]]
+
+
+def _bin_cap(counts, budget):
+    """Largest per-bin cap c with sum(min(counts, c)) <= budget"""
+    if counts.sum() <= budget:
+        return int(counts.max())
+    sorted_counts = np.sort(counts)
+    remaining = len(sorted_counts) - np.arange(len(sorted_counts))
+    kept_below = np.concatenate([[0], np.cumsum(sorted_counts)[:-1]])
+    # Total kept if the cap equals each sorted count; pick the last one within budget
+    totals = kept_below + sorted_counts * remaining
+    idx = np.searchsorted(totals, budget, side="right") - 1
+    if idx < 0:
+        return max(1, budget // len(counts))
+    # Only the bins above idx can take more points; the one at idx is already full
+    leftover = budget - totals[idx]
+    return int(sorted_counts[idx] + leftover // max(remaining[idx] - 1, 1))
+
+
+def downsample_by_density(values, budget, n_bins=60, rng=None):
+    """Indices of at most `budget` points, thinning only the densest bins"""
+    rng = rng or np.random.default_rng(42)
+    n = len(values)
+    if n <= budget:
+        return np.arange(n)
+    edges = np.histogram_bin_edges(values, bins=n_bins)
+    bins = np.clip(np.searchsorted(edges, values, side="right") - 1, 0, n_bins - 1)
+    counts = np.bincount(bins, minlength=n_bins)
+    cap = _bin_cap(counts, budget)
+
+    # Random rank inside each bin; keep the first `cap` of every bin
+    order = np.lexsort((rng.random(n), bins))
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    rank = np.empty(n, dtype=np.int64)
+    rank[order] = np.arange(n) - starts[bins[order]]
+    keep = rank < cap
+    # The integer cap leaves fewer than one point per capped bin unused; give those to random capped bins
+    extra = budget - int(keep.sum())
+    if extra > 0:
+        candidates = np.flatnonzero(rank == cap)
+        keep[rng.choice(candidates, size=min(extra, len(candidates)), replace=False)] = True
+    return np.flatnonzero(keep)
+
+
+def prepare_beeswarm(shap_values, feature_values, feature_names, mask=None, max_display=20,
+                     max_points_per_feature=800, n_bins=60, row_height=0.4, seed=42):
+    """
+    Point set for an interactive beeswarm.
+
+    Returns a dict of flat arrays (x = SHAP value, y = row position with
+    density-shaped jitter, color = feature value scaled to 0-1 within the
+    segment, row = case position) plus the displayed feature order and counts.
+    """
+    rng = np.random.default_rng(seed)
+    shap_values = np.asarray(shap_values)
+    feature_values = np.asarray(feature_values, dtype=float)
+    rows = np.flatnonzero(mask) if mask is not None else np.arange(len(shap_values))
+    seg_shap = shap_values[rows]
+    seg_feat = feature_values[rows]
+
+    importance = np.abs(seg_shap).mean(axis=0) if len(rows) else np.zeros(shap_values.shape[1])
+    top = np.argsort(importance)[::-1][:max_display]
+
+    xs, ys, colors, case_rows, feats = [], [], [], [], []
+    for position, j in enumerate(top[::-1]):
+        values = seg_shap[:, j]
+        keep = downsample_by_density(values, max_points_per_feature, n_bins=n_bins, rng=rng)
+        kept = values[keep]
+
+        # Jitter width follows the local density of the full (not downsampled) column
+        hist, edges = np.histogram(values, bins=n_bins)
+        bin_idx = np.clip(np.searchsorted(edges, kept, side="right") - 1, 0, n_bins - 1)
+        density = np.sqrt(hist[bin_idx] / max(hist.max(), 1))
+        jitter = (rng.random(len(kept)) - 0.5) * 2 * row_height * density
+
+        col = seg_feat[keep, j]
+        low, high = np.nanpercentile(seg_feat[:, j], [5, 95]) if len(values) else (0.0, 1.0)
+        scaled = np.clip((col - low) / (high - low), 0, 1) if high > low else np.full(len(col), 0.5)
+
+        xs.append(kept)
+        ys.append(position + jitter)
+        colors.append(scaled)
+        case_rows.append(rows[keep])
+        feats.append(np.full(len(kept), j))
+
+    def _cat(parts, dtype):
+        return np.concatenate(parts).astype(dtype) if parts else np.empty(0, dtype=dtype)
+
+    return {
+        "x": _cat(xs, np.float32),
+        "y": _cat(ys, np.float32),
+        "color": _cat(colors, np.float32),
+        "row": _cat(case_rows, np.int64),
+        "feature": _cat(feats, np.int64),
+        "feature_order": [feature_names[j] for j in top[::-1]],
+        "mean_abs_shap": [float(importance[j]) for j in top[::-1]],
+        "n_segment_rows": int(len(rows)),
+        "n_points_total": int(len(rows) * len(top)),
+    }
@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+"""
+Schneider Electric Datathon - Synthetic Data Generator
+Class-conditional Gaussian copula fitted to the raw columns of dataset.csv,
+for scaling tests and for sharing data with performance testers without
+customer rows.
+
+    fit       per target class: per-column marginals + correlation of the normal scores
+    generate  class drawn at the fitted rate, then correlated normals ->
+              uniforms -> inverse marginals of that class, chunk by chunk
+
+Marginals (per class):
+  - columns with at most MAX_LEVELS distinct values (counts, flags, the
+    scaled month) keep their observed values and frequencies, so value
+    lattices are reproduced exactly;
+  - other columns use an interpolated quantile table, rounded to the
+    source precision.
+
+Fitting one copula per value of target_variable reproduces the target
+rate and how each feature shifts between won and lost opportunities; a
+single copula with the target as one more column only keeps its linear
+correlations and trains noticeably worse models. Rows are generated and
+written in fixed-size chunks, so memory does not grow with the number of
+rows; output is CSV or Parquet (by extension) with the same columns and a
+fresh sequential id.
+
+The model is a small JSON file (output/synthetic_model.json); no rows of
+the source are stored in it, only per-column value tables.
+
+Usage:
+    python synthetic_data.py fit --data dataset.csv
+    python synthetic_data.py generate --scale 100 --out synthetic_100x.parquet
+    python synthetic_data.py validate --synthetic synthetic_100x.parquet --utility
+    DATASET_PATH=synthetic_100x.parquet python local_pipeline.py
+"""
+
+import json
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+MODEL_PATH = Path("output/synthetic_model.json")
+MAX_LEVELS = 1000
+N_QUANTILES = 2001
+
+
+def _decimals(x, max_decimals=10):
+    """Smallest number of decimals that represents every value of x"""
+    for d in range(max_decimals + 1):
+        if np.allclose(x, np.round(x, d), rtol=0, atol=1e-12):
+            return d
+    return None
+
+
+def _nearest_correlation(corr):
+    """Clip negative eigenvalues so the matrix admits a Cholesky factor"""
+    values, vectors = np.linalg.eigh(corr)
+    fixed = vectors @ np.diag(np.clip(values, 1e-6, None)) @ vectors.T
+    scale = np.sqrt(np.diag(fixed))
+    return fixed / np.outer(scale, scale)
+
+
+def fit_copula(df, columns, max_levels=MAX_LEVELS, n_quantiles=N_QUANTILES):
+    """Marginals and normal-score correlation of the given columns"""
+    n_rows = len(df)
+    scores = np.empty((n_rows, len(columns)))
+    marginals = {}
+    for j, column in enumerate(columns):
+        x = df[column].to_numpy(dtype=np.float64)
+        values, counts = np.unique(x, return_counts=True)
+        cdf = np.cumsum(counts) / n_rows
+        if len(values) <= max_levels:
+            marginals[column] = {"kind": "discrete", "values": values.tolist(), "cdf": cdf.tolist()}
+            # Middle of each value's CDF step
+            position = np.searchsorted(values, x)
+            u = cdf[position] - counts[position] / (2 * n_rows)
+        else:
+            grid = np.linspace(0, 1, n_quantiles)
+            marginals[column] = {"kind": "continuous", "quantiles": np.quantile(x, grid).tolist(),
+                                 "decimals": _decimals(x)}
+            u = (stats.rankdata(x) - 0.5) / n_rows
+        marginals[column]["dtype"] = str(df[column].dtype)
+        scores[:, j] = stats.norm.ppf(u)
+
+    corr = _nearest_correlation(np.corrcoef(scores, rowvar=False))
+    return {"marginals": marginals, "correlation": corr.tolist()}
+
+
+def fit(df, target="target_variable", max_levels=MAX_LEVELS, n_quantiles=N_QUANTILES):
+    """Model (JSON-serializable dict) of every column except id: one copula per target class"""
+    columns = [c for c in df.columns if c not in ("id", target)]
+    segments = []
+    for value, group in df.groupby(target, sort=True):
+        segment = fit_copula(group, columns, max_levels, n_quantiles)
+        segment.update(value=int(value), weight=len(group) / len(df))
+        segments.append(segment)
+    return {
+        "columns": list(df.columns),
+        "copula_columns": columns,
+        "target": target,
+        "target_dtype": str(df[target].dtype),
+        "n_rows": len(df),
+        "segments": segments,
+    }
+
+
+def save_model(model, path=MODEL_PATH):
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(model, f)
+
+
+def load_model(path=MODEL_PATH):
+    with open(path) as f:
+        return json.load(f)
+
+
+def _inverse(marginal, u):
+    if marginal["kind"] == "discrete":
+        values = np.asarray(marginal["values"])
+        position = np.searchsorted(np.asarray(marginal["cdf"]), u, side="right")
+        return values[np.minimum(position, len(values) - 1)]
+    quantiles = np.asarray(marginal["quantiles"])
+    x = np.interp(u, np.linspace(0, 1, len(quantiles)), quantiles)
+    return x if marginal["decimals"] is None else np.round(x, marginal["decimals"])
+
+
+def generate(model, n_rows, chunk_size=100_000, seed=42, start_id=1):
+    """Yield DataFrames of at most chunk_size synthetic rows, n_rows in total"""
+    rng = np.random.default_rng(seed)
+    columns, target = model["copula_columns"], model["target"]
+    segments = model["segments"]
+    factors = [np.linalg.cholesky(np.asarray(s["correlation"])) for s in segments]
+    weights = np.array([s["weight"] for s in segments])
+    for start in range(0, n_rows, chunk_size):
+        size = min(chunk_size, n_rows - start)
+        labels = rng.choice(len(segments), size=size, p=weights / weights.sum())
+        chunk = {"id": np.arange(start_id + start, start_id + start + size),
+                 target: np.empty(size, dtype=model["target_dtype"])}
+        for column in columns:
+            chunk[column] = np.empty(size, dtype=segments[0]["marginals"][column]["dtype"])
+        for k, (segment, factor) in enumerate(zip(segments, factors)):
+            rows = np.flatnonzero(labels == k)
+            u = stats.norm.cdf(rng.standard_normal((len(rows), len(columns))) @ factor.T)
+            chunk[target][rows] = segment["value"]
+            for j, column in enumerate(columns):
+                chunk[column][rows] = _inverse(segment["marginals"][column], u[:, j])
+        yield pd.DataFrame(chunk)[model["columns"]]
+
+
+def write_synthetic(model, path, n_rows, chunk_size=100_000, seed=42):
+    """Stream n_rows to CSV or Parquet (by extension); returns (rows written, seconds)"""
+    path = Path(path)
+    start = time.perf_counter()
+    written = 0
+    if path.suffix == ".parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        writer = None
+        try:
+            for chunk in generate(model, n_rows, chunk_size, seed):
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table)
+                written += len(chunk)
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        with open(path, "w", newline="") as f:
+            for i, chunk in enumerate(generate(model, n_rows, chunk_size, seed)):
+                chunk.to_csv(f, header=(i == 0), index=False)
+                written += len(chunk)
+    return written, time.perf_counter() - start
+
+
+# ------------------------------------------------------------
+# VALIDATION
+# ------------------------------------------------------------
+def compare_to_real(real, synthetic):
+    """Marginal (KS, mean / std shift), correlation and target-rate fidelity"""
+    columns = [c for c in real.columns if c != "id"]
+    per_column = {}
+    for column in columns:
+        r, s = real[column].to_numpy(dtype=float), synthetic[column].to_numpy(dtype=float)
+        std = r.std() or 1.0
+        per_column[column] = {
+            "ks": float(stats.ks_2samp(r, s).statistic),
+            "mean_shift_std": float((s.mean() - r.mean()) / std),
+            "std_ratio": float(s.std() / std),
+        }
+    corr_real = real[columns].corr().to_numpy()
+    corr_synth = synthetic[columns].corr().to_numpy()
+    return {
+        "target_rate": {"real": float(real["target_variable"].mean()),
+                        "synthetic": float(synthetic["target_variable"].mean())},
+        "max_ks": max(v["ks"] for v in per_column.values()),
+        "max_abs_corr_diff": float(np.nanmax(np.abs(corr_real - corr_synth))),
+        "mean_abs_corr_diff": float(np.nanmean(np.abs(corr_real - corr_synth))),
+        "columns": per_column,
+    }
+
+
+def utility_auc(real, synthetic, n_estimators=200, seed=42):
+    """Test AUC on held-out real rows of a model trained on real vs on synthetic rows"""
+    from xgboost import XGBClassifier
+    from sklearn.model_selection import train_test_split
+    from sklearn.metrics import roc_auc_score
+    from features import engineer_features, build_xy
+
+    median = real["cust_interactions"].median()
+    X, y = build_xy(engineer_features(real, interactions_median=median))
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=seed, stratify=y)
+    X_syn, y_syn = build_xy(engineer_features(synthetic.iloc[:len(X_train)], interactions_median=median))
+
+    scores = {}
+    for name, (X_fit, y_fit) in {"real": (X_train, y_train), "synthetic": (X_syn[X.columns], y_syn)}.items():
+        model = XGBClassifier(n_estimators=n_estimators, max_depth=6, learning_rate=0.1, random_state=seed)
+        model.fit(X_fit, y_fit)
+        scores[name] = float(roc_auc_score(y_test, model.predict_proba(X_test)[:, 1]))
+    return scores
+
+
+def print_validation(report):
+    rate = report["target_rate"]
+    print(f"  target rate real {rate['real']:.4f} · synthetic {rate['synthetic']:.4f}")
+    print(f"  KS máx {report['max_ks']:.3f} · |Δcorr| máx {report['max_abs_corr_diff']:.3f} "
+          f"(medio {report['mean_abs_corr_diff']:.3f})")
+    worst = sorted(report["columns"].items(), key=lambda kv: -kv[1]["ks"])[:5]
+    for column, v in worst:
+        print(f"    {column:<28} KS {v['ks']:.3f} · Δmedia {v['mean_shift_std']:+.3f} σ · σ x{v['std_ratio']:.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gaussian-copula synthetic version of dataset.csv")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("fit")
+    p.add_argument("--data", default="dataset.csv")
+    p.add_argument("--model", default=str(MODEL_PATH))
+    p = sub.add_parser("generate")
+    p.add_argument("--model", default=str(MODEL_PATH))
+    p.add_argument("--data", default="dataset.csv", help="Fitted first when --model does not exist")
+    p.add_argument("--scale", type=float, default=10.0, help="Rows as a multiple of the fitted dataset")
+    p.add_argument("--rows", type=int, default=None, help="Exact row count (overrides --scale)")
+    p.add_argument("--out", required=True, help=".csv or .parquet")
+    p.add_argument("--chunk-size", type=int, default=100_000)
+    p.add_argument("--seed", type=int, default=42)
+    p = sub.add_parser("validate")
+    p.add_argument("--data", default="dataset.csv")
+    p.add_argument("--synthetic", required=True)
+    p.add_argument("--sample", type=int, default=200_000, help="Synthetic rows read for the comparison")
+    p.add_argument("--utility", action="store_true", help="Also compare train-on-synthetic AUC")
+    args = parser.parse_args()
+
+    from features import load_dataset
+
+    if args.command == "fit":
+        model = fit(load_dataset(args.data))
+        save_model(model, args.model)
+        print(f"✅ Modelo copula ({len(model['copula_columns'])} columnas, {model['n_rows']:,} filas) en {args.model}")
+    elif args.command == "generate":
+        if not Path(args.model).exists():
+            save_model(fit(load_dataset(args.data)), args.model)
+            print(f"✅ Modelo copula ajustado sobre {args.data} → {args.model}")
+        model = load_model(args.model)
+        n_rows = args.rows or int(round(model["n_rows"] * args.scale))
+        written, seconds = write_synthetic(model, args.out, n_rows, args.chunk_size, args.seed)
+        print(f"✅ {written:,} filas sintéticas en {args.out} ({seconds:.1f}s, {written / seconds:,.0f} filas/s, "
+              f"{Path(args.out).stat().st_size / 1e6:.1f} MB)")
+    else:
+        real = load_dataset(args.data)
+        synthetic = load_dataset(args.synthetic, nrows=args.sample)
+        report = compare_to_real(real, synthetic)
+        print(f"📊 {args.synthetic} ({len(synthetic):,} filas) vs {args.data} ({len(real):,} filas)")
+        print_validation(report)
+        if args.utility:
+            scores = utility_auc(real, synthetic)
+            print(f"  AUC en test real: entrenado con real {scores['real']:.4f} · con sintético {scores['synthetic']:.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""Incremental case export: what is rewritten, removed and queued for LLM next steps"""
+
+import os
+import sys
+import json
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from case_export import cases_to_enrich, export_cases, mark_enriched, write_case
+
+
+def _analysis(prob):
+    return {
+        "prediction": {"win_probability": prob, "predicted_outcome": "Win" if prob > 0.5 else "Loss",
+                       "confidence": "High"},
+        "business_recommendation": {"action": "Follow up", "priority": "High", "next_steps": ["rule based"]},
+        "shap_analysis": {"top_positive_factors": [], "top_negative_factors": []},
+    }
+
+
+@pytest.fixture
+def export(tmp_path):
+    (tmp_path / "json").mkdir()
+    paths = dict(json_dir=tmp_path / "json", fingerprints_path=tmp_path / "fingerprints.json",
+                 changelog_path=tmp_path / "changelog.json", pending_path=tmp_path / "pending.json")
+
+    def run(probs, full=False):
+        return export_cases(((case_id, _analysis(p)) for case_id, p in probs.items()), full=full, **paths)
+    run.pending = paths["pending_path"]
+    run.case = lambda case_id: tmp_path / "json" / f"{case_id}.json"
+    return run
+
+
+def _enrich(path):
+    with open(path) as f:
+        case = json.load(f)
+    case["business_recommendation"].update(next_steps=["llm"], ai_generated=True)
+    write_case(path, case)
+
+
+def test_first_run_writes_everything_and_queues_it(export):
+    changelog = export({1: 0.9, 2: 0.2, 3: 0.6})
+    assert changelog["first_run"]
+    assert changelog["counts"]["written"] == 3
+    assert cases_to_enrich(export.pending) == ["1", "2", "3"]
+
+
+def test_only_changed_cases_are_rewritten(export):
+    export({1: 0.9, 2: 0.2, 3: 0.6})
+    mtime = os.stat(export.case(1)).st_mtime_ns
+    # 2 crosses a bucket edge, 3 disappears, 4 is new
+    changelog = export({1: 0.91, 2: 0.45, 4: 0.8})
+    counts = changelog["counts"]
+    assert (counts["added"], counts["changed"], counts["removed"], counts["unchanged"]) == (1, 1, 1, 1)
+    assert changelog["changed"] == [{"id": "2", "fields": ["bucket"]}]
+    assert os.stat(export.case(1)).st_mtime_ns == mtime
+    assert not export.case(3).exists()
+
+
+def test_unenriched_cases_stay_pending_until_marked(export):
+    export({1: 0.9, 2: 0.2, 3: 0.6})
+    _enrich(export.case(1))
+    assert mark_enriched([1], export.pending) == 2
+    # Cases skipped by the LLM stage (cap or failure) are retried next run, oldest first
+    export({1: 0.9, 2: 0.2, 3: 0.6, 4: 0.8})
+    assert cases_to_enrich(export.pending) == ["2", "3", "4"]
+
+
+def test_changed_case_loses_llm_steps_and_is_queued_again(export):
+    export({1: 0.9})
+    _enrich(export.case(1))
+    mark_enriched(["1"], export.pending)
+    export({1: 0.1})
+    with open(export.case(1)) as f:
+        assert "ai_generated" not in json.load(f)["business_recommendation"]
+    assert cases_to_enrich(export.pending) == ["1"]
+
+
+def test_full_rewrite_carries_llm_steps_over(export):
+    export({1: 0.9, 2: 0.2})
+    _enrich(export.case(1))
+    mark_enriched(["1"], export.pending)
+    changelog = export({1: 0.9, 2: 0.2}, full=True)
+    assert changelog["counts"]["written"] == 2
+    with open(export.case(1)) as f:
+        recommendation = json.load(f)["business_recommendation"]
+    assert recommendation["next_steps"] == ["llm"] and recommendation["ai_generated"]
+    assert cases_to_enrich(export.pending) == ["2"]
+
+
+def test_missing_pending_list_is_rebuilt_from_kept_files(export):
+    export({1: 0.9, 2: 0.2})
+    _enrich(export.case(1))
+    export.pending.unlink()
+    export({1: 0.9, 2: 0.2})
+    assert cases_to_enrich(export.pending) == ["2"]
+
+
+def test_rewrite_replaces_hard_linked_file(export, tmp_path):
+    export({1: 0.9})
+    os.link(export.case(1), tmp_path / "published.json")
+    export({1: 0.1})
+    with open(tmp_path / "published.json") as f:
+        assert json.load(f)["prediction"]["win_probability"] == 0.9
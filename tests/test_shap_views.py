@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""Density-aware beeswarm downsampling keeps exactly its point budget"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from shap_views import _bin_cap, downsample_by_density
+
+
+@pytest.mark.parametrize("values", [
+    np.random.default_rng(0).standard_normal(10_000),
+    # One crowded bin next to a sparse tail: the cap cannot be shared evenly
+    np.concatenate([np.zeros(9_000), np.random.default_rng(1).uniform(0, 5, 1_000)]),
+    np.random.default_rng(2).exponential(1.0, 10_000) ** 3,
+])
+def test_downsample_reaches_budget(values):
+    keep = downsample_by_density(values, budget=800)
+    assert len(keep) == 800
+    assert len(np.unique(keep)) == len(keep)
+
+
+def test_sparse_bins_are_kept_whole():
+    values = np.concatenate([np.zeros(9_990), np.linspace(1, 10, 10)])
+    keep = downsample_by_density(values, budget=100, n_bins=60)
+    assert np.all(np.isin(np.arange(9_990, 10_000), keep))
+
+
+def test_bin_cap_stays_within_budget():
+    counts = np.array([0, 3, 5, 40, 900, 2_000])
+    cap = _bin_cap(counts, 800)
+    assert np.minimum(counts, cap).sum() <= 800
+    assert np.minimum(counts, cap + 1).sum() > 800
+
+
+def test_small_input_is_returned_unchanged():
+    assert np.array_equal(downsample_by_density(np.arange(50.0), budget=800), np.arange(50))
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""Threshold metrics read off the cumulative curve match sklearn at any cut-off"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from threshold_curve import build_threshold_curve, metrics_at
+
+
+@pytest.fixture(scope="module")
+def scores():
+    rng = np.random.default_rng(0)
+    y = rng.integers(0, 2, 2_000)
+    # Rounded so many cases share a probability, the edge case for >= at the threshold
+    prob = np.round(np.clip(0.35 * y + rng.uniform(0, 0.65, len(y)), 0, 1), 2)
+    return y, prob
+
+
+@pytest.mark.parametrize("threshold", [0.0, 0.1, 0.37, 0.5, 0.62, 0.99, 1.0, 1.01])
+def test_metrics_match_sklearn(scores, threshold):
+    y, prob = scores
+    metrics = metrics_at(build_threshold_curve(y, prob), threshold)
+    pred = (prob >= threshold).astype(int)
+    assert metrics["predicted_wins"] == pred.sum()
+    assert metrics["precision"] == pytest.approx(precision_score(y, pred, zero_division=0))
+    assert metrics["recall"] == pytest.approx(recall_score(y, pred, zero_division=0))
+    assert metrics["f1_score"] == pytest.approx(f1_score(y, pred, zero_division=0))
+    assert metrics["accuracy"] == pytest.approx(accuracy_score(y, pred))
+    assert metrics["tp"] + metrics["fp"] + metrics["fn"] + metrics["tn"] == len(y)
+
+
+def test_threshold_on_a_tied_probability_counts_every_tie():
+    curve = build_threshold_curve([1, 0, 1, 0], [0.8, 0.5, 0.5, 0.2])
+    metrics = metrics_at(curve, 0.5)
+    assert (metrics["tp"], metrics["fp"], metrics["fn"], metrics["tn"]) == (2, 1, 0, 1)
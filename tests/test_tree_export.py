@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""The NumPy tree evaluator matches XGBoost, including NaN and +inf inputs"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+xgb = pytest.importorskip("xgboost")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from tree_export import CompiledTrees, verify
+
+
+def _data(seed=0, n=600, n_features=6, inf_rate=0.0):
+    rng = np.random.default_rng(seed)
+    X = rng.standard_normal((n, n_features)).astype(np.float32)
+    y = (X[:, 0] + 0.5 * X[:, 1] - X[:, 2] ** 2 + 0.3 * rng.standard_normal(n) > 0).astype(np.float32)
+    # Missing values in training so splits learn default directions (xgboost refuses inf there)
+    X[rng.random(X.shape) < 0.15] = np.nan
+    X[rng.random(X.shape) < inf_rate] = np.inf
+    X[rng.random(X.shape) < inf_rate] = -np.inf
+    return X, y
+
+
+def _probe_rows(n_features):
+    """Rows that are all NaN, all +inf, all -inf and a mix of both"""
+    mixed = np.tile([np.nan, np.inf], n_features)[:n_features]
+    return np.array([np.full(n_features, np.nan), np.full(n_features, np.inf),
+                     np.full(n_features, -np.inf), mixed], dtype=np.float32)
+
+
+@pytest.mark.parametrize("make_model", [
+    lambda: xgb.XGBClassifier(n_estimators=30, max_depth=4),
+    lambda: xgb.XGBRegressor(n_estimators=30, max_depth=4, objective="reg:logistic"),
+    lambda: xgb.XGBRegressor(n_estimators=30, max_depth=4, objective="reg:squarederror"),
+], ids=["binary:logistic", "reg:logistic", "reg:squarederror"])
+def test_compiled_trees_match_xgboost(make_model):
+    X, y = _data()
+    model = make_model().fit(X, y)
+    compiled = CompiledTrees.from_model(model)
+    X_new, _ = _data(seed=1, n=400, inf_rate=0.05)
+    assert verify(compiled, model, X_new) < 1e-6
+    assert verify(compiled, model, _probe_rows(X.shape[1])) < 1e-6
+
+
+def test_save_and_load_round_trip(tmp_path):
+    X, y = _data()
+    model = xgb.XGBClassifier(n_estimators=10, max_depth=3).fit(X, y)
+    compiled = CompiledTrees.from_model(model)
+    compiled.save(tmp_path / "trees.npz")
+    loaded = CompiledTrees.load(tmp_path / "trees.npz")
+    assert loaded.fingerprint == compiled.fingerprint
+    assert verify(loaded, model, X) < 1e-6
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Schneider Electric Datathon - Threshold Curve
+Sorted test probabilities with cumulative true/false positive counts. Any
+threshold is then a binary search away: metrics, predicted wins, probability
+buckets and profit under a cost matrix are read off the cumulative arrays
+without rescoring the model.
+"""
+
+import numpy as np
+
+BUCKET_EDGES = [0.0, 0.3, 0.5, 0.7, 1.0]
+BUCKET_LABELS = ["Low", "Medium", "High", "Very High"]
+
+
+def build_threshold_curve(y_true, y_prob):
+    """Probabilities sorted in descending order with cumulative TP/FP counts"""
+    y_true = np.asarray(y_true).astype(np.int64)
+    y_prob = np.asarray(y_prob, dtype=np.float64)
+    order = np.argsort(-y_prob, kind="mergesort")
+    return {
+        "probabilities": y_prob[order],
+        "cum_tp": np.cumsum(y_true[order]),
+        "cum_fp": np.cumsum(1 - y_true[order]),
+    }
+
+
+def save_threshold_curve(curve, path):
+    np.savez_compressed(path, **curve)
+
+
+def load_threshold_curve(path):
+    with np.load(path) as data:
+        return {key: data[key] for key in data.files}
+
+
+def _n_above(curve, threshold):
+    """Number of cases with probability >= threshold (the predicted wins)"""
+    return int(np.searchsorted(-curve["probabilities"], -threshold, side="right"))
+
+
+def _counts_at(curve, k):
+    """Confusion counts when the top-k cases are predicted as wins; k may be an array"""
+    n_pos = curve["cum_tp"][-1]
+    n_neg = curve["cum_fp"][-1]
+    k = np.asarray(k)
+    safe = np.maximum(k - 1, 0)
+    tp = np.where(k > 0, curve["cum_tp"][safe], 0)
+    fp = np.where(k > 0, curve["cum_fp"][safe], 0)
+    return tp, fp, n_pos - tp, n_neg - fp
+
+
+def metrics_at(curve, threshold):
+    """Precision, recall, F1, accuracy and predicted wins at an arbitrary threshold"""
+    k = _n_above(curve, threshold)
+    tp, fp, fn, tn = (int(v) for v in _counts_at(curve, k))
+    total = len(curve["probabilities"])
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {
+        "threshold": float(threshold),
+        "precision": precision,
+        "recall": recall,
+        "f1_score": f1,
+        "accuracy": (tp + tn) / total,
+        "predicted_wins": k,
+        "predicted_losses": total - k,
+        "win_rate": k / total,
+        "tp": tp, "fp": fp, "fn": fn, "tn": tn,
+    }
+
+
+def bucket_counts(curve, threshold):
+    """Opportunities per probability bucket, split into predicted wins and losses"""
+    k = _n_above(curve, threshold)
+    buckets = {}
+    for label, low, high in zip(BUCKET_LABELS, BUCKET_EDGES[:-1], BUCKET_EDGES[1:]):
+        # Same (low, high] intervals as pd.cut in the pipeline
+        start = _n_above(curve, np.nextafter(high, np.inf))
+        stop = _n_above(curve, np.nextafter(low, np.inf))
+        wins = max(0, min(stop, k) - start)
+        buckets[label] = {"total": stop - start, "predicted_wins": wins, "predicted_losses": stop - start - wins}
+    return buckets
+
+
+def profit_curve(curve, gain_tp=1.0, cost_fp=0.0, cost_fn=0.0, gain_tn=0.0):
+    """
+    Expected value of every distinct cut-off under a cost matrix.
+
+    Returns (thresholds, profits) where thresholds[i] is the smallest probability
+    still predicted as win; costs are entered as positive numbers and subtracted.
+    """
+    prob = curve["probabilities"]
+    # Only the last position of each run of tied probabilities is a valid cut
+    cut = np.flatnonzero(np.r_[prob[1:] != prob[:-1], True]) + 1
+    k = np.r_[0, cut]
+    tp, fp, fn, tn = _counts_at(curve, k)
+    profits = gain_tp * tp - cost_fp * fp - cost_fn * fn + gain_tn * tn
+    thresholds = np.r_[np.nextafter(prob[0], np.inf), prob[cut - 1]]
+    return thresholds, profits.astype(float)
+
+
+def profit_optimal_threshold(curve, **costs):
+    """Threshold with the highest total value under the cost matrix"""
+    thresholds, profits = profit_curve(curve, **costs)
+    best = int(np.argmax(profits))
+    return float(thresholds[best]), float(profits[best])
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""
+Schneider Electric Datathon - Compiled Tree Evaluator
+Flattens the trained booster into contiguous NumPy arrays (one row per node:
+feature, threshold, left child, default direction, leaf value) saved in
+output/model_trees.npz, and scores rows from them without importing xgboost.
+
+Every tree is walked for all rows at once: XGBoost stores the right child
+right after the left one, so a step is `node = left[node] + (x >= threshold)`,
+and leaves point back to themselves with an infinite threshold. `max_depth`
+such steps over a rows x trees node matrix reach every leaf. Comparisons are
+done in float32 like XGBoost (NaN follows the default direction), so results
+match the booster to float rounding of the final sum.
+
+Usage:
+    python tree_export.py                 # export output/model.pkl and verify
+    python tree_export.py --benchmark     # latency, throughput and memory vs xgboost
+"""
+
+import json
+import time
+import hashlib
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+TREES_PATH = Path("output/model_trees.npz")
+
+# Objectives whose prediction is sigmoid(margin)
+LOGISTIC_OBJECTIVES = {"binary:logistic", "reg:logistic"}
+SUPPORTED_OBJECTIVES = LOGISTIC_OBJECTIVES | {"reg:squarederror"}
+
+
+def model_fingerprint(model):
+    """sha1 of the booster's binary model, to tie an export to the model it came from"""
+    booster = model.get_booster() if hasattr(model, "get_booster") else model
+    return hashlib.sha1(bytes(booster.save_raw("ubj"))).hexdigest()
+
+
+def _base_margin(base_score, objective):
+    p = float(base_score.strip("[]"))
+    if objective in LOGISTIC_OBJECTIVES:
+        return float(np.log(p / (1 - p)))
+    return p
+
+
+def export_trees(model):
+    """Flatten an XGBClassifier / XGBRegressor / Booster into node arrays"""
+    booster = model.get_booster() if hasattr(model, "get_booster") else model
+    learner = json.loads(bytes(booster.save_raw("json")))["learner"]
+    objective = learner["objective"]["name"]
+    if objective not in SUPPORTED_OBJECTIVES:
+        raise ValueError(f"❌ Objetivo no soportado: {objective}")
+    gbm = learner["gradient_booster"]
+    if gbm["name"] != "gbtree":
+        raise ValueError(f"❌ Booster no soportado: {gbm['name']}")
+
+    features, thresholds, lefts, defaults, values, roots, depths = [], [], [], [], [], [], []
+    offset = 0
+    for tree in gbm["model"]["trees"]:
+        if any(tree["split_type"]):
+            raise ValueError("❌ Splits categóricos no soportados")
+        left = np.asarray(tree["left_children"], dtype=np.int32)
+        right = np.asarray(tree["right_children"], dtype=np.int32)
+        n = len(left)
+        own = np.arange(n, dtype=np.int32)
+        leaf = left == -1
+        if np.any(right[~leaf] != left[~leaf] + 1):
+            raise ValueError("❌ Árbol con hijos no consecutivos")
+
+        # Leaves loop onto themselves (x < inf always goes "left"); for them
+        # split_conditions holds the leaf value
+        lefts.append(np.where(leaf, own, left) + offset)
+        features.append(np.where(leaf, 0, tree["split_indices"]).astype(np.int32))
+        thresholds.append(np.where(leaf, np.inf, tree["split_conditions"]).astype(np.float32))
+        defaults.append(np.where(leaf, True, tree["default_left"]).astype(bool))
+        values.append(np.where(leaf, tree["split_conditions"], 0).astype(np.float32))
+        roots.append(offset)
+
+        depth = np.zeros(n, dtype=np.int32)
+        for node in range(n):
+            if not leaf[node]:
+                depth[left[node]] = depth[right[node]] = depth[node] + 1
+        depths.append(int(depth.max()))
+        offset += n
+
+    return {
+        "feature": np.concatenate(features),
+        "threshold": np.concatenate(thresholds),
+        "left": np.concatenate(lefts),
+        "default_left": np.concatenate(defaults),
+        "value": np.concatenate(values),
+        "roots": np.asarray(roots, dtype=np.int32),
+        "max_depth": int(max(depths)),
+        "base_margin": _base_margin(learner["learner_model_param"]["base_score"], objective),
+        "logistic": objective in LOGISTIC_OBJECTIVES,
+        "feature_names": list(booster.feature_names or []),
+        "fingerprint": model_fingerprint(booster),
+    }
+
+
+class CompiledTrees:
+    """Vectorized scorer over exported node arrays (no xgboost import)"""
+
+    def __init__(self, arrays):
+        self.feature = np.asarray(arrays["feature"], dtype=np.int32)
+        self.threshold = np.asarray(arrays["threshold"], dtype=np.float32)
+        self.left = np.asarray(arrays["left"], dtype=np.int32)
+        self.default_left = np.asarray(arrays["default_left"], dtype=bool)
+        self.value = np.asarray(arrays["value"], dtype=np.float32)
+        self.roots = np.asarray(arrays["roots"], dtype=np.int32)
+        self.max_depth = int(arrays["max_depth"])
+        self.base_margin = float(arrays["base_margin"])
+        self.logistic = bool(arrays["logistic"])
+        self.feature_names = [str(f) for f in arrays["feature_names"]]
+        self.fingerprint = str(arrays["fingerprint"])
+
+    @classmethod
+    def from_model(cls, model):
+        return cls(export_trees(model))
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in [self.feature, self.threshold, self.left,
+                                      self.default_left, self.value, self.roots])
+
+    def save(self, path=TREES_PATH):
+        np.savez(
+            path, feature=self.feature, threshold=self.threshold, left=self.left,
+            default_left=self.default_left, value=self.value, roots=self.roots,
+            max_depth=self.max_depth, base_margin=self.base_margin, logistic=self.logistic,
+            feature_names=np.asarray(self.feature_names), fingerprint=self.fingerprint,
+        )
+
+    @classmethod
+    def load(cls, path=TREES_PATH):
+        with np.load(path) as data:
+            return cls({key: data[key] for key in data.files})
+
+    def _as_matrix(self, X):
+        if hasattr(X, "columns") and self.feature_names:
+            X = X[self.feature_names]
+        return np.atleast_2d(np.asarray(X, dtype=np.float32))
+
+    def _leaf_nodes(self, block):
+        """(rows, trees) leaf node index of every tree for one contiguous float32 block"""
+        if np.isposinf(block).any():
+            # +inf would leave the self-looping leaves; same branch as any large finite value
+            block = np.minimum(block, np.finfo(np.float32).max)
+        has_nan = np.isnan(block).any()
+        flat = block.ravel()
+        row_base = (np.arange(len(block), dtype=np.int32) * block.shape[1])[:, None]
+        node = np.broadcast_to(self.roots, (len(block), self.n_trees)).copy()
+        for _ in range(self.max_depth):
+            x = flat[row_base + self.feature[node]]
+            if has_nan:
+                go_right = ~((x < self.threshold[node]) | (np.isnan(x) & self.default_left[node]))
+            else:
+                go_right = x >= self.threshold[node]
+            node = self.left[node] + go_right
+        return node
+
+    def leaf_values(self, X, chunk_rows=256):
+        """(rows, trees) float32 leaf value of every tree"""
+        X = self._as_matrix(X)
+        out = np.empty((len(X), self.n_trees), dtype=np.float32)
+        for start in range(0, len(X), chunk_rows):
+            block = np.ascontiguousarray(X[start:start + chunk_rows])
+            out[start:start + len(block)] = self.value[self._leaf_nodes(block)]
+        return out
+
+    def predict_margin(self, X, chunk_rows=256):
+        """Raw score (log-odds for logistic objectives) per row"""
+        X = self._as_matrix(X)
+        margin = np.empty(len(X), dtype=np.float64)
+        for start in range(0, len(X), chunk_rows):
+            block = np.ascontiguousarray(X[start:start + chunk_rows])
+            margin[start:start + len(block)] = self.value[self._leaf_nodes(block)].sum(axis=1, dtype=np.float64)
+        return margin + self.base_margin
+
+    def predict(self, X, chunk_rows=256):
+        """Probability for logistic objectives, raw value otherwise"""
+        margin = self.predict_margin(X, chunk_rows)
+        return 1 / (1 + np.exp(-margin)) if self.logistic else margin
+
+    def predict_proba(self, X, chunk_rows=256):
+        """sklearn-style (n, 2) class probabilities"""
+        prob = self.predict(X, chunk_rows)
+        return np.column_stack([1 - prob, prob])
+
+
+def verify(compiled, model, X):
+    """Largest absolute difference versus the booster (probability for classifiers)"""
+    expected = model.predict_proba(X)[:, 1] if hasattr(model, "predict_proba") else model.predict(X)
+    return float(np.abs(compiled.predict(X) - expected).max())
+
+
+def load_compiled_trees(path=TREES_PATH, model=None):
+    """Compiled scorer, or None if missing or exported from a different model"""
+    path = Path(path)
+    if not path.exists():
+        return None
+    compiled = CompiledTrees.load(path)
+    if model is not None and compiled.fingerprint != model_fingerprint(model):
+        return None
+    return compiled
+
+
+# ------------------------------------------------------------
+# BENCHMARK
+# ------------------------------------------------------------
+_MEMORY_PROBE = """
+import resource, sys, time
+start = time.perf_counter()
+import numpy as np
+if sys.argv[1] == "xgboost":
+    import joblib
+    scorer = joblib.load("output/model.pkl")
+else:
+    from tree_export import CompiledTrees
+    scorer = CompiledTrees.load()
+scorer.predict_proba(np.zeros((1, int(sys.argv[2])), dtype=np.float32))
+# VmHWM is this interpreter's own peak (ru_maxrss would include the parent's)
+with open("/proc/self/status") as f:
+    peak_kb = next((int(line.split()[1]) for line in f if line.startswith("VmHWM")), None)
+if peak_kb is None:
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(time.perf_counter() - start, peak_kb / 1024)
+"""
+
+
+def _cold_start(kind, n_features):
+    """(seconds to import + load + first prediction, peak RSS MB) in a fresh interpreter"""
+    import sys
+    import subprocess
+    out = subprocess.run([sys.executable, "-c", _MEMORY_PROBE, kind, str(n_features)],
+                         capture_output=True, text=True, check=True).stdout.split()
+    return float(out[0]), float(out[1])
+
+
+def benchmark(model, X, compiled, repeats=300):
+    """Single-row latency, batch throughput and cold-start memory for both scorers"""
+    X_arr = np.asarray(X, dtype=np.float32)
+    results = {}
+    for name, predict in [("xgboost", lambda rows: model.predict_proba(rows)),
+                          ("compiled", lambda rows: compiled.predict_proba(rows))]:
+        predict(X_arr[:1])
+        latencies = []
+        for i in range(repeats):
+            row = X_arr[i % len(X_arr)][None, :]
+            start = time.perf_counter()
+            predict(row)
+            latencies.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        predict(X_arr)
+        batch_s = time.perf_counter() - start
+        cold_s, rss_mb = _cold_start(name, X_arr.shape[1])
+        results[name] = {
+            "row_p50_ms": float(np.percentile(latencies, 50)),
+            "row_p99_ms": float(np.percentile(latencies, 99)),
+            "batch_rows_per_s": len(X_arr) / batch_s,
+            "cold_start_s": cold_s,
+            "peak_rss_mb": rss_mb,
+        }
+    results["arrays_mb"] = compiled.nbytes / 1e6
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the booster to NumPy arrays and score without xgboost")
+    parser.add_argument("--benchmark", action="store_true")
+    args = parser.parse_args()
+
+    import joblib
+    model = joblib.load("output/model.pkl")
+    X_test = joblib.load("output/X_test.pkl")
+
+    compiled = CompiledTrees.from_model(model)
+    compiled.save()
+    error = verify(compiled, model, X_test)
+    print(f"✅ {compiled.n_trees} árboles · profundidad {compiled.max_depth} · "
+          f"{compiled.nbytes / 1e6:.1f} MB · error máx. {error:.2e}")
+    print(f"✅ Saved: {TREES_PATH}")
+
+    if args.benchmark:
+        results = benchmark(model, X_test, compiled)
+        for name in ["xgboost", "compiled"]:
+            r = results[name]
+            print(f"  {name:<9} 1 fila p50 {r['row_p50_ms']:.3f} ms · p99 {r['row_p99_ms']:.3f} ms · "
+                  f"batch {r['batch_rows_per_s']:,.0f} filas/s · arranque {r['cold_start_s']:.2f}s · "
+                  f"RSS {r['peak_rss_mb']:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+"""
+Schneider Electric Datathon - Hyperparameter Tuning
+Parallel random search over the XGBoost space. Trials are pruned by successive
+halving on the number of trees: every rung keeps the best 1/eta configurations
+and continues boosting them from where they stopped.
+
+Usage:
+    python tuning.py --trials 81 --time-budget 3600 --workers 4
+"""
+
+import os
+import json
+import math
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+
+import xgboost as xgb
+from xgboost import XGBClassifier
+from sklearn.model_selection import train_test_split
+from sklearn.metrics import roc_auc_score, log_loss
+from imblearn.combine import SMOTETomek
+
+TUNING_DIR = Path("output/tuning")
+
+# Configuration found offline during the datathon; used until a tuning run exists
+DEFAULT_PARAMS = {
+    "n_estimators": 591,
+    "max_depth": 11,
+    "learning_rate": 0.08699593128513321,
+    "subsample": 0.9237068376069122,
+    "colsample_bytree": 0.8494749947027712,
+    "min_child_weight": 1,
+    "gamma": 0.2773435281567039,
+    "reg_alpha": 0.1959828624191452,
+    "reg_lambda": 0.045227288910538066,
+    "scale_pos_weight": 1.0650660661526528,
+    "random_state": 42,
+    "eval_metric": "logloss",
+    "use_label_encoder": False
+}
+
+# name -> (kind, low, high); "log" samples uniformly in log space
+SEARCH_SPACE = {
+    "max_depth": ("int", 3, 12),
+    "learning_rate": ("log", 0.01, 0.3),
+    "subsample": ("float", 0.5, 1.0),
+    "colsample_bytree": ("float", 0.5, 1.0),
+    "min_child_weight": ("int", 1, 10),
+    "gamma": ("float", 0.0, 1.0),
+    "reg_alpha": ("log", 1e-3, 10.0),
+    "reg_lambda": ("log", 1e-3, 10.0),
+    "scale_pos_weight": ("float", 0.8, 1.5),
+}
+
+
+def load_best_params(path=None):
+    """Return the tuned XGBoost parameters, falling back to DEFAULT_PARAMS"""
+    params = dict(DEFAULT_PARAMS)
+    path = Path(path) if path else TUNING_DIR / "best_params.json"
+    if path.exists():
+        with open(path) as f:
+            params.update(json.load(f))
+    return params
+
+
+def sample_params(rng):
+    """Draw one configuration from SEARCH_SPACE"""
+    params = {}
+    for name, (kind, low, high) in SEARCH_SPACE.items():
+        if kind == "int":
+            params[name] = int(rng.integers(low, high + 1))
+        elif kind == "log":
+            params[name] = float(math.exp(rng.uniform(math.log(low), math.log(high))))
+        else:
+            params[name] = float(rng.uniform(low, high))
+    return params
+
+
+def rung_schedule(min_trees, max_trees, eta):
+    """Tree counts evaluated at each rung, e.g. 50, 150, 450, 600"""
+    rungs = [min_trees]
+    while rungs[-1] < max_trees:
+        rungs.append(min(rungs[-1] * eta, max_trees))
+    return rungs
+
+
+def prepare_tuning_data(X_train, y_train, val_size=0.2, random_state=42):
+    """Hold out a validation split and rebalance only the fitting part"""
+    X_fit, X_val, y_fit, y_val = train_test_split(
+        X_train, y_train, test_size=val_size, random_state=random_state, stratify=y_train
+    )
+    X_fit_bal, y_fit_bal = SMOTETomek(random_state=random_state).fit_resample(X_fit, y_fit)
+    return (
+        np.asarray(X_fit_bal, dtype=np.float32), np.asarray(y_fit_bal),
+        np.asarray(X_val, dtype=np.float32), np.asarray(y_val)
+    )
+
+
+# ------------------------------------------------------------
+# WORKER PROCESS
+# ------------------------------------------------------------
+_worker_data = {}
+
+
+def _init_worker(X_fit, y_fit, X_val, y_val):
+    """Keep the training arrays resident in each worker process"""
+    _worker_data.update(X_fit=X_fit, y_fit=y_fit, X_val=X_val, y_val=y_val)
+
+
+def _train_rung(trial_id, params, n_trees, prev_trees, prev_model):
+    """Boost a trial up to n_trees (continuing prev_model) and score it"""
+    start = time.perf_counter()
+    booster = None
+    if prev_model is not None:
+        booster = xgb.Booster()
+        booster.load_model(bytearray(prev_model))
+
+    model = XGBClassifier(
+        **params,
+        n_estimators=n_trees - prev_trees,
+        random_state=DEFAULT_PARAMS["random_state"],
+        eval_metric="logloss",
+        n_jobs=1
+    )
+    model.fit(_worker_data["X_fit"], _worker_data["y_fit"], xgb_model=booster)
+
+    prob = model.predict_proba(_worker_data["X_val"])[:, 1]
+    y_val = _worker_data["y_val"]
+    return {
+        "trial": trial_id,
+        "n_estimators": n_trees,
+        "auc": float(roc_auc_score(y_val, prob)),
+        "logloss": float(log_loss(y_val, prob)),
+        "seconds": time.perf_counter() - start,
+        "model": bytes(model.get_booster().save_raw("ubj")),
+    }
+
+
+# ------------------------------------------------------------
+# SEARCH
+# ------------------------------------------------------------
+def _save_history(output_dir, trials, meta):
+    with open(output_dir / "trials.json", "w") as f:
+        json.dump({**meta, "trials": trials}, f, indent=2)
+
+
+def run_tuning(X_train, y_train, max_trials=None, time_budget=None, workers=None,
+               min_trees=50, max_trees=600, eta=3, random_state=42, output_dir=TUNING_DIR):
+    """
+    Search the XGBoost space with successive halving and persist the winner.
+
+    The budget is the number of sampled configurations (max_trials) and/or the
+    wall-clock seconds of search (time_budget, excluding the one-off resampling).
+    When the time budget runs out, in-flight trials finish and queued ones are
+    cancelled; the first rung of the first bracket always completes.
+    """
+    if max_trials is None and time_budget is None:
+        max_trials = 27
+    workers = workers or os.cpu_count() or 1
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    rng = np.random.default_rng(random_state)
+    rungs = rung_schedule(min_trees, max_trees, eta)
+    started = time.monotonic()
+    data = prepare_tuning_data(X_train, y_train, random_state=random_state)
+    deadline = time.monotonic() + time_budget if time_budget else None
+
+    def out_of_time():
+        return deadline is not None and time.monotonic() >= deadline
+    trials = []
+    meta = {
+        "max_trials": max_trials,
+        "time_budget_seconds": time_budget,
+        "workers": workers,
+        "rungs": rungs,
+        "eta": eta,
+        "n_fit_rows": int(len(data[1])),
+        "n_val_rows": int(len(data[3])),
+    }
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=data) as pool:
+        bracket = 0
+        while not (trials and out_of_time()) and (max_trials is None or len(trials) < max_trials):
+            n_configs = eta ** (len(rungs) - 1)
+            if max_trials is not None:
+                n_configs = min(n_configs, max_trials - len(trials))
+
+            # Each alive entry: (trial record, number of trees so far, serialized booster)
+            alive = []
+            for _ in range(n_configs):
+                record = {
+                    "trial": len(trials),
+                    "bracket": bracket,
+                    "params": sample_params(rng),
+                    "rungs": [],
+                    "status": "running",
+                }
+                trials.append(record)
+                alive.append((record, 0, None))
+
+            for rung_idx, n_trees in enumerate(rungs):
+                # The very first rung always runs so that a tiny budget still yields a result
+                if out_of_time() and (bracket or rung_idx):
+                    break
+                futures = {
+                    pool.submit(_train_rung, rec["trial"], rec["params"], n_trees, prev, model): rec
+                    for rec, prev, model in alive
+                }
+                results = []
+                for future in as_completed(futures):
+                    if future.cancelled():
+                        continue
+                    rec = futures[future]
+                    res = future.result()
+                    model = res.pop("model")
+                    rec["rungs"].append(res)
+                    results.append((rec, n_trees, model))
+                    if out_of_time() and (bracket or rung_idx):
+                        for pending in futures:
+                            pending.cancel()
+                if not results:
+                    break
+
+                results.sort(key=lambda item: item[0]["rungs"][-1]["auc"], reverse=True)
+                is_last = rung_idx == len(rungs) - 1
+                keep = len(results) if is_last else max(1, len(results) // eta)
+                for rec, _, _ in results[keep:]:
+                    rec["status"] = "pruned"
+                alive = results[:keep]
+
+                best_auc = results[0][0]["rungs"][-1]["auc"]
+                print(f"  bracket {bracket} · {n_trees:>4} trees · {len(results)} trials · best AUC {best_auc:.4f}")
+                _save_history(output_dir, trials, {**meta, "elapsed_seconds": time.monotonic() - started})
+
+            for rec, _, _ in alive:
+                rec["status"] = "completed" if rec["rungs"][-1]["n_estimators"] == rungs[-1] else "stopped"
+            bracket += 1
+
+    for rec in trials:
+        if rec["status"] == "running":
+            rec["status"] = "stopped"
+
+    scored = [t for t in trials if t["rungs"]]
+    if not scored:
+        raise RuntimeError("❌ El presupuesto de tuning no permitió completar ningún trial")
+
+    # Prefer trials that reached the full tree budget; fall back to the deepest rung reached
+    top_rung = max(t["rungs"][-1]["n_estimators"] for t in scored)
+    best = max(
+        (t for t in scored if t["rungs"][-1]["n_estimators"] == top_rung),
+        key=lambda t: t["rungs"][-1]["auc"]
+    )
+    best_params = {
+        **DEFAULT_PARAMS,
+        **best["params"],
+        "n_estimators": best["rungs"][-1]["n_estimators"],
+    }
+
+    meta.update(
+        elapsed_seconds=time.monotonic() - started,
+        n_trials=len(trials),
+        best_trial=best["trial"],
+        best_auc=best["rungs"][-1]["auc"],
+    )
+    _save_history(output_dir, trials, meta)
+    with open(output_dir / "best_params.json", "w") as f:
+        json.dump(best_params, f, indent=2)
+
+    print(f"✅ Mejor trial #{best['trial']} · AUC {meta['best_auc']:.4f} · {best_params['n_estimators']} trees")
+    print(f"✅ Saved: {output_dir / 'best_params.json'}")
+    print(f"✅ Saved: {output_dir / 'trials.json'}")
+    return best_params
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel XGBoost hyperparameter search")
+    parser.add_argument("--data", default="dataset.csv")
+    parser.add_argument("--trials", type=int, default=None, help="Max configurations to sample")
+    parser.add_argument("--time-budget", type=float, default=None, help="Wall-clock budget in seconds")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--min-trees", type=int, default=50)
+    parser.add_argument("--max-trees", type=int, default=600)
+    parser.add_argument("--eta", type=int, default=3)
+    parser.add_argument("--output-dir", default=str(TUNING_DIR))
+    args = parser.parse_args()
+
+    from features import load_dataset, check_required_columns, engineer_features, build_xy
+    from feature_selection import load_selected_features
+
+    df = load_dataset(args.data)
+    check_required_columns(df)
+    X, y = build_xy(engineer_features(df), load_selected_features())
+    X_train, _, y_train, _ = train_test_split(
+        X, y, test_size=0.2, random_state=42, stratify=y
+    )
+    run_tuning(
+        X_train, y_train,
+        max_trials=args.trials,
+        time_budget=args.time_budget,
+        workers=args.workers,
+        min_trees=args.min_trees,
+        max_trees=args.max_trees,
+        eta=args.eta,
+        output_dir=args.output_dir,
+    )
+
+
+if __name__ == "__main__":
+    main()
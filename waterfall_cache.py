@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Schneider Electric Datathon - Waterfall Rendering Cache
+SHAP waterfall charts for the dashboard. Static charts are rendered once with
+matplotlib to PNG bytes and kept in an LRU cache bounded both by entry count
+and by total bytes, so re-opening a case skips matplotlib entirely. A plotly
+waterfall is offered as the lightweight interactive alternative.
+"""
+
+import io
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+WATERFALL_COLORS = {"increasing": "#ff0052", "decreasing": "#008bfb"}
+
+
+class WaterfallCache:
+    """Thread-safe LRU cache of rendered charts with an entry and byte cap"""
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        size = len(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._items:
+                self._bytes -= len(self._items.pop(key))
+            self._items[key] = value
+            self._bytes += size
+            while len(self._items) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def get_or_render(self, key, render):
+        """Cached bytes for key, calling render() only on a miss"""
+        value = self.get(key)
+        if value is None:
+            value = render()
+            self.put(key, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._items),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+def waterfall_key(case_id, feature_names, shap_row=None, data=None, version=None):
+    """
+    Cache key for a waterfall. Stored cases are identified by (model version,
+    case_id, feature-name set); simulated rows also hash their SHAP and
+    feature values.
+    """
+    key = (str(version), str(case_id), tuple(feature_names))
+    if shap_row is not None:
+        digest = hashlib.sha1(np.ascontiguousarray(shap_row, dtype=np.float64).tobytes())
+        if data is not None:
+            digest.update(np.ascontiguousarray(data, dtype=np.float64).tobytes())
+        key += (digest.hexdigest(),)
+    return key
+
+
+def render_waterfall_png(shap_row, base_value, data, display_names, max_display=10, dpi=100):
+    """Render the classic shap waterfall to PNG bytes (matplotlib, Agg)"""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import shap
+
+    plt.subplots(figsize=(10, 6))
+    shap.plots.waterfall(
+        shap.Explanation(
+            values=np.asarray(shap_row),
+            base_values=base_value,
+            data=np.asarray(data),
+            feature_names=list(display_names)
+        ),
+        max_display=max_display,
+        show=False
+    )
+    fig = plt.gcf()
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=dpi, bbox_inches="tight")
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+def waterfall_figure(shap_row, base_value, data, display_names, max_display=10):
+    """Interactive plotly waterfall with the same ordering as shap.plots.waterfall"""
+    import plotly.graph_objects as go
+
+    shap_row = np.asarray(shap_row, dtype=float)
+    data = np.asarray(data, dtype=float)
+    order = np.argsort(-np.abs(shap_row))
+    shown = order[:max_display - 1] if len(order) > max_display else order
+    rest = order[len(shown):]
+
+    labels = [f"{display_names[i]} = {data[i]:.3g}" for i in shown]
+    values = [float(shap_row[i]) for i in shown]
+    if len(rest):
+        labels.append(f"{len(rest)} other features")
+        values.append(float(shap_row[rest].sum()))
+
+    # Smallest contribution at the bottom, largest at the top (as in shap)
+    labels, values = labels[::-1], values[::-1]
+    final_value = base_value + float(shap_row.sum())
+    fig = go.Figure(go.Waterfall(
+        orientation="h",
+        base=float(base_value),
+        y=labels,
+        x=values,
+        measure=["relative"] * len(values),
+        text=[f"{v:+.2f}" for v in values],
+        textposition="outside",
+        increasing=dict(marker=dict(color=WATERFALL_COLORS["increasing"])),
+        decreasing=dict(marker=dict(color=WATERFALL_COLORS["decreasing"])),
+        connector=dict(line=dict(color="#bbbbbb", width=1)),
+        hovertemplate="%{y}<br>Contribution: %{x:+.3f}<extra></extra>"
+    ))
+    fig.add_vline(x=base_value, line_dash="dot", line_color="#888888",
+                  annotation_text=f"E[f(X)] = {base_value:.2f}", annotation_position="bottom")
+    fig.add_vline(x=final_value, line_dash="dot", line_color="#333333",
+                  annotation_text=f"f(x) = {final_value:.2f}", annotation_position="top")
+    fig.update_layout(
+        height=max(360, 38 * len(values)),
+        xaxis_title="Model output (log-odds)",
+        margin=dict(l=10, r=10, t=30, b=10),
+        showlegend=False
+    )
+    return fig